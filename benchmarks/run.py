@@ -0,0 +1,202 @@
+"""Time the main routes against a synthetic account.
+
+    python -m benchmarks.run --families 50 --stages 3 --days 730 --save baseline.json
+    python -m benchmarks.run --families 50 --stages 3 --days 730 --compare baseline.json
+
+Uses the database in DB_NAME (default habit_tracker_bench), migrated with
+`flask db upgrade` first. The seeded user is deleted afterwards."""
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+import click
+from habit_tracker import create_app
+from habit_tracker.db import close_pool
+from habit_tracker.instrumentation import current_stats
+from habit_tracker.migrate import upgrade
+
+from benchmarks.seed import delete_account, seed_account
+
+
+# query count of the last request, read from the app's SQL instrumentation
+_last_request = {'queries': 0}
+
+
+def _record_queries(response):
+    stats = current_stats()
+    _last_request['queries'] = stats.count if stats else 0
+    return response
+
+
+def benchmark_routes(account):
+    """(name, method, path, form data) for every benchmarked request. Writes
+    are paired with the request that undoes them so every iteration starts
+    from the same data."""
+    today = datetime.now(timezone.utc).date().isoformat()
+    complete_id = account['complete_habit_id']
+    skip_id = account['skip_habit_id']
+    challenge_id = account['challenge_id']
+    return [
+        ('habits.tiers', 'GET', '/habits/tiers', None),
+        ('index', 'GET', '/', None),
+        ('view', 'GET', f'/{complete_id}', None),
+        ('visuals.track', 'GET', '/visuals/track', None),
+        ('challenges.challenge_stats', 'GET', f'/challenges/challenge/{challenge_id}/stats', None),
+        ('challenges.challenge_stats_json', 'GET', f'/challenges/{challenge_id}/stats', None),
+        ('complete', 'POST', f'/{complete_id}/complete', {'date': today}),
+        ('undo_complete', 'POST', f'/{complete_id}/undo_complete', {'date': today}),
+        ('skip', 'POST', f'/habits/{skip_id}/skip', {'date': today, 'reason': 'bench'}),
+        ('undo_skip', 'POST', f'/{skip_id}/undo_skip', {'date': today}),
+    ]
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+def run_benchmark(app, iterations=50, warmup=5, **sizes):
+    """Seed an account, time every route `iterations` times after `warmup`
+    untimed rounds, and return the report as a dict."""
+    app.after_request(_record_queries)
+    client = app.test_client()
+    account = seed_account(client, app, **sizes)
+    headers = {'Authorization': f"Bearer {account['token']}"}
+    routes = benchmark_routes(account)
+
+    timings = {name: [] for name, _, _, _ in routes}
+    queries = {name: [] for name, _, _, _ in routes}
+    statuses = {name: set() for name, _, _, _ in routes}
+    try:
+        for i in range(warmup + iterations):
+            for name, method, path, data in routes:
+                _last_request['queries'] = 0
+                start = time.perf_counter()
+                try:
+                    status = client.open(path, method=method, data=data, headers=headers).status_code
+                except Exception as e:
+                    # TESTING apps re-raise view errors; count them as 500s
+                    status = f'500 {type(e).__name__}'
+                elapsed = time.perf_counter() - start
+                if i < warmup:
+                    continue
+                timings[name].append(elapsed * 1000)
+                queries[name].append(_last_request['queries'])
+                statuses[name].add(str(status))
+    finally:
+        delete_account(app, account['user_id'])
+
+    return {
+        'meta': {
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'commit': _git_commit(),
+            'python': platform.python_version(),
+            'iterations': iterations,
+            'sizes': dict(sizes, habits=account['habit_count']),
+        },
+        'routes': {
+            name: {
+                'p50_ms': round(percentile(timings[name], 50), 3),
+                'p95_ms': round(percentile(timings[name], 95), 3),
+                'mean_ms': round(sum(timings[name]) / len(timings[name]), 3),
+                'queries': percentile(queries[name], 50),
+                'status': sorted(statuses[name]),
+            }
+            for name in timings
+        },
+    }
+
+
+def compare(report, baseline, tolerance=0.2):
+    """Return a list of regressions: routes whose p95 grew by more than
+    `tolerance` (a fraction) or that run more queries than in baseline."""
+    regressions = []
+    for name, result in report['routes'].items():
+        old = baseline['routes'].get(name)
+        if old is None:
+            continue
+        if result['p95_ms'] > old['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {old['p95_ms']:.1f}ms -> {result['p95_ms']:.1f}ms")
+        if result['queries'] > old['queries']:
+            regressions.append(f"{name}: queries {old['queries']} -> {result['queries']}")
+    return regressions
+
+
+def format_report(report, baseline=None):
+    lines = [f"{'route':<34}{'p50 ms':>10}{'p95 ms':>10}{'queries':>9}  status"]
+    for name, result in report['routes'].items():
+        line = (
+            f"{name:<34}{result['p50_ms']:>10.2f}{result['p95_ms']:>10.2f}"
+            f"{result['queries']:>9}  {', '.join(result['status'])}"
+        )
+        old = baseline['routes'].get(name) if baseline else None
+        if old:
+            change = (result['p95_ms'] - old['p95_ms']) / old['p95_ms'] * 100 if old['p95_ms'] else 0
+            line += f"  (p95 {change:+.0f}%, queries {result['queries'] - old['queries']:+d})"
+        lines.append(line)
+    return '\n'.join(lines)
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+@click.command()
+@click.option('--families', default=20, show_default=True, help='Habit families in the account.')
+@click.option('--stages', default=3, show_default=True, help='Habits (stages) per family.')
+@click.option('--days', default=365, show_default=True, help='Days of log history.')
+@click.option('--skip-ratio', default=0.1, show_default=True, help='Share of logged days that are skips.')
+@click.option('--fill', default=0.8, show_default=True, help='Share of days with a log.')
+@click.option('--iterations', default=50, show_default=True)
+@click.option('--warmup', default=5, show_default=True)
+@click.option('--save', 'save_path', type=click.Path(dir_okay=False), help='Write the report as JSON.')
+@click.option('--compare', 'baseline_path', type=click.Path(exists=True, dir_okay=False),
+              help='Compare against a saved report; exits 1 on regressions.')
+@click.option('--tolerance', default=0.2, show_default=True, help='Allowed p95 growth before failing.')
+def main(families, stages, days, skip_ratio, fill, iterations, warmup, save_path, baseline_path, tolerance):
+    app = create_app({'DB_NAME': os.environ.get('DB_NAME', 'habit_tracker_bench')})
+    with app.app_context():
+        upgrade()
+
+    try:
+        report = run_benchmark(
+            app, iterations=iterations, warmup=warmup, families=families,
+            stages=stages, days=days, skip_ratio=skip_ratio, fill=fill,
+        )
+    finally:
+        close_pool(app)
+
+    baseline = None
+    if baseline_path:
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+
+    click.echo(format_report(report, baseline))
+
+    if save_path:
+        with open(save_path, 'w') as f:
+            json.dump(report, f, indent=2)
+        click.echo(f'Saved {save_path}')
+
+    if baseline:
+        regressions = compare(report, baseline, tolerance)
+        for regression in regressions:
+            click.echo(f'REGRESSION {regression}', err=True)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
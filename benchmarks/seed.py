@@ -0,0 +1,100 @@
+import uuid
+
+from habit_tracker.cascades import refresh_cascade_closure
+from habit_tracker.db import get_db
+from habit_tracker.rollups import GRAINS, REBUILD_ROLLUPS_SQL
+from habit_tracker.runs import rebuild_habit_runs
+from habit_tracker.streaks import refresh_streaks
+
+
+def seed_account(client, app, families=20, stages=3, days=365, skip_ratio=0.1,
+                 fill=0.8, seed=0.42):
+    """Register a throwaway user and fill their account with synthetic data:
+    families x stages habits, one challenge holding every other family, and
+    up to `days` days of logs per habit (a `fill` share of days logged, a
+    `skip_ratio` share of those skipped). Returns a dict with the token and
+    ids the benchmark needs."""
+    username = f'bench_{uuid.uuid4().hex[:12]}'
+    res = client.post('/auth/register', json={"username": username, "password": "bench"})
+    token = res.get_json()['token']
+
+    with app.app_context():
+        db = get_db()
+        cur = db.cursor()
+        cur.execute('SELECT id FROM users WHERE username = %s', (username,))
+        user_id = cur.fetchone()['id']
+
+        cur.execute(
+            "INSERT INTO challenges (creator_id, title, body, created_at)"
+            " VALUES (%s, 'Benchmark', 'synthetic', NOW() - make_interval(days => %s))"
+            " RETURNING id",
+            (user_id, days)
+        )
+        challenge_id = cur.fetchone()['id']
+
+        cur.execute(
+            'WITH fam AS ('
+            '   SELECT f, nextval(\'habit_family_seq\') AS family_id'
+            '   FROM generate_series(1, %(families)s) f'
+            ')'
+            ' INSERT INTO habits'
+            '   (creator_id, name, stage, family_id, tier, display_order, challenge_id, created_at)'
+            " SELECT %(user_id)s, 'Habit ' || f || '.' || s, s, family_id, 1 + f %% 3, f,"
+            '   CASE WHEN f %% 2 = 0 THEN %(challenge_id)s END,'
+            '   NOW() - make_interval(days => %(days)s)'
+            ' FROM fam, generate_series(1, %(stages)s) s',
+            {'user_id': user_id, 'families': families, 'stages': stages,
+             'challenge_id': challenge_id, 'days': days}
+        )
+
+        cur.execute('SELECT setseed(%s)', (seed,))
+        cur.execute(
+            'WITH days AS ('
+            '   SELECT h.id AS habit_id, d::date AS log_date, random() AS logged, random() AS skipped'
+            '   FROM habits h,'
+            "       generate_series(CURRENT_DATE - %(days)s, CURRENT_DATE - 1, interval '1 day') d"
+            '   WHERE h.creator_id = %(user_id)s'
+            ')'
+            ' INSERT INTO habit_logs (log_date, habit_id, status, reason)'
+            " SELECT log_date, habit_id,"
+            "   CASE WHEN skipped < %(skip_ratio)s THEN 'skipped' ELSE 'completed' END,"
+            "   CASE WHEN skipped < %(skip_ratio)s THEN 'too tired' END"
+            ' FROM days'
+            ' WHERE logged < %(fill)s',
+            {'user_id': user_id, 'days': days, 'skip_ratio': skip_ratio, 'fill': fill}
+        )
+
+        cur.execute(
+            'SELECT id, family_id, stage FROM habits WHERE creator_id = %s ORDER BY family_id, stage',
+            (user_id,)
+        )
+        habits = cur.fetchall()
+        habit_ids = [h['id'] for h in habits]
+
+        rebuild_habit_runs(cur, habit_ids)
+        refresh_streaks(cur, habit_ids)
+        refresh_cascade_closure(cur, user_id)
+        cur.execute(REBUILD_ROLLUPS_SQL, {'habit_ids': habit_ids, 'grains': list(GRAINS)})
+        db.commit()
+        cur.close()
+
+    first_family = [h for h in habits if h['family_id'] == habits[0]['family_id']]
+    return {
+        'user_id': user_id,
+        'token': token,
+        'challenge_id': challenge_id,
+        # completes/undos go on a family's first stage, skips on its last,
+        # so each undo clears exactly what the write before it added
+        'complete_habit_id': first_family[0]['id'],
+        'skip_habit_id': first_family[-1]['id'],
+        'habit_count': len(habits),
+    }
+
+
+def delete_account(app, user_id):
+    with app.app_context():
+        db = get_db()
+        cur = db.cursor()
+        cur.execute('DELETE FROM users WHERE id = %s', (user_id,))
+        db.commit()
+        cur.close()
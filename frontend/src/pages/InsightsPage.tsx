@@ -15,6 +15,7 @@ interface CachedInsights {
 
 const CACHE_KEY = "insights_cache";
 const CACHE_DURATION_MS = 7 * 24 * 60 * 60 * 1000; // 7 days
+const POLL_INTERVAL_MS = 1500;
 
 function InsightsPage() {
   const [insights, setInsights] = useState<string>("");
@@ -62,21 +63,44 @@ function InsightsPage() {
     setError("");
 
     const token = localStorage.getItem("token");
+    const headers = {
+      Authorization: `Bearer ${token}`,
+      "Content-Type": "application/json",
+    };
 
     try {
-      const res = await fetch(`${import.meta.env.VITE_API_URL}/insights/`, {
-        method: "GET",
-        headers: {
-          Authorization: `Bearer ${token}`,
-          "Content-Type": "application/json",
-        },
-      });
-
-      if (!res.ok) {
-        throw new Error("Failed to fetch insights");
+      // Refresh asks for new insights even if the data hasn't changed;
+      // a plain load reuses the latest ones
+      if (forceRefresh) {
+        const res = await fetch(`${import.meta.env.VITE_API_URL}/insights/?refresh=1`, {
+          method: "POST",
+          headers,
+        });
+        if (!res.ok) {
+          throw new Error("Failed to start insights");
+        }
+      }
+
+      // Poll until the background job is done
+      let data;
+      while (true) {
+        const res = await fetch(`${import.meta.env.VITE_API_URL}/insights/`, {
+          method: "GET",
+          headers,
+        });
+
+        if (!res.ok) {
+          throw new Error("Failed to fetch insights");
+        }
+
+        data = await res.json();
+        if (data.status === "done") break;
+        if (data.status === "failed") {
+          throw new Error(data.error || "Insights job failed");
+        }
+        await new Promise((resolve) => setTimeout(resolve, POLL_INTERVAL_MS));
       }
 
-      const data = await res.json();
       setInsights(data.insights);
       setHabitStats(data.habit_stats);
 
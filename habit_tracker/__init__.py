@@ -21,6 +21,48 @@ def create_app(test_config=None):
         DB_HOST=os.environ.get('DB_HOST', 'localhost'),                                                                                   
         DB_PORT=os.environ.get('DB_PORT', '5432'),                                                
         DB_PASSWORD=os.environ.get('DB_PASSWORD'),                                                            
+        # connection pool, one per worker process
+        DB_POOL_MIN_SIZE=int(os.environ.get('DB_POOL_MIN_SIZE', 1)),
+        DB_POOL_MAX_SIZE=int(os.environ.get('DB_POOL_MAX_SIZE', 10)),
+        DB_POOL_TIMEOUT=float(os.environ.get('DB_POOL_TIMEOUT', 5)),  # seconds to wait for a free connection
+        DB_POOL_CHECK_IDLE=float(os.environ.get('DB_POOL_CHECK_IDLE', 30)),  # ping connections idle this long
+        # per-request SQL timing: Server-Timing header, and a warning log for
+        # requests over either threshold (0 turns a threshold off)
+        SQL_INSTRUMENTATION=os.environ.get('SQL_INSTRUMENTATION', '1') == '1',
+        SERVER_TIMING=os.environ.get('SERVER_TIMING', '1') == '1',
+        SLOW_REQUEST_QUERIES=int(os.environ.get('SLOW_REQUEST_QUERIES', 50)),
+        SLOW_REQUEST_DB_MS=float(os.environ.get('SLOW_REQUEST_DB_MS', 500)),
+        # slow statements get an EXPLAIN plan appended to SLOW_QUERY_LOG
+        # (default instance/slow_queries.jsonl); see `flask slow-queries`
+        SLOW_QUERY_MS=float(os.environ.get('SLOW_QUERY_MS', 200)),  # 0 turns capture off
+        SLOW_QUERY_SAMPLE_RATE=float(os.environ.get('SLOW_QUERY_SAMPLE_RATE', 1)),
+        SLOW_QUERY_MAX_PER_MINUTE=int(os.environ.get('SLOW_QUERY_MAX_PER_MINUTE', 10)),  # per worker
+        SLOW_QUERY_LOG=os.environ.get('SLOW_QUERY_LOG'),
+        # EXPLAIN (ANALYZE, BUFFERS) for slow reads: runs them a second time
+        # inside the request
+        SLOW_QUERY_ANALYZE=os.environ.get('SLOW_QUERY_ANALYZE', '0') == '1',
+        # /metrics; with METRICS_DIR set, gunicorn workers share their metrics
+        # through files there (empty it on every server start)
+        METRICS_DIR=os.environ.get('METRICS_DIR'),
+        METRICS_FLUSH_INTERVAL=float(os.environ.get('METRICS_FLUSH_INTERVAL', 5)),  # seconds
+        # ETags on read endpoints from users.data_version (304 on If-None-Match)
+        ETAGS=os.environ.get('ETAGS', '1') == '1',
+        # per-worker cache of logged in users
+        USER_CACHE_SIZE=int(os.environ.get('USER_CACHE_SIZE', 1024)),
+        USER_CACHE_TTL=float(os.environ.get('USER_CACHE_TTL', 30)),  # seconds
+        # read cascade ancestors from the habit_cascades closure table instead
+        # of walking cascades_to at request time
+        CASCADE_CLOSURE=os.environ.get('CASCADE_CLOSURE', '0') == '1',
+        # AI insights; OPENAI_BASE_URL can point at any compatible server
+        OPENAI_API_KEY=os.environ.get('OPENAI_API_KEY'),
+        OPENAI_BASE_URL=os.environ.get('OPENAI_BASE_URL'),
+        INSIGHTS_MODEL=os.environ.get('INSIGHTS_MODEL', 'gpt-4o-mini'),
+        INSIGHTS_TIMEOUT=float(os.environ.get('INSIGHTS_TIMEOUT', 30)),  # seconds per model call
+        INSIGHTS_WORKERS=int(os.environ.get('INSIGHTS_WORKERS', 2)),  # background threads per worker
+        INSIGHTS_QUEUE_SIZE=int(os.environ.get('INSIGHTS_QUEUE_SIZE', 8)),
+        INSIGHTS_CACHE_SIZE=int(os.environ.get('INSIGHTS_CACHE_SIZE', 256)),
+        INSIGHTS_CACHE_TTL=float(os.environ.get('INSIGHTS_CACHE_TTL', 24 * 60 * 60)),  # seconds
+        INSIGHTS_REASON_TOKENS=int(os.environ.get('INSIGHTS_REASON_TOKENS', 400)),  # skip reasons in the prompt
     )                                                                                                         
 
     if test_config is None:
@@ -47,6 +89,33 @@ def create_app(test_config=None):
     from . import db
     db.init_app(app)        
 
+    from . import migrate
+    migrate.init_app(app)
+
+    from . import instrumentation
+    instrumentation.init_app(app)
+
+    from . import metrics
+    metrics.init_app(app)
+
+    from . import slow_queries
+    slow_queries.init_app(app)
+
+    from . import versioning
+    versioning.init_app(app)
+
+    from . import runs
+    runs.init_app(app)
+
+    from . import streaks
+    streaks.init_app(app)
+
+    from . import cascades
+    cascades.init_app(app)
+
+    from . import rollups
+    rollups.init_app(app)
+
     from . import auth
     app.register_blueprint(auth.bp)
 
@@ -66,6 +135,16 @@ def create_app(test_config=None):
     from . import insights
     app.register_blueprint(insights.bp)
 
+    from . import export
+    app.register_blueprint(export.bp)
+
+    from . import importer
+    app.register_blueprint(importer.bp)
+    importer.init_app(app)
+
+    from . import analytics
+    app.register_blueprint(analytics.bp)
+
 
     return app
 
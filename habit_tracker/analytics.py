@@ -0,0 +1,141 @@
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+from flask import Blueprint, g, jsonify, request
+
+from habit_tracker.auth import login_required
+from habit_tracker.db import get_db
+from habit_tracker.rollups import GRAINS
+from habit_tracker.versioning import conditional
+
+bp = Blueprint('analytics', __name__, url_prefix='/analytics')
+
+# habits column that selects a scope's habits
+SCOPES = {
+    'habits': 'id',
+    'families': 'family_id',
+    'challenges': 'challenge_id',
+}
+
+# range shown when ?start= is left out
+DEFAULT_SPAN = {
+    'day': timedelta(days=29),
+    'week': timedelta(weeks=11),
+    'month': timedelta(days=365),
+}
+
+# longest series one request may ask for, and roughly how many days each
+# grain's periods span when checking against it
+MAX_POINTS = 1000
+GRAIN_DAYS = {'day': 1, 'week': 7, 'month': 30}
+
+# One row per period between start and end, summed over the scope's habits
+# from habit_rollups; periods without logs come back as zeros.
+SERIES_SQL = '''
+    WITH periods AS (
+        SELECT p::date AS period_start
+        FROM generate_series(
+            date_trunc(%(grain)s, %(start)s::date),
+            %(end)s::date,
+            ('1 ' || %(grain)s)::interval
+        ) AS p
+    ),
+    scoped AS (
+        SELECT id FROM habits
+        WHERE creator_id = %(user_id)s AND {column} = %(id)s
+    )
+    SELECT p.period_start,
+           COALESCE(SUM(r.completed), 0)::int AS completed,
+           COALESCE(SUM(r.skipped), 0)::int AS skipped
+    FROM periods p
+    LEFT JOIN habit_rollups r
+        ON r.period_start = p.period_start
+       AND r.grain = %(grain)s
+       AND r.habit_id IN (SELECT id FROM scoped)
+    GROUP BY p.period_start
+    ORDER BY p.period_start
+'''
+
+
+def _parse_date(value):
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+
+def scope_exists(cur, scope, id):
+    if scope == 'challenges':
+        cur.execute(
+            'SELECT 1 FROM challenges WHERE id = %s AND creator_id = %s',
+            (id, g.user['id'])
+        )
+    else:
+        cur.execute(
+            f'SELECT 1 FROM habits WHERE {SCOPES[scope]} = %s AND creator_id = %s LIMIT 1',
+            (id, g.user['id'])
+        )
+    return cur.fetchone() is not None
+
+
+def get_series(cur, scope, id, grain, start, end):
+    """Completed/skipped counts per period for one habit, family or
+    challenge, read from habit_rollups."""
+    cur.execute(SERIES_SQL.format(column=SCOPES[scope]), {
+        'user_id': g.user['id'],
+        'id': id,
+        'grain': grain,
+        'start': start,
+        'end': end,
+    })
+    return [
+        {
+            "period_start": row['period_start'].isoformat(),
+            "completed": row['completed'],
+            "skipped": row['skipped'],
+        }
+        for row in cur.fetchall()
+    ]
+
+
+@bp.route('/<scope>/<int:id>')
+@login_required
+@conditional
+def series(scope, id):
+    """Time series for a habit, family or challenge.
+    ?grain=day|week|month (default day), ?start= and ?end= as YYYY-MM-DD
+    (default: a recent window ending today)."""
+    if scope not in SCOPES:
+        return jsonify({"error": "scope must be habits, families or challenges"}), 404
+
+    grain = request.args.get('grain', 'day')
+    if grain not in GRAINS:
+        return jsonify({"error": "grain must be day, week or month"}), 400
+
+    try:
+        end = _parse_date(request.args['end']) if 'end' in request.args \
+            else datetime.now(ZoneInfo(g.user['timezone'])).date()
+        start = _parse_date(request.args['start']) if 'start' in request.args \
+            else end - DEFAULT_SPAN[grain]
+    except ValueError:
+        return jsonify({"error": "dates must be YYYY-MM-DD"}), 400
+
+    if start > end:
+        return jsonify({"error": "start must not be after end"}), 400
+    if (end - start).days // GRAIN_DAYS[grain] >= MAX_POINTS:
+        return jsonify({"error": f"at most {MAX_POINTS} periods per request"}), 400
+
+    db = get_db()
+    cur = db.cursor()
+    if not scope_exists(cur, scope, id):
+        cur.close()
+        return jsonify({"error": "not found"}), 404
+
+    points = get_series(cur, scope, id, grain, start, end)
+    cur.close()
+
+    return jsonify({
+        "scope": scope,
+        "id": id,
+        "grain": grain,
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "series": points,
+    }), 200
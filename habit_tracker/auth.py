@@ -9,10 +9,31 @@ from psycopg2 import errors
 
 from werkzeug.security import check_password_hash, generate_password_hash
 
+from habit_tracker.cache import TTLCache
 from habit_tracker.db import get_db
 
 bp = Blueprint('auth', __name__, url_prefix='/auth')
 
+
+def get_user_cache():
+    cache = current_app.extensions.get('user_cache')
+    if cache is None:
+        cache = TTLCache(
+            maxsize=current_app.config['USER_CACHE_SIZE'],
+            ttl=current_app.config['USER_CACHE_TTL'],
+        )
+        current_app.extensions['user_cache'] = cache
+    return cache
+
+
+def invalidate_user(user_id):
+    """Drop a cached user after writing to their row in users."""
+    get_user_cache().invalidate(user_id)
+
+
+def user_cache_stats():
+    return get_user_cache().stats()
+
 @bp.route('/register', methods=['POST'])
 def register():
     # Make sure data is available
@@ -107,7 +128,6 @@ def load_logged_in_user():
     bearer, encoded_token = auth_header.split()
     secret_key = current_app.config['SECRET_KEY'] 
 
-    print(auth_header)
     # decode token
     token = jwt.decode(encoded_token, secret_key, algorithms=["HS256"])
 
@@ -118,17 +138,24 @@ def load_logged_in_user():
         g.user = None
         return
 
-    # fetch user from db
-    db = get_db()
-    cur = db.cursor()
-    cur.execute(
-        'SELECT * FROM users WHERE id = %s', (user_id,)
-    )
-    user = cur.fetchone()
-    cur.close()
-
-    # store user data in global var
-    g.user = user
+    # fetch user from cache, or db on a miss
+    cache = get_user_cache()
+    user = cache.get(user_id)
+    if user is None:
+        db = get_db()
+        cur = db.cursor()
+        cur.execute(
+            'SELECT id, username, timezone, tier_order, list_view'
+            ' FROM users WHERE id = %s', (user_id,)
+        )
+        user = cur.fetchone()
+        cur.close()
+
+        if user is not None:
+            cache.set(user_id, dict(user))
+
+    # store user data in global var (a copy, so the cached entry stays intact)
+    g.user = dict(user) if user is not None else None
 
 
 @bp.route('/logout')
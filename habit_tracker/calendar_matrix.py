@@ -0,0 +1,148 @@
+from datetime import timedelta
+
+import numpy as np
+
+# cell values of Calendar.status
+NONE = 0
+COMPLETED = 1
+SKIPPED = 2
+
+STATUS_CODES = {'completed': COMPLETED, 'skipped': SKIPPED}
+
+
+class Calendar:
+    """Logs of some habits between start and end (inclusive) as a
+    habits x days matrix of NONE / COMPLETED / SKIPPED.
+
+    Rows follow habit_ids, columns are consecutive days. Built with one query
+    by load(); everything else is array arithmetic on the matrix."""
+
+    def __init__(self, habit_ids, start, end, status, created=None, today=None):
+        self.habit_ids = list(habit_ids)
+        self.rows = {habit_id: row for row, habit_id in enumerate(self.habit_ids)}
+        self.start = start
+        self.end = end
+        self.status = status
+        self.dates = np.arange(
+            np.datetime64(start, 'D'), np.datetime64(end, 'D') + np.timedelta64(1, 'D'),
+            dtype='datetime64[D]'
+        )
+        # per habit creation date; days before it aren't counted
+        if created is None:
+            self.created = np.full(len(self.habit_ids), np.datetime64(start, 'D'))
+        else:
+            self.created = np.array([created[h] for h in self.habit_ids], dtype='datetime64[D]')
+        self.today = np.datetime64(today if today is not None else end, 'D')
+
+    @classmethod
+    def load(cls, cur, habit_ids, start, end, created=None, today=None):
+        """Read the logs of habit_ids between start and end. created maps
+        habit_id to the date the habit was created; today is the last day
+        that counts as valid (defaults to end)."""
+        habit_ids = list(dict.fromkeys(habit_ids))
+        days = (end - start).days + 1
+        status = np.zeros((len(habit_ids), max(days, 0)), dtype=np.int8)
+        calendar = cls(habit_ids, start, end, status, created, today)
+        if not habit_ids or days <= 0:
+            return calendar
+
+        cur.execute(
+            'SELECT habit_id, log_date, status FROM habit_logs'
+            ' WHERE habit_id = ANY(%s) AND log_date BETWEEN %s AND %s',
+            (habit_ids, start, end)
+        )
+        logs = cur.fetchall()
+        if logs:
+            rows = np.fromiter((calendar.rows[log['habit_id']] for log in logs), dtype=np.intp, count=len(logs))
+            cols = (
+                np.array([log['log_date'] for log in logs], dtype='datetime64[D]')
+                - np.datetime64(start, 'D')
+            ).astype(np.intp)
+            codes = np.fromiter((STATUS_CODES.get(log['status'], NONE) for log in logs), dtype=np.int8, count=len(logs))
+            status[rows, cols] = codes
+        return calendar
+
+    def window(self, start, end):
+        """The same habits restricted to start..end, which must lie inside
+        this calendar. Shares the underlying matrix."""
+        first = (start - self.start).days
+        last = (end - self.start).days
+        calendar = Calendar(self.habit_ids, start, end, self.status[:, first:last + 1])
+        calendar.created = self.created
+        calendar.today = self.today
+        return calendar
+
+    @property
+    def logged(self):
+        """True where the habit has any log that day."""
+        return self.status != NONE
+
+    @property
+    def completed(self):
+        return self.status == COMPLETED
+
+    @property
+    def in_future(self):
+        """Per day: after today."""
+        return self.dates > self.today
+
+    @property
+    def before_created(self):
+        """Per habit and day: before the habit was created."""
+        return self.dates[np.newaxis, :] < self.created[:, np.newaxis]
+
+    @property
+    def valid(self):
+        """Days that count towards progress: from creation up to today."""
+        return ~self.before_created & ~self.in_future[np.newaxis, :]
+
+    def day_grid(self):
+        """{habit_id: [{date, completed, in_future, before_habit}, ...]} for
+        every day in the calendar; "completed" means any log that day."""
+        dates = self.dates.astype(object)
+        logged = self.logged.tolist()
+        in_future = self.in_future.tolist()
+        before = self.before_created.tolist()
+        return {
+            habit_id: [
+                {
+                    'date': dates[i],
+                    'completed': logged[row][i],
+                    'in_future': in_future[i],
+                    'before_habit': before[row][i],
+                }
+                for i in range(len(dates))
+            ]
+            for row, habit_id in enumerate(self.habit_ids)
+        }
+
+    def weekly_progress(self):
+        """Per habit, one entry per Monday-Sunday week: completed (any log)
+        and valid days and the percentage done. The calendar must start on a
+        Monday and span whole weeks."""
+        weeks = len(self.dates) // 7
+        shape = (len(self.habit_ids), weeks, 7)
+        valid = self.valid.reshape(shape)
+        done = (self.logged & self.valid).reshape(shape)
+
+        valid_days = valid.sum(axis=2)
+        completed_days = done.sum(axis=2)
+        percentage = np.divide(
+            completed_days * 100.0, valid_days,
+            out=np.zeros(valid_days.shape), where=valid_days > 0
+        )
+
+        mondays = self.dates[::7].astype(object)
+        return {
+            habit_id: [
+                {
+                    'start': mondays[w],
+                    'end': mondays[w] + timedelta(days=6),
+                    'completed': int(completed_days[row, w]),
+                    'valid_days': int(valid_days[row, w]),
+                    'percentage': float(percentage[row, w]),
+                }
+                for w in range(weeks)
+            ]
+            for row, habit_id in enumerate(self.habit_ids)
+        }
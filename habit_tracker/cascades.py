@@ -0,0 +1,137 @@
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from habit_tracker.db import get_db
+
+
+# Every ancestor reachable from the habits in %(habit_ids)s by following
+# cascades_to. path holds the ids already on the chain, the same cycle guard
+# the old per-hop visited set gave.
+ANCESTORS_CTE = '''
+    WITH RECURSIVE ancestors(habit_id, ancestor_id, depth, path) AS (
+        SELECT id, cascades_to, 1, ARRAY[id, cascades_to]
+        FROM habits
+        WHERE id = ANY(%(habit_ids)s)
+          AND cascades_to IS NOT NULL
+        UNION ALL
+        SELECT a.habit_id, h.cascades_to, a.depth + 1, a.path || h.cascades_to
+        FROM ancestors a
+        JOIN habits h ON h.id = a.ancestor_id
+        WHERE h.cascades_to IS NOT NULL
+          AND NOT h.cascades_to = ANY(a.path)
+    )
+'''
+
+# Same rows, read from the precomputed habit_cascades closure
+CLOSURE_CTE = '''
+    WITH ancestors AS (
+        SELECT habit_id, ancestor_id, depth
+        FROM habit_cascades
+        WHERE habit_id = ANY(%(habit_ids)s)
+    )
+'''
+
+
+def _ancestors_cte():
+    if current_app.config['CASCADE_CLOSURE']:
+        return CLOSURE_CTE
+    return ANCESTORS_CTE
+
+
+def cascade_complete_many(cur, pairs):
+    """Insert a completion log for every ancestor of every (habit_id, log_date)
+    pair in one statement. Uses ON CONFLICT DO NOTHING so it's a no-op when
+    the ancestor is already logged (completed or skipped) for that date.
+    Returns the (habit_id, log_date) pairs that got a new log."""
+    if not pairs:
+        return []
+    habit_ids = [habit_id for habit_id, _ in pairs]
+    log_dates = [log_date for _, log_date in pairs]
+    cur.execute(
+        _ancestors_cte() + ''',
+        pairs AS (
+            SELECT * FROM unnest(%(pair_ids)s::int[], %(pair_dates)s::date[])
+                AS p(habit_id, log_date)
+        )
+        INSERT INTO habit_logs (log_date, habit_id)
+        SELECT DISTINCT p.log_date, a.ancestor_id
+        FROM pairs p
+        JOIN ancestors a ON a.habit_id = p.habit_id
+        ON CONFLICT (habit_id, log_date) DO NOTHING
+        RETURNING habit_id, log_date
+        ''',
+        {
+            'habit_ids': list(set(habit_ids)),
+            'pair_ids': habit_ids,
+            'pair_dates': log_dates,
+        }
+    )
+    return [(row['habit_id'], row['log_date']) for row in cur.fetchall()]
+
+
+def cascade_complete(cur, habit_id, log_date):
+    """Insert a completion log for every ancestor on habit_id's cascades_to
+    chain. Returns the ids of ancestors that got a new log."""
+    return [
+        ancestor_id
+        for ancestor_id, _ in cascade_complete_many(cur, [(habit_id, log_date)])
+    ]
+
+
+def cascade_undo_complete(cur, habit_id, log_date):
+    """Delete completion logs for every ancestor on habit_id's cascades_to
+    chain on the given date in one statement. Only deletes 'completed' logs so
+    a manually-skipped ancestor isn't accidentally cleared. Returns the ids of
+    ancestors that lost a log."""
+    cur.execute(
+        _ancestors_cte() +
+        ' DELETE FROM habit_logs'
+        ' WHERE log_date = %(log_date)s'
+        " AND status = 'completed'"
+        ' AND habit_id IN (SELECT ancestor_id FROM ancestors)'
+        ' RETURNING habit_id',
+        {'habit_ids': [habit_id], 'log_date': log_date}
+    )
+    return [row['habit_id'] for row in cur.fetchall()]
+
+
+def refresh_cascade_closure(cur, user_id):
+    """Rebuild the habit_cascades rows for all of a user's habits. Called by
+    every write that changes cascades_to (link, unlink, grow, delete)."""
+    cur.execute(
+        'DELETE FROM habit_cascades'
+        ' WHERE habit_id IN (SELECT id FROM habits WHERE creator_id = %s)',
+        (user_id,)
+    )
+    cur.execute(
+        ANCESTORS_CTE +
+        ' INSERT INTO habit_cascades (habit_id, ancestor_id, depth)'
+        ' SELECT habit_id, ancestor_id, MIN(depth) FROM ancestors'
+        ' GROUP BY habit_id, ancestor_id',
+        {'habit_ids': _user_habit_ids(cur, user_id)}
+    )
+
+
+def _user_habit_ids(cur, user_id):
+    cur.execute('SELECT id FROM habits WHERE creator_id = %s', (user_id,))
+    return [row['id'] for row in cur.fetchall()]
+
+
+@click.command('rebuild-cascades')
+@with_appcontext
+def rebuild_cascades_command():
+    """Rebuild the habit_cascades ancestor closure for every user."""
+    db = get_db()
+    cur = db.cursor()
+    cur.execute('SELECT id FROM users ORDER BY id')
+    user_ids = [row['id'] for row in cur.fetchall()]
+    for user_id in user_ids:
+        refresh_cascade_closure(cur, user_id)
+        db.commit()
+    cur.close()
+    click.echo(f'Rebuilt cascades for {len(user_ids)} users.')
+
+
+def init_app(app):
+    app.cli.add_command(rebuild_cascades_command)
@@ -5,6 +5,7 @@ from werkzeug.exceptions import abort
 
 from habit_tracker.auth import login_required
 from habit_tracker.db import get_db
+from habit_tracker.versioning import conditional
 
 from datetime import datetime, date, timedelta 
 from zoneinfo import ZoneInfo    
@@ -13,6 +14,7 @@ bp = Blueprint('challenges', __name__, url_prefix='/challenges')
 
 @bp.route('/')  
 @login_required                                                          
+@conditional
 def challenges():                                                          
     db = get_db()
     cur = db.cursor()
@@ -114,6 +116,7 @@ def update(id):
 # Get a single challenge
 @bp.route('/<int:id>', methods=('GET', 'DELETE'))
 @login_required
+@conditional
 def challenge(id):
     if request.method == 'DELETE':
         get_challenge(id)
@@ -149,6 +152,7 @@ def challenge(id):
 # get habits belonging to challenge
 @bp.route('/<int:id>/habits')
 @login_required
+@conditional
 def challenge_habits(id):
     db = get_db()
     cur = db.cursor()
@@ -172,9 +176,55 @@ def challenge_habits(id):
     return jsonify({"challenge_habits": challenge_habits})
 
 
-@bp.route('/challenge/<int:id>/stats')
-@login_required
-def challenge_stats(id):
+# Weekly completion series for a challenge, from the Monday of the week it
+# was created through today (both in the user's timezone). A week's valid
+# days are the ones on or after the start date and not in the future.
+CHALLENGE_WEEKS_SQL = '''
+    WITH span AS (
+        SELECT c.id,
+               (c.created_at AT TIME ZONE %(tz)s)::date AS start_date,
+               (now() AT TIME ZONE %(tz)s)::date AS today,
+               (SELECT COUNT(*) FROM habits WHERE challenge_id = c.id) AS habit_count
+        FROM challenges c
+        WHERE c.id = %(id)s
+    ),
+    weeks AS (
+        SELECT week_start::date AS week_start,
+               GREATEST(week_start::date, start_date) AS valid_start,
+               LEAST(week_start::date + 6, today) AS valid_end,
+               habit_count
+        FROM span,
+             generate_series(date_trunc('week', start_date), today, interval '7 days') AS week_start
+    )
+    SELECT w.week_start AS "start",
+           w.week_start + 6 AS "end",
+           w.habit_count,
+           COUNT(hl.habit_id) AS completions,
+           w.habit_count * (w.valid_end - w.valid_start + 1) AS possible
+    FROM weeks w
+    LEFT JOIN habit_logs hl
+        ON hl.log_date BETWEEN w.valid_start AND w.valid_end
+        AND hl.habit_id IN (SELECT id FROM habits WHERE challenge_id = %(id)s)
+    GROUP BY w.week_start, w.valid_start, w.valid_end, w.habit_count
+    ORDER BY w.week_start
+'''
+
+
+def get_challenge_weeks(cur, challenge_id):
+    """Weekly stats and habit count for a challenge in a single query."""
+    cur.execute(CHALLENGE_WEEKS_SQL, {'id': challenge_id, 'tz': g.user['timezone']})
+    weeks = [dict(row) for row in cur.fetchall()]
+
+    # every row carries the challenge's habit count
+    habit_count = weeks[0]['habit_count'] if weeks else 0
+    for week in weeks:
+        del week['habit_count']
+        possible = week['possible']
+        week['percentage'] = (week['completions'] / possible * 100) if possible > 0 else 0
+    return weeks, habit_count
+
+
+def get_challenge_stats(id):
     db = get_db()
     cur = db.cursor()
 
@@ -185,68 +235,45 @@ def challenge_stats(id):
     )
     challenge = cur.fetchone()
     if challenge is None:
+        cur.close()
         abort(404)
 
-    # Count habits in this challenge
-    cur.execute(
-        'SELECT COUNT(*) as count FROM habits WHERE challenge_id = %s',
-        (id,)
-    )
-    habit_count = cur.fetchone()['count']
-
-    # Get user's current date
-    tz = ZoneInfo(g.user['timezone'])
-    today = datetime.now(tz).date()
-
-    # Start from the Monday of the week the challenge was created
-    challenge_start = challenge['created_at'].astimezone(tz).date()
-    start_of_week = challenge_start - timedelta(days=challenge_start.weekday())
-
-    # Build weekly stats
-    weeks = []
-    current_week_start = start_of_week
-
-    while current_week_start <= today:
-        week_end = current_week_start + timedelta(days=6)
-
-        # Count valid days (not before challenge started, not in future)
-        valid_days = 0
-        valid_start = max(current_week_start, challenge_start)
-        valid_end = min(week_end, today)
-        for d in range(7):
-            day = current_week_start + timedelta(days=d)
-            if day >= challenge_start and day <= today:
-                valid_days += 1
-
-        cur.execute(
-            'SELECT COUNT(*) as count FROM habit_logs hl '
-            'JOIN habits h ON hl.habit_id = h.id '
-            'WHERE h.challenge_id = %s '
-            'AND hl.log_date >= %s AND hl.log_date <= %s',
-            (id, valid_start, valid_end)
-        )
-        completions = cur.fetchone()['count']
-        possible = habit_count * valid_days
-        percentage = (completions / possible * 100) if possible > 0 else 0
+    weeks, habit_count = get_challenge_weeks(cur, id)
+    cur.close()
 
-        weeks.append({
-            'start': current_week_start,
-            'end': week_end,
-            'completions': completions,
-            'possible': possible,
-            'percentage': percentage
-        })
+    return challenge, weeks, habit_count
 
-        current_week_start += timedelta(days=7)
 
-    cur.close()
+@bp.route('/challenge/<int:id>/stats')
+@login_required
+@conditional
+def challenge_stats(id):
+    challenge, weeks, habit_count = get_challenge_stats(id)
 
     return render_template(
         'challenges/challenge_stats.jinja',
         challenge=challenge,
         habit_count=habit_count,
         weeks=weeks
-    )         
+    )
+
+
+# same stats as JSON for the React frontend
+@bp.route('/<int:id>/stats')
+@login_required
+@conditional
+def challenge_stats_json(id):
+    challenge, weeks, habit_count = get_challenge_stats(id)
+
+    for week in weeks:
+        week['start'] = week['start'].isoformat()
+        week['end'] = week['end'].isoformat()
+
+    return jsonify({
+        "challenge": challenge,
+        "habit_count": habit_count,
+        "weeks": weeks
+    }), 200
 
 
 
@@ -1,19 +1,209 @@
+import os
+import threading
+import time
+from collections import deque
+
 import psycopg2
-from psycopg2.extras import RealDictCursor  
+from psycopg2.extras import RealDictCursor
+from psycopg2.pool import PoolError
 
 import click
 from flask import current_app, g
+from flask.cli import with_appcontext
+
+from habit_tracker.instrumentation import instrument
+from habit_tracker.workers import existing, per_worker
+
+
+class PoolTimeout(PoolError):
+    """No connection became free within DB_POOL_TIMEOUT seconds."""
+
+
+class ConnectionPool:
+    """Per-process pool of psycopg2 connections.
+
+    Connections are health checked when they come out of the pool after
+    sitting idle for a while, and reset (rollback + DISCARD ALL) when they go
+    back in, so one request's session state never leaks into the next."""
+
+    def __init__(self, connect, min_size=1, max_size=10, timeout=5.0, check_idle=30.0):
+        self._connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.check_idle = check_idle
+        self.pid = os.getpid()
+
+        self._cond = threading.Condition()
+        self._idle = deque()  # (connection, time it was returned)
+        self._size = 0
+        self._in_use = 0
+        self._stats = {
+            'checkouts': 0,
+            'waits': 0,
+            'timeouts': 0,
+            'connections_created': 0,
+            'connections_discarded': 0,
+            'health_check_failures': 0,
+        }
+
+        for _ in range(min_size):
+            self._size += 1
+            self._idle.append((self._new_connection(), time.monotonic()))
+
+    def _count(self, name):
+        with self._cond:
+            self._stats[name] += 1
+
+    def _new_connection(self):
+        conn = self._connect()
+        self._count('connections_created')
+        return conn
+
+    def _is_healthy(self, conn, idle_since):
+        if conn.closed:
+            return False
+        if time.monotonic() - idle_since < self.check_idle:
+            return True
+        try:
+            cur = conn.cursor()
+            cur.execute('SELECT 1')
+            cur.close()
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            self._count('health_check_failures')
+            return False
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+        self._count('connections_discarded')
+
+    def getconn(self):
+        deadline = time.monotonic() + self.timeout
+        with self._cond:
+            while True:
+                if self._idle:
+                    conn, idle_since = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    self._size += 1
+                    conn, idle_since = None, None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats['timeouts'] += 1
+                    raise PoolTimeout(
+                        f'no database connection available after {self.timeout}s'
+                    )
+                self._stats['waits'] += 1
+                self._cond.wait(remaining)
+            self._in_use += 1
+            self._stats['checkouts'] += 1
+
+        try:
+            if conn is not None and not self._is_healthy(conn, idle_since):
+                self._discard(conn)
+                conn = None
+            if conn is None:
+                conn = self._new_connection()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+
+        return conn
+
+    def putconn(self, conn):
+        try:
+            # reset-on-return: end any open transaction and clear session
+            # state (settings, temp tables, prepared statements, locks)
+            conn.rollback()
+            conn.autocommit = True
+            cur = conn.cursor()
+            cur.execute('DISCARD ALL')
+            cur.close()
+            conn.autocommit = False
+            reusable = True
+        except psycopg2.Error:
+            reusable = False
+
+        if not reusable or conn.closed:
+            self._discard(conn)
+
+        with self._cond:
+            self._in_use -= 1
+            if reusable and not conn.closed:
+                self._idle.append((conn, time.monotonic()))
+            else:
+                self._size -= 1
+            self._cond.notify()
+
+    def closeall(self):
+        with self._cond:
+            idle = list(self._idle)
+            self._idle.clear()
+            self._size -= len(idle)
+        for conn, _ in idle:
+            conn.close()
+
+    def stats(self):
+        with self._cond:
+            return dict(
+                self._stats,
+                size=self._size,
+                idle=len(self._idle),
+                in_use=self._in_use,
+                min_size=self.min_size,
+                max_size=self.max_size,
+            )
+
+
+def _connect(config):
+    return psycopg2.connect(
+        database=config['DB_NAME'],
+        user=config['DB_USER'],
+        host=config['DB_HOST'],
+        port=config['DB_PORT'],
+        password=config['DB_PASSWORD'],
+        cursor_factory=RealDictCursor  # converts tuples into dicts
+    )
+
+
+def get_pool():
+    """Return this worker's pool, creating it on first use. A pool inherited
+    from a parent process (gunicorn --preload) is dropped, not shared."""
+    config = current_app.config
+    return per_worker('db_pool', lambda: ConnectionPool(
+        lambda: _connect(config),
+        min_size=config['DB_POOL_MIN_SIZE'],
+        max_size=config['DB_POOL_MAX_SIZE'],
+        timeout=config['DB_POOL_TIMEOUT'],
+        check_idle=config['DB_POOL_CHECK_IDLE'],
+    ))
+
+
+def pool_stats():
+    """Counters and gauges for this worker's pool, or None before first use."""
+    pool = existing('db_pool')
+    return pool.stats() if pool is not None else None
+
+
+def close_pool(app):
+    pool = app.extensions.pop('db_pool', None)
+    if pool is not None:
+        pool.closeall()
+
 
 def get_db():
-    if 'db' not in g:   # if theres not a db connection create one
-        g.db = psycopg2.connect(
-            database=current_app.config['DB_NAME'],                                                
-            user=current_app.config['DB_USER'],                                                    
-            host=current_app.config['DB_HOST'],                                                    
-            port=current_app.config['DB_PORT'],  
-            password=current_app.config['DB_PASSWORD'], 
-            cursor_factory=RealDictCursor  # converts tuples into dicts
-        )
+    if 'db' not in g:   # if theres not a db connection check one out
+        g.db = get_pool().getconn()
+        instrument(g.db)
 
     return g.db
 
@@ -22,20 +212,25 @@ def close_db(e=None):
     db = g.pop('db', None)
 
     if db is not None:
-        db.close()
+        get_pool().putconn(db)
 
 def init_db():
     db = get_db()
-    cur = db.cursor()                                                                      
-                                                                                             
-    with current_app.open_resource('schema.sql') as f:                                     
-        cur.execute(f.read().decode('utf8'))                                               
-                                                                                             
-    db.commit()                                                                            
-    cur.close()  
+    cur = db.cursor()
+
+    with current_app.open_resource('schema.sql') as f:
+        cur.execute(f.read().decode('utf8'))
+
+    # schema.sql is already at the latest migration
+    from habit_tracker.migrate import stamp
+    stamp(cur)
+
+    db.commit()
+    cur.close()
 
 
 @click.command('init-db')
+@with_appcontext
 def init_db_command():
     """Clear the existing data and create new tables."""
     init_db()
@@ -44,4 +239,4 @@ def init_db_command():
 
 def init_app(app):
     app.teardown_appcontext(close_db)
-    app.cli.add_command(init_db_command)
\ No newline at end of file
+    app.cli.add_command(init_db_command)
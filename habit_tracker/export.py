@@ -0,0 +1,159 @@
+import csv
+import io
+import json
+from datetime import date, datetime
+
+from flask import (
+    Blueprint, Response, g, request, stream_with_context, jsonify
+)
+
+from habit_tracker.auth import login_required
+from habit_tracker.db import get_db
+
+bp = Blueprint('export', __name__, url_prefix='/export')
+
+# rows fetched from the server-side cursor per round trip
+BATCH_SIZE = 2000
+
+# export sections, in the order NDJSON streams them
+EXPORT_QUERIES = {
+    'habits': (
+        'SELECT id, name, notes, created_at, challenge_id, family_id, stage, tier,'
+        ' time_of_day, merged, cascades_to, display_order'
+        ' FROM habits'
+        ' WHERE creator_id = %s'
+        ' ORDER BY id'
+    ),
+    'families': (
+        'SELECT family_id, array_agg(id ORDER BY stage) AS habit_ids,'
+        ' MAX(stage) AS stages, bool_or(merged) AS merged'
+        ' FROM habits'
+        ' WHERE creator_id = %s'
+        ' GROUP BY family_id'
+        ' ORDER BY family_id'
+    ),
+    'challenges': (
+        'SELECT id, title, body, created_at'
+        ' FROM challenges'
+        ' WHERE creator_id = %s'
+        ' ORDER BY id'
+    ),
+    'logs': (
+        'SELECT hl.habit_id, h.name, hl.log_date, hl.status, hl.reason'
+        ' FROM habit_logs hl'
+        ' JOIN habits h ON h.id = hl.habit_id'
+        ' WHERE h.creator_id = %s'
+        ' ORDER BY hl.habit_id, hl.log_date'
+    ),
+}
+
+
+# "type" tag of each section's NDJSON records
+RECORD_TYPES = {
+    'habits': 'habit',
+    'families': 'family',
+    'challenges': 'challenge',
+    'logs': 'log',
+}
+
+
+def _json_default(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+def _csv_value(value):
+    if isinstance(value, list):
+        return ' '.join(str(v) for v in value)
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+def stream_batches(section, user_id):
+    """Yield lists of rows for one export section, read through a named
+    (server-side) cursor so only BATCH_SIZE rows are in memory at a time."""
+    db = get_db()
+    cur = db.cursor(name=f'export_{section}')
+    cur.itersize = BATCH_SIZE
+    try:
+        cur.execute(EXPORT_QUERIES[section], (user_id,))
+        while True:
+            rows = cur.fetchmany(BATCH_SIZE)
+            if not rows:
+                break
+            yield rows
+    finally:
+        cur.close()
+
+
+def generate_ndjson(user_id):
+    for section in EXPORT_QUERIES:
+        record_type = RECORD_TYPES[section]
+        for rows in stream_batches(section, user_id):
+            yield ''.join(
+                json.dumps(dict(row, type=record_type), default=_json_default) + '\n'
+                for row in rows
+            )
+
+
+def section_columns(section, user_id):
+    """Column names of an export section, without reading any of its rows."""
+    cur = get_db().cursor()
+    try:
+        cur.execute(f'SELECT * FROM ({EXPORT_QUERIES[section]}) s LIMIT 0', (user_id,))
+        return [column.name for column in cur.description]
+    finally:
+        cur.close()
+
+
+def generate_csv(section, user_id):
+    """One section as CSV. The header row is written even when the section
+    has no rows."""
+    buffer = io.StringIO()
+    writer = None
+    for rows in stream_batches(section, user_id):
+        if writer is None:
+            writer = csv.DictWriter(buffer, fieldnames=list(rows[0].keys()))
+            writer.writeheader()
+        for row in rows:
+            writer.writerow({key: _csv_value(value) for key, value in row.items()})
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+
+    if writer is None:
+        csv.writer(buffer).writerow(section_columns(section, user_id))
+        yield buffer.getvalue()
+
+
+@bp.route('/')
+@login_required
+def export():
+    """Stream the user's full history.
+
+    ?format=ndjson (default) streams every section, one JSON object per line
+    tagged with a "type". ?format=csv streams one section, chosen with
+    ?section=habits|families|challenges|logs (default logs)."""
+    export_format = request.args.get('format', 'ndjson')
+    user_id = g.user['id']
+
+    if export_format == 'ndjson':
+        return Response(
+            stream_with_context(generate_ndjson(user_id)),
+            mimetype='application/x-ndjson',
+            headers={'Content-Disposition': 'attachment; filename=habits.ndjson'}
+        )
+
+    if export_format == 'csv':
+        section = request.args.get('section', 'logs')
+        if section not in EXPORT_QUERIES:
+            return jsonify({"error": f"section must be one of {', '.join(EXPORT_QUERIES)}"}), 400
+        return Response(
+            stream_with_context(generate_csv(section, user_id)),
+            mimetype='text/csv',
+            headers={'Content-Disposition': f'attachment; filename={section}.csv'}
+        )
+
+    return jsonify({"error": "format must be ndjson or csv"}), 400
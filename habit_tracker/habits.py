@@ -6,8 +6,20 @@ from werkzeug.exceptions import abort
 from zoneinfo import ZoneInfo
 from datetime import datetime, timedelta 
 
-from habit_tracker.auth import login_required
+from habit_tracker.auth import invalidate_user, login_required
+from habit_tracker.calendar_matrix import Calendar
+from habit_tracker.cascades import (
+    cascade_complete, cascade_complete_many, cascade_undo_complete,
+    refresh_cascade_closure
+)
 from habit_tracker.db import get_db
+from habit_tracker.rollups import refresh_rollups
+from habit_tracker.runs import refresh_runs
+from habit_tracker.streaks import (
+    attach_current_streaks, get_streaks, record_completed_days, record_completions,
+    refresh_streaks
+)
+from habit_tracker.versioning import conditional
 
 bp = Blueprint('habits', __name__)
 
@@ -16,51 +28,6 @@ def get_user_local_date():
     return datetime.now(tz).date()
 
 
-def cascade_complete(cur, habit_id, log_date):
-    """Walk cascades_to chain from habit_id and insert a completion log for each
-    ancestor. Uses ON CONFLICT DO NOTHING so it's a no-op when the ancestor is
-    already logged (completed or skipped) for that date."""
-    visited = set()
-    current_id = habit_id
-    while True:
-        cur.execute('SELECT cascades_to FROM habits WHERE id = %s', (current_id,))
-        row = cur.fetchone()
-        if not row or not row['cascades_to']:
-            break
-        cascades_to = row['cascades_to']
-        if cascades_to in visited:
-            break
-        visited.add(cascades_to)
-        cur.execute(
-            "INSERT INTO habit_logs (log_date, habit_id) VALUES (%s, %s)"
-            " ON CONFLICT (habit_id, log_date) DO NOTHING",
-            (log_date, cascades_to)
-        )
-        current_id = cascades_to
-
-
-def cascade_undo_complete(cur, habit_id, log_date):
-    """Walk cascades_to chain and delete completion logs for ancestors on the
-    given date. Only deletes 'completed' logs so a manually-skipped ancestor
-    isn't accidentally cleared."""
-    visited = set()
-    current_id = habit_id
-    while True:
-        cur.execute('SELECT cascades_to FROM habits WHERE id = %s', (current_id,))
-        row = cur.fetchone()
-        if not row or not row['cascades_to']:
-            break
-        cascades_to = row['cascades_to']
-        if cascades_to in visited:
-            break
-        visited.add(cascades_to)
-        cur.execute(
-            "DELETE FROM habit_logs"
-            " WHERE habit_id = %s AND log_date = %s AND status = 'completed'",
-            (cascades_to, log_date)
-        )
-        current_id = cascades_to
-
 # create habit
 @bp.route('/habits', methods=('POST',))
 @login_required
@@ -142,6 +109,7 @@ def merge_habits(family_id):
 # group habits by family id
 @bp.route('/habits/tiers', methods=('GET',))
 @login_required
+@conditional
 def get_families():
     # parse date if give, else use todays date
     date_str = request.args.get('date')
@@ -199,29 +167,8 @@ def get_families():
     habits.extend(merged_habits)
     
     # get habits current streaks
-    for habit in habits:
-        # get all completion dates
-        cur.execute(
-            'SELECT log_date' \
-            ' FROM habit_logs' \
-            ' WHERE habit_id = %s' \
-            ' AND status = %s' \
-            ' ORDER BY log_date',
-            (habit['id'], 'completed')
-        )
-        all_logs = cur.fetchall()
-        all_completed_dates = set()
-        for log in all_logs:
-            all_completed_dates.add(log['log_date'])
-        # calculate curr streak
-        curr_streak = 0
-        check_date = today - timedelta(days=1) # starting yesterday since it hasnt been completed td
-        while check_date in all_completed_dates:
-            curr_streak += 1
-            check_date -= timedelta(days=1)
-
-        # add curr streak to habit
-        habit['curr_streak'] = curr_streak
+    # starting yesterday since it hasnt been completed td
+    attach_current_streaks(cur, habits, today - timedelta(days=1))
 
     # sort them by streak
     # habits.sort(key=lambda habit: (habit['tier'], habit['time_of_day'] or 0, habit['family_id'], -habit['curr_streak'])) 
@@ -297,30 +244,8 @@ def get_families():
     habits_done = [dict(row) for row in cur.fetchall()]
 
     # get habits current streaks
-    for habit in habits_done:
-        # get all completion dates
-        cur.execute(
-            'SELECT log_date' \
-            ' FROM habit_logs' \
-            ' WHERE habit_id = %s' \
-            ' AND status = %s' \
-            ' ORDER BY log_date',
-            (habit['id'], 'completed')
-        )
-        all_logs = cur.fetchall()
-        all_completed_dates = set()
-        for log in all_logs:
-            all_completed_dates.add(log['log_date'])
-        
-        # calculate curr streak
-        curr_streak = 0
-        check_date = today # starting today since it's been completed td
-        while check_date in all_completed_dates:
-            curr_streak += 1
-            check_date -= timedelta(days=1)
-
-        # add curr streak to habit
-        habit['curr_streak'] = curr_streak
+    # starting today since it's been completed td
+    attach_current_streaks(cur, habits_done, today)
 
     # sort them by streak
     habits_done.sort(key=lambda habit: habit['curr_streak'], reverse=True)
@@ -407,6 +332,7 @@ def update_tier_order():
     )
     db.commit()
     cur.close()
+    invalidate_user(g.user['id'])
 
     return jsonify({}), 200
 
@@ -474,6 +400,7 @@ def grow_horizontal(id):
             'UPDATE habits SET cascades_to = %s WHERE id = %s',
             (new_id, current['id'])
         )
+    refresh_cascade_closure(cur, g.user['id'])
 
     db.commit()
     cur.close()
@@ -496,6 +423,7 @@ def unlink_habit(id):
     if cur.rowcount == 0:
         cur.close()
         return jsonify({"error": "Habit not found"}), 404
+    refresh_cascade_closure(cur, g.user['id'])
 
     db.commit()
     cur.close()
@@ -545,6 +473,7 @@ def link_habit(id):
         'UPDATE habits SET cascades_to = %s WHERE id = %s',
         (easier_id, harder_id)
     )
+    refresh_cascade_closure(cur, g.user['id'])
 
     db.commit()
     cur.close()
@@ -554,6 +483,7 @@ def link_habit(id):
 
 # get complete and incomplete habits for date
 @bp.route('/habits')
+@conditional
 def get_habits():
     db = get_db()
     cur = db.cursor()
@@ -601,32 +531,9 @@ def get_habits():
     habits = [dict(row) for row in cur.fetchall()]
 
     # get habits current streaks
-    for habit in habits:
-        # get all completion dates
-        cur.execute(
-        'SELECT log_date' \
-        ' FROM habit_logs' \
-        ' WHERE habit_id = %s' \
-        ' AND status = %s' \
-        ' ORDER BY log_date',
-        (habit['id']), 'completed')
-        all_logs = cur.fetchall()
-        all_completed_dates = set()
-        for log in all_logs:
-            all_completed_dates.add(log['log_date'])
-        
-        # calculate curr streak
-        curr_streak = 0
-        check_date = today - timedelta(days=1) # starting yesterday since it hasnt been completed td
-        while check_date in all_completed_dates:
-            curr_streak += 1
-            check_date -= timedelta(days=1)
-
-        # add curr streak to habit
-        habit['curr_streak'] = curr_streak
-        print("hi")
-        print(habit)
-    
+    # starting yesterday since it hasnt been completed td
+    attach_current_streaks(cur, habits, today - timedelta(days=1))
+
 
     # Get completed habits
     cur.execute(
@@ -641,29 +548,8 @@ def get_habits():
     habits_done = [dict(row) for row in cur.fetchall()]
 
     # get habits current streaks
-    for habit in habits_done:
-        # get all completion dates
-        cur.execute('' \
-        'SELECT log_date' \
-        ' FROM habit_logs' \
-        ' WHERE habit_id = %s' \
-        ' AND status = %s' \
-        ' ORDER BY log_date',
-        (habit['id']), 'completed')
-        all_logs = cur.fetchall()
-        all_completed_dates = set()
-        for log in all_logs:
-            all_completed_dates.add(log['log_date'])
-        
-        # calculate curr streak
-        curr_streak = 0
-        check_date = today # starting today since it's been completed td
-        while check_date in all_completed_dates:
-            curr_streak += 1
-            check_date -= timedelta(days=1)
-
-        # add curr streak to habit
-        habit['curr_streak'] = curr_streak
+    # starting today since it's been completed td
+    attach_current_streaks(cur, habits_done, today)
 
     cur.close()
 
@@ -679,6 +565,7 @@ def get_habits():
 # get single habit data
 @bp.route('/habits/<int:id>')
 @login_required
+@conditional
 def get_habit(id):
     db = get_db()
     cur = db.cursor()
@@ -703,6 +590,7 @@ def get_habit(id):
 
 @bp.route('/family/<int:family_id>', methods=('GET',))
 @login_required
+@conditional
 def get_family(family_id):
     db = get_db()
     cur = db.cursor()
@@ -895,6 +783,9 @@ def skip_habit(id):
             (log_date, habit_id, 'skipped', reason)
         )
 
+    skipped = [(habit['id'], log_date) for habit in habits]
+    refresh_runs(cur, skipped)
+    refresh_rollups(cur, skipped)
     db.commit()
     cur.close()
 
@@ -922,10 +813,16 @@ def complete(id):
 
     cur.execute(
         "INSERT INTO habit_logs (log_date, habit_id) VALUES (%s, %s)"
-        " ON CONFLICT (habit_id, log_date) DO NOTHING",
+        " ON CONFLICT (habit_id, log_date) DO NOTHING"
+        " RETURNING habit_id",
         (log_date, id)
     )
-    cascade_complete(cur, id, log_date)
+    completed_ids = [row['habit_id'] for row in cur.fetchall()]
+    completed_ids += cascade_complete(cur, id, log_date)
+    completed = [(habit_id, log_date) for habit_id in completed_ids]
+    refresh_runs(cur, completed)
+    record_completions(cur, completed_ids, log_date)
+    refresh_rollups(cur, completed)
     db.commit()
     cur.close()
 
@@ -950,10 +847,16 @@ def undo_complete(id):
     cur = db.cursor()
     cur.execute(
         'DELETE FROM habit_logs '
-        'WHERE habit_id = %s AND log_date = %s',
+        'WHERE habit_id = %s AND log_date = %s '
+        'RETURNING habit_id',
         (id, log_date)
     )
-    cascade_undo_complete(cur, id, log_date)
+    undone_ids = [row['habit_id'] for row in cur.fetchall()]
+    undone_ids += cascade_undo_complete(cur, id, log_date)
+    undone = [(habit_id, log_date) for habit_id in undone_ids]
+    refresh_runs(cur, undone)
+    refresh_streaks(cur, undone_ids)
+    refresh_rollups(cur, undone)
     db.commit()
     cur.close()
     return jsonify({}), 200
@@ -1009,6 +912,9 @@ def undo_skip(id):
             (habit_id, log_date)
         )
 
+    unskipped = [(habit['id'], log_date) for habit in habits]
+    refresh_runs(cur, unskipped)
+    refresh_rollups(cur, unskipped)
     db.commit()
     cur.close()
     return jsonify({}), 200
@@ -1019,6 +925,7 @@ def undo_skip(id):
 
 @bp.route('/<int:id>')
 @login_required
+@conditional
 def view(id):
     habit = get_habit_(id)
     db = get_db()
@@ -1047,91 +954,26 @@ def view(id):
     # Can go next if not already at current week
     can_go_next = week_offset < 0
 
-    # Get completion logs for selected week
-    cur.execute(
-        'SELECT log_date FROM habit_logs '
-        'WHERE habit_id = %s AND log_date >= %s AND log_date <= %s '
-        'ORDER BY log_date DESC',
-        (id, selected_week_monday, selected_week_sunday)
+    # One calendar covering the selected week and the last 8 weeks
+    progress_start = current_monday - timedelta(weeks=7)
+    calendar = Calendar.load(
+        cur, [id],
+        min(selected_week_monday, progress_start),
+        max(selected_week_sunday, current_monday + timedelta(days=6)),
+        {id: habit_created_date}, today
     )
-    logs = cur.fetchall()
-    completed_dates = {log['log_date'] for log in logs}
 
     # Build week data (Mon-Sun)
-    days_data = []
-    for i in range(7):
-        date = selected_week_monday + timedelta(days=i)
-        days_data.append({
-            'date': date,
-            'completed': date in completed_dates,
-            'in_future': date > today,
-            'before_habit': date < habit_created_date
-        })
-
-    # Get all completion dates for streak calculations
-    cur.execute(
-        'SELECT log_date FROM habit_logs '
-        'WHERE habit_id = %s ORDER BY log_date',
-        (id,)
-    )
-    all_logs = cur.fetchall()
-    all_completed_dates = {log['log_date'] for log in all_logs}
-
-    # Current streak
-    current_streak = 0
-    check_date = today
-    while check_date in all_completed_dates:
-        current_streak += 1
-        check_date -= timedelta(days=1)
-
-    # If not completed today, check if yesterday started a streak
-    if current_streak == 0:
-        check_date = today - timedelta(days=1)
-        while check_date in all_completed_dates:
-            current_streak += 1
-            check_date -= timedelta(days=1)
-
-    # Longest streak
-    longest_streak = 0
-    if all_logs:
-        sorted_dates = sorted(all_completed_dates)
-        streak = 1
-        for i in range(1, len(sorted_dates)):
-            if sorted_dates[i] - sorted_dates[i-1] == timedelta(days=1):
-                streak += 1
-            else:
-                longest_streak = max(longest_streak, streak)
-                streak = 1
-        longest_streak = max(longest_streak, streak)
-
-    # Calculate weekly progress (last 8 weeks)
-    weeks = []
-    for w in range(7, -1, -1):
-        week_start = current_monday - timedelta(weeks=w)
-        week_end = week_start + timedelta(days=6)
-
-        # Count days that are valid (not before habit created, not in future)
-        valid_days = 0
-        completed_days = 0
-        for d in range(7):
-            day = week_start + timedelta(days=d)
-            if day >= habit_created_date and day <= today:
-                valid_days += 1
-                if day in all_completed_dates:
-                    completed_days += 1
-
-        if valid_days > 0:
-            percentage = (completed_days / valid_days) * 100
-        else:
-            percentage = 0
+    days_data = calendar.window(selected_week_monday, selected_week_sunday).day_grid()[id]
+
+    # Current and longest streak
+    # if not completed today, yesterday's streak still counts
+    streaks = get_streaks(cur, [id], today, grace=True)[id]
+    current_streak = streaks['current_streak']
+    longest_streak = streaks['longest_streak']
 
-        weeks.append({
-            'start': week_start,
-            'end': week_end,
-            'completed': completed_days,
-            'valid_days': valid_days,
-            'percentage': percentage
-        })
+    # Weekly progress (last 8 weeks), counting days from creation to today
+    weeks = calendar.window(progress_start, current_monday + timedelta(days=6)).weekly_progress()[id]
 
     # # Get challenge info if assigned
     # challenge = None
@@ -1164,6 +1006,8 @@ def view(id):
         "challenge_title": challenge_title,
         "current_streak": current_streak,
         "longest_streak": longest_streak,
+        "week": days_data,
+        "weeks": weeks,
         "challenges": challenges
     }), 200
 
@@ -1224,6 +1068,8 @@ def delete(id):
     db = get_db()
     cur = db.cursor()
     cur.execute('DELETE FROM habits WHERE id = %s', (id,))
+    # chains that ran through the deleted habit now stop short of it
+    refresh_cascade_closure(cur, g.user['id'])
     db.commit()
     cur.close()
     return jsonify({}),201
@@ -1283,6 +1129,7 @@ def move(id, direction):
 
 
 @bp.route('/')
+@conditional
 def index():
     db = get_db()
     cur = db.cursor()
@@ -1359,36 +1206,15 @@ def index():
     # Get all habit IDs
     all_habit_ids = [h['id'] for h in habits] + [h['id'] for h in habits_done]
 
-    # Get week's completion logs for all habits
-    week_logs = {}
-    if all_habit_ids:
-        cur.execute(
-            'SELECT habit_id, log_date FROM habit_logs '
-            'WHERE habit_id = ANY(%s) AND log_date >= %s AND log_date <= %s',
-            (all_habit_ids, monday, monday + timedelta(days=6))
-        )
-        for log in cur.fetchall():
-            if log['habit_id'] not in week_logs:
-                week_logs[log['habit_id']] = set()
-            week_logs[log['habit_id']].add(log['log_date'])
-
-    # Add week data to each habit
-    def add_week_data(habit_list):
-        for habit in habit_list:
-            habit_created = habit['created_at'].date() if habit['created_at'] else monday
-            completed_dates = week_logs.get(habit['id'], set())
-            habit['week'] = []
-            for i in range(7):
-                date = monday + timedelta(days=i)
-                habit['week'].append({
-                    'date': date,
-                    'completed': date in completed_dates,
-                    'in_future': date > today,
-                    'before_habit': date < habit_created
-                })
-
-    add_week_data(habits)
-    add_week_data(habits_done)
+    # Week grid (Mon-Sun) of every habit from one load of the week's logs
+    created = {
+        h['id']: h['created_at'].date() if h['created_at'] else monday
+        for h in habits + habits_done
+    }
+    week = Calendar.load(cur, all_habit_ids, monday, monday + timedelta(days=6), created, today)
+    grid = week.day_grid()
+    for habit in habits + habits_done:
+        habit['week'] = grid[habit['id']]
 
     cur.close()
 
@@ -1400,54 +1226,107 @@ def index():
       "today": today.isoformat()                                                                                                                                                                                                          
   })                                                                                                                                                                                                                                      
 
-@bp.route('/habits/complete-multiple', methods=('POST',))                                                                  
-@login_required                                                                                                            
-def complete_multiple():                                                                                                   
-    # Get the data                                                                                                         
-    data = request.get_json()                                                                                              
-                                                                                                                            
-    if not data:                                                                                                           
-        return jsonify({"error": "Request body is required"}), 400                                                         
-                                                                                                                            
-    habit_ids = data.get('habit_ids')                                                                                      
-    date_str = data.get('date')                                                                                            
-                                                                                                                            
-    if not habit_ids:                                                                                                      
-        return jsonify({"error": "habit_ids is required"}), 400                                                            
-                                                                                                                            
-    # Parse date or use today                                                                                              
-    if date_str:                                                                                                           
-        try:                                                                                                               
-            log_date = datetime.strptime(date_str, '%Y-%m-%d').date()                                                      
-        except ValueError:                                                                                                 
-            log_date = get_user_local_date()                                                                               
-    else:                                                                                                                  
-        log_date = get_user_local_date()                                                                                   
-                                                                                                                            
-    db = get_db()                                                                                                          
-    cur = db.cursor()                                                                                                      
-                                                                                                                            
-    # Complete each habit                                                                                                  
-    for habit_id in habit_ids:                                                                                             
-        # Make sure this habit belongs to the user                                                                         
-        cur.execute(                                                                                                       
-            'SELECT id FROM habits WHERE id = %s AND creator_id = %s',                                                     
-            (habit_id, g.user['id'])                                                                                       
-        )                                                                                                                  
-        habit = cur.fetchone()                                                                                             
-                                                                                                                            
-        if habit is None:                                                                                                  
-            continue  # Skip if habit doesn't exist or doesn't belong to user                                              
-                                                                                                                            
-        # Insert completion log
-        cur.execute(
-            'INSERT INTO habit_logs (log_date, habit_id) VALUES (%s, %s)'
-            ' ON CONFLICT (habit_id, log_date) DO NOTHING',
-            (log_date, habit_id)
-        )
-        cascade_complete(cur, habit_id, log_date)
+@bp.route('/habits/complete-multiple', methods=('POST',))
+@login_required
+def complete_multiple():
+    """Complete many habits at once.
+
+    Accepts either {"habit_ids": [...], "date": "YYYY-MM-DD"} or, to backfill
+    several days in one call, {"items": [{"habit_id": 1, "date": "YYYY-MM-DD"}, ...]}.
+    Responds with an outcome per item: inserted, already-logged or not-owned."""
+    # Get the data
+    data = request.get_json()
+
+    if not data:
+        return jsonify({"error": "Request body is required"}), 400
+
+    items = data.get('items')
+    if items is not None:
+        if not isinstance(items, list) or not items:
+            return jsonify({"error": "items must be a non-empty list"}), 400
+
+        pairs = []
+        for item in items:
+            if not isinstance(item, dict) or not isinstance(item.get('habit_id'), int):
+                return jsonify({"error": "each item needs an integer habit_id"}), 400
+            date_str = item.get('date')
+            if date_str is None:
+                log_date = get_user_local_date()
+            else:
+                try:
+                    log_date = datetime.strptime(date_str, '%Y-%m-%d').date()
+                except (TypeError, ValueError):
+                    return jsonify({"error": "dates must be YYYY-MM-DD"}), 400
+            pairs.append((item['habit_id'], log_date))
+    else:
+        habit_ids = data.get('habit_ids')
+        date_str = data.get('date')
+
+        if not habit_ids:
+            return jsonify({"error": "habit_ids is required"}), 400
+        if not isinstance(habit_ids, list) or not all(isinstance(i, int) for i in habit_ids):
+            return jsonify({"error": "habit ids must be integers"}), 400
+
+        # Parse date or use today
+        if date_str:
+            try:
+                log_date = datetime.strptime(date_str, '%Y-%m-%d').date()
+            except ValueError:
+                log_date = get_user_local_date()
+        else:
+            log_date = get_user_local_date()
+
+        pairs = [(habit_id, log_date) for habit_id in habit_ids]
+
+    db = get_db()
+    cur = db.cursor()
+
+    # Insert a log for every owned (habit, date) in one statement, and report
+    # which ones were new
+    cur.execute(
+        'WITH requested AS ('
+        '   SELECT * FROM unnest(%(habit_ids)s::int[], %(log_dates)s::date[])'
+        '       AS r(habit_id, log_date)'
+        '), owned AS ('
+        '   SELECT DISTINCT r.habit_id, r.log_date'
+        '   FROM requested r'
+        '   JOIN habits h ON h.id = r.habit_id AND h.creator_id = %(user_id)s'
+        '), inserted AS ('
+        '   INSERT INTO habit_logs (log_date, habit_id)'
+        '   SELECT log_date, habit_id FROM owned'
+        '   ON CONFLICT (habit_id, log_date) DO NOTHING'
+        '   RETURNING habit_id, log_date'
+        ')'
+        ' SELECT o.habit_id, o.log_date, i.habit_id IS NOT NULL AS inserted'
+        ' FROM owned o'
+        ' LEFT JOIN inserted i USING (habit_id, log_date)',
+        {
+            'habit_ids': [habit_id for habit_id, _ in pairs],
+            'log_dates': [log_date for _, log_date in pairs],
+            'user_id': g.user['id'],
+        }
+    )
+    outcomes = {
+        (row['habit_id'], row['log_date']): 'inserted' if row['inserted'] else 'already-logged'
+        for row in cur.fetchall()
+    }
+
+    owned_pairs = list(outcomes)
+    completed = [pair for pair, outcome in outcomes.items() if outcome == 'inserted']
+    completed += cascade_complete_many(cur, owned_pairs)
+    refresh_runs(cur, completed)
+    record_completed_days(cur, completed)
+    refresh_rollups(cur, completed)
 
     db.commit()
     cur.close()
 
-    return jsonify({}), 200
\ No newline at end of file
+    results = [
+        {
+            "habit_id": habit_id,
+            "date": log_date.isoformat(),
+            "status": outcomes.get((habit_id, log_date), 'not-owned'),
+        }
+        for habit_id, log_date in pairs
+    ]
+    return jsonify({"results": results}), 200
@@ -0,0 +1,255 @@
+import csv
+import io
+import json
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+import click
+import psycopg2
+from flask import Blueprint, g, jsonify, request
+from flask.cli import with_appcontext
+
+from habit_tracker.auth import login_required
+from habit_tracker.cascades import cascade_complete_many
+from habit_tracker.db import get_db
+from habit_tracker.versioning import bump_data_version
+from habit_tracker.rollups import refresh_rollups
+from habit_tracker.runs import refresh_runs
+from habit_tracker.streaks import refresh_streaks
+
+bp = Blueprint('importer', __name__, url_prefix='/import')
+
+IMPORT_FORMATS = ('csv', 'ndjson')
+
+# habit_logs.habit_id is an INTEGER
+HABIT_ID_RANGE = range(-2**31, 2**31)
+
+# what a malformed upload raises while it is parsed
+UPLOAD_ERRORS = (csv.Error, UnicodeDecodeError)
+
+
+class _CopySource:
+    """File-like object over an iterator of CSV lines, so COPY can pull rows
+    as they are parsed instead of after the whole upload is read. An error
+    raised while parsing is kept in .error, since COPY may hand it back
+    wrapped in a database error."""
+
+    def __init__(self, lines):
+        self._lines = iter(lines)
+        self._buffer = ''
+        self.error = None
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            try:
+                self._buffer += next(self._lines)
+            except StopIteration:
+                break
+            except Exception as e:
+                self.error = e
+                raise
+        if size < 0:
+            size = len(self._buffer)
+        chunk, self._buffer = self._buffer[:size], self._buffer[size:]
+        return chunk
+
+    readline = read
+
+
+def _records(stream, import_format):
+    """Yield dicts from a text stream of CSV (with a header row) or NDJSON.
+    NDJSON records with a "type" other than "log" (as written by /export)
+    are ignored."""
+    if import_format == 'csv':
+        yield from csv.DictReader(stream)
+        return
+
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            yield {}
+            continue
+        if not isinstance(record, dict):
+            yield {}
+        elif record.get('type', 'log') == 'log':
+            yield record
+
+
+def _staging_lines(records, counts):
+    """Turn parsed records into CSV lines for the staging table. Rows whose
+    habit_id or date can't even be parsed, or whose habit_id is out of
+    INTEGER range, are counted as invalid here;
+    everything else is checked in SQL."""
+    out = io.StringIO()
+    writer = csv.writer(out)
+    for line_no, record in enumerate(records, start=1):
+        try:
+            habit_id = int(record.get('habit_id'))
+            if habit_id not in HABIT_ID_RANGE:
+                raise ValueError(f'habit_id {habit_id} out of range')
+            log_date = datetime.strptime(str(record.get('log_date') or record.get('date')), '%Y-%m-%d').date()
+        except (TypeError, ValueError):
+            counts['invalid'] += 1
+            continue
+        status = record.get('status') or 'completed'
+        reason = record.get('reason') or None
+
+        writer.writerow([line_no, habit_id, log_date.isoformat(), status, reason])
+        yield out.getvalue()
+        out.seek(0)
+        out.truncate(0)
+
+
+def import_logs(cur, user_id, records, today):
+    """Load records into habit_logs for user_id in one batch.
+
+    Rows are streamed into a temporary staging table with COPY, then merged
+    with a single INSERT ... SELECT that keeps only the user's own habits,
+    dates up to today and a known status. Existing logs win
+    (ON CONFLICT DO NOTHING), like complete. Cascades, runs, streaks and
+    rollups run once for the whole batch. Returns counts of what happened to the rows.
+    A malformed upload raises one of UPLOAD_ERRORS, leaving the transaction
+    to be rolled back."""
+    counts = {'invalid': 0}
+
+    cur.execute(
+        'CREATE TEMP TABLE import_staging ('
+        '   line INTEGER NOT NULL,'
+        '   habit_id INTEGER NOT NULL,'
+        '   log_date DATE NOT NULL,'
+        '   status TEXT NOT NULL,'
+        '   reason TEXT'
+        ') ON COMMIT DROP'
+    )
+    source = _CopySource(_staging_lines(records, counts))
+    try:
+        cur.copy_expert(
+            'COPY import_staging (line, habit_id, log_date, status, reason)'
+            ' FROM STDIN WITH (FORMAT csv)',
+            source
+        )
+    except psycopg2.Error:
+        if source.error is not None:
+            raise source.error from None
+        raise
+
+    cur.execute(
+        'SELECT'
+        '   COUNT(*) AS staged,'
+        '   COUNT(*) FILTER (WHERE h.id IS NULL) AS not_owned,'
+        '   COUNT(*) FILTER (WHERE h.id IS NOT NULL AND ('
+        "       s.log_date > %(today)s OR s.status NOT IN ('completed', 'skipped')"
+        '   )) AS invalid'
+        ' FROM import_staging s'
+        ' LEFT JOIN habits h ON h.id = s.habit_id AND h.creator_id = %(user_id)s',
+        {'user_id': user_id, 'today': today}
+    )
+    row = cur.fetchone()
+    counts['not_owned'] = row['not_owned']
+    counts['invalid'] += row['invalid']
+    valid = row['staged'] - row['not_owned'] - row['invalid']
+
+    # first row wins when the file repeats a (habit, day)
+    cur.execute(
+        'WITH candidates AS ('
+        '   SELECT DISTINCT ON (s.habit_id, s.log_date)'
+        '       s.habit_id, s.log_date, s.status, s.reason'
+        '   FROM import_staging s'
+        '   JOIN habits h ON h.id = s.habit_id AND h.creator_id = %(user_id)s'
+        '   WHERE s.log_date <= %(today)s'
+        "   AND s.status IN ('completed', 'skipped')"
+        '   ORDER BY s.habit_id, s.log_date, s.line'
+        ')'
+        ' INSERT INTO habit_logs (log_date, habit_id, status, reason)'
+        " SELECT log_date, habit_id, status, CASE WHEN status = 'skipped' THEN reason END"
+        ' FROM candidates'
+        ' ON CONFLICT (habit_id, log_date) DO NOTHING'
+        ' RETURNING habit_id, log_date, status',
+        {'user_id': user_id, 'today': today}
+    )
+    inserted = cur.fetchall()
+    counts['inserted'] = len(inserted)
+    counts['already_logged'] = valid - len(inserted)
+
+    completed = [(r['habit_id'], r['log_date']) for r in inserted if r['status'] == 'completed']
+    cascaded = cascade_complete_many(cur, completed)
+    counts['cascaded'] = len(cascaded)
+
+    written = [(r['habit_id'], r['log_date']) for r in inserted] + cascaded
+    refresh_runs(cur, written)
+    refresh_streaks(cur, [habit_id for habit_id, _ in written])
+    refresh_rollups(cur, written)
+
+    return counts
+
+
+@bp.route('/', methods=('POST',))
+@login_required
+def import_history():
+    """Import logs from a CSV (habit_id,log_date,status,reason header) or
+    NDJSON upload, sent as the raw body or as a multipart "file" field.
+    ?format=csv|ndjson, default csv."""
+    import_format = request.args.get('format', 'csv')
+    if import_format not in IMPORT_FORMATS:
+        return jsonify({"error": "format must be csv or ndjson"}), 400
+
+    upload = request.files.get('file')
+    raw = upload.stream if upload else request.stream
+    stream = io.TextIOWrapper(raw, encoding='utf-8', newline='')
+
+    today = datetime.now(ZoneInfo(g.user['timezone'])).date()
+
+    db = get_db()
+    cur = db.cursor()
+    try:
+        counts = import_logs(cur, g.user['id'], _records(stream, import_format), today)
+    except UPLOAD_ERRORS as e:
+        db.rollback()
+        return jsonify({"error": f"could not read {import_format} upload: {e}"}), 400
+    finally:
+        cur.close()
+    db.commit()
+
+    return jsonify(counts), 200
+
+
+@click.command('import-logs')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--user', 'username', required=True, help='Username to import into.')
+@click.option('--format', 'import_format', type=click.Choice(IMPORT_FORMATS),
+              default=None, help='Defaults to the file extension.')
+@with_appcontext
+def import_logs_command(path, username, import_format):
+    """Bulk import habit logs from a CSV or NDJSON file."""
+    if import_format is None:
+        import_format = 'ndjson' if path.endswith(('.ndjson', '.jsonl')) else 'csv'
+
+    db = get_db()
+    cur = db.cursor()
+    cur.execute('SELECT id, timezone FROM users WHERE username = %s', (username.lower(),))
+    user = cur.fetchone()
+    if user is None:
+        cur.close()
+        raise click.ClickException(f'No user named {username}.')
+
+    today = datetime.now(ZoneInfo(user['timezone'])).date()
+    try:
+        with open(path, encoding='utf-8', newline='') as f:
+            counts = import_logs(cur, user['id'], _records(f, import_format), today)
+    except UPLOAD_ERRORS as e:
+        db.rollback()
+        cur.close()
+        raise click.ClickException(f'Could not read {path}: {e}')
+    db.commit()
+    cur.close()
+    bump_data_version(user['id'])
+
+    click.echo(', '.join(f'{key}: {value}' for key, value in counts.items()))
+
+
+def init_app(app):
+    app.cli.add_command(import_logs_command)
@@ -1,39 +1,77 @@
-from flask import Blueprint, jsonify, g
+import hashlib
+import json
+import time
+from datetime import datetime, timezone
+
+from flask import Blueprint, Response, jsonify, g, current_app, request, stream_with_context
 
 from habit_tracker.auth import login_required
-from habit_tracker.db import get_db
+from habit_tracker.cache import TTLCache
+from habit_tracker.db import close_db, get_db
+from habit_tracker.jobs import get_runner
+from habit_tracker.metrics import llm_first_token, llm_request_duration, llm_tokens
+from habit_tracker.patterns import compute_features, format_features, load_history
+from habit_tracker.singleflight import get_single_flight
+from habit_tracker.skip_themes import cluster_reasons, format_themes
 
 from openai import OpenAI
+from psycopg2.extras import Json
 from dotenv import load_dotenv
-import os
 
 load_dotenv()
 
 bp = Blueprint('insights', __name__, url_prefix='/insights')
 
-client = OpenAI(api_key=os.environ.get('OPENAI_API_KEY'))
+SYSTEM_PROMPT = "You're a supportive habit coach. Give brief, specific insights based only on the user's data. No generic wellness advice. Be warm but concise."
 
 
-@bp.route('/')
-@login_required
-def get_insights():
-    db = get_db()
-    cur = db.cursor()
-    user_id = g.user['id']
+def get_client():
+    """OpenAI client for this app, created on first use so the app can start
+    without an API key. OPENAI_BASE_URL points it at another server, such as
+    a local stub in tests."""
+    client = current_app.extensions.get('openai_client')
+    if client is None:
+        client = OpenAI(
+            api_key=current_app.config['OPENAI_API_KEY'],
+            base_url=current_app.config['OPENAI_BASE_URL'],
+            timeout=current_app.config['INSIGHTS_TIMEOUT'],
+            max_retries=0,
+        )
+        current_app.extensions['openai_client'] = client
+    return client
 
-    # Query 1: Completion rates per habit
+
+def get_insights_cache():
+    cache = current_app.extensions.get('insights_cache')
+    if cache is None:
+        cache = TTLCache(
+            maxsize=current_app.config['INSIGHTS_CACHE_SIZE'],
+            ttl=current_app.config['INSIGHTS_CACHE_TTL'],
+        )
+        current_app.extensions['insights_cache'] = cache
+    return cache
+
+
+def insights_cache_stats():
+    return get_insights_cache().stats()
+
+
+def collect_insight_data(cur, user_id):
+    # Query 1: Completion rates per habit, from the runs overlapping the window
     cur.execute('''
         SELECT
             h.name,
-            COUNT(CASE WHEN hl.status = 'completed' THEN 1 END) as completed,
-            COUNT(CASE WHEN hl.status = 'skipped' THEN 1 END) as skipped
+            COALESCE(SUM(r.end_date - GREATEST(r.start_date, CURRENT_DATE - 30) + 1)
+                FILTER (WHERE r.status = 'completed'), 0)::int as completed,
+            COALESCE(SUM(r.end_date - GREATEST(r.start_date, CURRENT_DATE - 30) + 1)
+                FILTER (WHERE r.status = 'skipped'), 0)::int as skipped
         FROM habits h
-        LEFT JOIN habit_logs hl ON h.id = hl.habit_id
-            AND hl.log_date >= CURRENT_DATE - INTERVAL '30 days'
+        LEFT JOIN habit_runs r ON h.id = r.habit_id
+            AND r.end_date >= CURRENT_DATE - 30
         WHERE h.creator_id = %s
         GROUP BY h.id, h.name
     ''', (user_id,))
-    habit_stats = cur.fetchall()
+    habit_stats = [dict(row) for row in cur.fetchall()]
 
     # Query 2: Skip reasons
     cur.execute('''
@@ -46,45 +84,506 @@ def get_insights():
           AND hl.log_date >= CURRENT_DATE - INTERVAL '30 days'
         ORDER BY hl.log_date DESC
     ''', (user_id,))
-    skip_reasons = cur.fetchall()
+    skip_reasons = [dict(row) for row in cur.fetchall()]
+
+    return habit_stats, skip_reasons
 
-    cur.close()
 
+def data_state(cur, user_id):
+    """The user's data version and local date. The pattern features cover
+    the whole history, so these stand in for them in the fingerprint rather
+    than computing the features on every GET."""
+    cur.execute(
+        'SELECT data_version, (NOW() AT TIME ZONE timezone)::date AS today'
+        ' FROM users WHERE id = %s',
+        (user_id,)
+    )
+    row = cur.fetchone()
+    return [row['data_version'], row['today']] if row else None
+
+
+def fingerprint(habit_stats, skip_reasons, state=None):
+    """Hash of everything the model sees, so unchanged data maps to the same
+    cache entry and any new log or skip reason to a new one."""
+    payload = json.dumps(
+        [current_app.config['INSIGHTS_MODEL'], SYSTEM_PROMPT, habit_stats, skip_reasons, state],
+        sort_keys=True, default=str
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def build_prompt(features, skip_reasons):
     # Build the prompt with user's actual data
-    prompt = "Here's my habit data for the last 30 days:\n\n"
+    prompt = "Here's a summary of my habit data (rates are % of days done since each habit started):\n\n"
 
-    prompt += "## Habit Performance\n"
-    for stat in habit_stats:
-        total = stat['completed'] + stat['skipped']
-        rate = (stat['completed'] / total * 100) if total > 0 else 0
-        prompt += f"- {stat['name']}: {stat['completed']} completed, {stat['skipped']} skipped ({rate:.0f}% success)\n"
+    prompt += "## Patterns\n"
+    prompt += format_features(features)
 
-    prompt += "\n## Skip Reasons\n"
-    for skip in skip_reasons:
-        prompt += f"- {skip['name']} on {skip['log_date']}: \"{skip['reason']}\"\n"
+    prompt += "\n## Skip Reasons (themes, times skipped, habits, dates)\n"
+    prompt += format_themes(cluster_reasons(skip_reasons), current_app.config['INSIGHTS_REASON_TOKENS'])
 
     prompt += "\nBased on this data, give me 3 specific insights about my patterns and actionable suggestions. Reference my actual data, not generic advice."
 
-    # Call OpenAI
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[
-            {
-                "role": "system",
-                "content": "You're a supportive habit coach. Give brief, specific insights based only on the user's data. No generic wellness advice. Be warm but concise."
-            },
-            {
-                "role": "user",
-                "content": prompt
-            }
-        ],
-        max_tokens=500
-    )
+    return prompt
 
-    insights_text = response.choices[0].message.content
 
-    return jsonify({
+def build_messages(prompt):
+    return [
+        {
+            "role": "system",
+            "content": SYSTEM_PROMPT
+        },
+        {
+            "role": "user",
+            "content": prompt
+        }
+    ]
+
+
+def stream_model(prompt):
+    """Call OpenAI and yield the reply in pieces as the model writes them.
+    Closing the generator early closes the connection to the model too."""
+    model = current_app.config['INSIGHTS_MODEL']
+    start = time.perf_counter()
+    outcome = 'error'
+    stream = None
+    try:
+        stream = get_client().chat.completions.create(
+            model=model,
+            messages=build_messages(prompt),
+            max_tokens=500,
+            stream=True,
+            stream_options={"include_usage": True}
+        )
+        first = True
+        for chunk in stream:
+            if chunk.usage is not None:
+                llm_tokens.inc(chunk.usage.prompt_tokens, model=model, kind='prompt')
+                llm_tokens.inc(chunk.usage.completion_tokens, model=model, kind='completion')
+            for choice in chunk.choices:
+                if choice.delta.content:
+                    if first:
+                        llm_first_token.observe(time.perf_counter() - start, model=model)
+                        first = False
+                    yield choice.delta.content
+        outcome = 'ok'
+    except GeneratorExit:
+        outcome = 'aborted'
+        raise
+    finally:
+        if stream is not None:
+            stream.close()
+        llm_request_duration.observe(time.perf_counter() - start, model=model, outcome=outcome)
+
+
+def build_result(insights_text, habit_stats, skip_reasons):
+    return {
         "insights": insights_text,
-        "habit_stats": [dict(row) for row in habit_stats],
-        "skip_count": len(skip_reasons)
-    })
+        "habit_stats": habit_stats,
+        "skip_count": len(skip_reasons),
+        "generated_at": datetime.now(timezone.utc).isoformat()
+    }
+
+
+# Background jobs: one insight_jobs row per user is shared by every worker.
+# POST claims it and hands the work to this worker's bounded thread pool,
+# GET reads it back.
+
+def stale_after():
+    """Seconds after which a pending or running insights call is presumed
+    dead and no longer waited for."""
+    return current_app.config['INSIGHTS_TIMEOUT'] * 2
+
+
+def claim_job(cur, user_id):
+    """Mark the user's job pending. Returns False when a job is already
+    pending or running (and isn't stale), so requests don't pile up."""
+    cur.execute(
+        "INSERT INTO insight_jobs (user_id, status, requested_at)"
+        " VALUES (%(user_id)s, 'pending', NOW())"
+        " ON CONFLICT (user_id) DO UPDATE"
+        "   SET status = 'pending', requested_at = NOW(), error = NULL"
+        "   WHERE insight_jobs.status NOT IN ('pending', 'running')"
+        "   OR insight_jobs.requested_at < NOW() - make_interval(secs => %(stale_after)s)"
+        " RETURNING user_id",
+        {'user_id': user_id, 'stale_after': stale_after()}
+    )
+    return cur.fetchone() is not None
+
+
+def finish_job(user_id, status, result=None, error=None, fingerprint=None, owner=None):
+    """Record how the user's job ended. owner is the data fingerprint of the
+    flight that claimed the row: the write is skipped once another flight
+    has claimed it since, so a late leader can't overwrite a newer one.
+    Without owner the write is skipped while any flight is running."""
+    db = get_db()
+    cur = db.cursor()
+    cur.execute(
+        "UPDATE insight_jobs"
+        " SET status = %(status)s, result = COALESCE(%(result)s, result),"
+        "   fingerprint = COALESCE(%(fingerprint)s, fingerprint), error = %(error)s,"
+        "   finished_at = NOW()"
+        " WHERE user_id = %(user_id)s"
+        "   AND (running_fingerprint = %(owner)s"
+        "     OR (%(owner)s::text IS NULL AND status <> 'running'))",
+        {
+            'status': status,
+            'result': Json(result) if result is not None else None,
+            'fingerprint': fingerprint,
+            'error': error,
+            'user_id': user_id,
+            'owner': owner,
+        }
+    )
+    db.commit()
+    cur.close()
+
+
+# Single flight: concurrent requests for the same user and data fingerprint
+# share one model call. Within a worker they follow the leader's Flight
+# (and its tokens); across workers the insight_jobs row, claimed under an
+# advisory lock, says who is running what, and the others wait for its
+# result there.
+
+def get_flights():
+    return get_single_flight('insights')
+
+
+def begin_flight(user_id, data_fingerprint, force=False):
+    """Decide, across workers, who calls the model for user_id's data.
+    Returns ('done', result) when a result for the same data is stored
+    (unless force), ('follow', None) when another worker is already running
+    it, and otherwise marks the row running and returns ('lead', None).
+
+    The advisory lock makes the check and the claim atomic even before the
+    user has a row. It is transaction scoped, so it is held for these few
+    statements and never across the model call."""
+    db = get_db()
+    cur = db.cursor()
+    cur.execute("SELECT pg_advisory_xact_lock(hashtext('insight_jobs'), %s)", (user_id,))
+    cur.execute(
+        "SELECT status, result, fingerprint, running_fingerprint,"
+        "   requested_at > NOW() - make_interval(secs => %s) AS fresh"
+        " FROM insight_jobs WHERE user_id = %s",
+        (stale_after(), user_id)
+    )
+    job = cur.fetchone()
+
+    if job is not None and job['status'] == 'running' and job['fresh'] \
+            and job['running_fingerprint'] == data_fingerprint:
+        outcome = ('follow', None)
+    elif job is not None and not force and job['result'] is not None \
+            and job['fingerprint'] == data_fingerprint:
+        if job['status'] == 'pending':
+            cur.execute(
+                "UPDATE insight_jobs SET status = 'done', finished_at = NOW() WHERE user_id = %s",
+                (user_id,)
+            )
+        outcome = ('done', job['result'])
+    else:
+        cur.execute(
+            "INSERT INTO insight_jobs (user_id, status, running_fingerprint, requested_at)"
+            " VALUES (%(user_id)s, 'running', %(fingerprint)s, NOW())"
+            " ON CONFLICT (user_id) DO UPDATE"
+            "   SET status = 'running', running_fingerprint = EXCLUDED.running_fingerprint,"
+            "   requested_at = NOW(), error = NULL",
+            {'user_id': user_id, 'fingerprint': data_fingerprint}
+        )
+        outcome = ('lead', None)
+
+    db.commit()
+    cur.close()
+    return outcome
+
+
+def wait_for_result(user_id, data_fingerprint, timeout):
+    """Poll the user's row until the worker running data_fingerprint stores
+    its result. The connection goes back to the pool between polls."""
+    deadline = time.monotonic() + timeout
+    delay = 0.05
+    while True:
+        db = get_db()
+        cur = db.cursor()
+        cur.execute(
+            'SELECT status, result, fingerprint, running_fingerprint, error'
+            ' FROM insight_jobs WHERE user_id = %s',
+            (user_id,)
+        )
+        job = cur.fetchone()
+        db.commit()
+        cur.close()
+        close_db()
+
+        if job is None:
+            raise RuntimeError('insights run was abandoned')
+        if job['status'] != 'running' or job['running_fingerprint'] != data_fingerprint:
+            if job['result'] is not None and job['fingerprint'] == data_fingerprint:
+                return job['result']
+            raise RuntimeError(job['error'] or 'insights run was abandoned')
+        if time.monotonic() >= deadline:
+            raise TimeoutError(f'no result after {timeout:g}s')
+        time.sleep(delay)
+        delay = min(delay * 2, 1.0)
+
+
+def lead_flight(app, key, flight, habit_stats, skip_reasons, history, force=False):
+    """Produce the result for key = (user_id, data fingerprint) as this
+    worker's leader, publishing the reply's pieces to flight as they arrive,
+    then finish the flight with the result or error."""
+    user_id, data_fingerprint = key
+    try:
+        with app.app_context():
+            outcome, result = begin_flight(user_id, data_fingerprint, force)
+
+        with app.app_context():
+            if outcome == 'follow':
+                result = wait_for_result(user_id, data_fingerprint, stale_after())
+            elif outcome == 'lead':
+                pieces = []
+                try:
+                    for text in stream_model(build_prompt(compute_features(*history), skip_reasons)):
+                        pieces.append(text)
+                        flight.publish(text)
+                except Exception as e:
+                    finish_job(user_id, 'failed', error=str(e) or type(e).__name__, owner=data_fingerprint)
+                    raise
+                result = build_result(''.join(pieces), habit_stats, skip_reasons)
+
+        with app.app_context():
+            if outcome == 'lead':
+                finish_job(
+                    user_id, 'done', result=result, fingerprint=data_fingerprint, owner=data_fingerprint
+                )
+            get_insights_cache().set(key, result)
+    except Exception as e:
+        app.logger.exception('insights for user %s failed', user_id)
+        flight.finish(error=e)
+    else:
+        flight.finish(result)
+    finally:
+        with app.app_context():
+            get_flights().leave(key, flight)
+
+
+def run_insights_job(app, user_id, force=False):
+    """Generate insights for user_id outside any request. The database
+    connection is only held while reading data and writing the result, not
+    during the model call. Unless force is set, a cached result for the same
+    data fingerprint is reused instead of calling the model, and a call
+    already in flight for it is joined rather than repeated."""
+    try:
+        with app.app_context():
+            db = get_db()
+            cur = db.cursor()
+            habit_stats, skip_reasons = collect_insight_data(cur, user_id)
+            state = data_state(cur, user_id)
+            history = load_history(cur, user_id)
+            db.commit()
+            cur.close()
+
+        with app.app_context():
+            key = (user_id, fingerprint(habit_stats, skip_reasons, state))
+            timeout = stale_after()
+            result = None if force else get_insights_cache().get(key)
+            if result is None:
+                flight, leader = get_flights().join(key)
+
+        if result is None and leader:
+            # finishes the job row too
+            lead_flight(app, key, flight, habit_stats, skip_reasons, history, force)
+            return
+        if result is None:
+            result = flight.wait(timeout)
+    except Exception as e:
+        app.logger.exception('insights job for user %s failed', user_id)
+        with app.app_context():
+            finish_job(user_id, 'failed', error=str(e) or type(e).__name__)
+        return
+
+    with app.app_context():
+        finish_job(user_id, 'done', result=result, fingerprint=key[1])
+
+
+def enqueue_insights(user_id, force=False):
+    """Start an insights job for user_id unless one is in flight. Returns
+    False when this worker's job pool is full."""
+    config = current_app.config
+    runner = get_runner('insights', config['INSIGHTS_WORKERS'], config['INSIGHTS_QUEUE_SIZE'])
+
+    db = get_db()
+    cur = db.cursor()
+    claimed = claim_job(cur, user_id)
+    db.commit()
+
+    if not claimed:
+        cur.close()
+        return True
+
+    app = current_app._get_current_object()
+    if not runner.submit(run_insights_job, app, user_id, force):
+        cur.execute(
+            "UPDATE insight_jobs SET status = 'failed', error = 'busy', finished_at = NOW()"
+            " WHERE user_id = %s",
+            (user_id,)
+        )
+        db.commit()
+        cur.close()
+        return False
+
+    cur.close()
+    return True
+
+
+def job_response(job):
+    body = {"status": job['status']}
+    if job['result']:
+        body.update(job['result'])
+    if job['status'] == 'failed':
+        body['error'] = job['error']
+    return body
+
+
+@bp.route('/', methods=('POST',))
+@login_required
+def request_insights():
+    """Queue insights generation; poll GET /insights/ for the result.
+    ?refresh=1 calls the model even when the data hasn't changed."""
+    force = request.args.get('refresh') in ('1', 'true')
+    if not enqueue_insights(g.user['id'], force):
+        return jsonify({"error": "Insights are busy, try again shortly"}), 503
+    return jsonify({"status": "pending"}), 202
+
+
+@bp.route('/')
+@login_required
+def get_insights():
+    """Return the latest insights. 200 once a result for the user's current
+    data is ready, 202 while a job is pending or running. Starts a job when
+    the user has none yet, their data changed since the last result or
+    failed attempt, or the job in flight is stale (its worker died or it
+    was lost)."""
+    user_id = g.user['id']
+    db = get_db()
+    cur = db.cursor()
+    cur.execute(
+        'SELECT status, result, fingerprint, running_fingerprint, error,'
+        '   requested_at < NOW() - make_interval(secs => %s) AS stale'
+        ' FROM insight_jobs WHERE user_id = %s',
+        (stale_after(), user_id)
+    )
+    job = cur.fetchone()
+
+    if job is not None and job['status'] in ('pending', 'running'):
+        if not job['stale']:
+            cur.close()
+            return jsonify(job_response(job)), 202
+        cur.close()
+        return request_insights()
+
+    habit_stats, skip_reasons = collect_insight_data(cur, user_id)
+    state = data_state(cur, user_id)
+    cur.close()
+    key = (user_id, fingerprint(habit_stats, skip_reasons, state))
+
+    cache = get_insights_cache()
+    cached = cache.get(key)
+    if cached is not None:
+        return jsonify(dict(cached, status='done')), 200
+
+    if (
+        job is None
+        or (job['status'] == 'done' and job['fingerprint'] != key[1])
+        # a failure is retried once the data it failed on has changed
+        or (job['status'] == 'failed' and job['running_fingerprint'] != key[1])
+    ):
+        return request_insights()
+
+    # finished on another worker; keep it here too
+    if job['status'] == 'done':
+        cache.set(key, job['result'])
+    return jsonify(job_response(job)), 200
+
+
+def cached_result(cur, key):
+    """This worker's cached result for key, else the user's stored result
+    when it was made from the same data."""
+    cache = get_insights_cache()
+    result = cache.get(key)
+    if result is not None:
+        return result
+
+    cur.execute(
+        "SELECT result FROM insight_jobs"
+        " WHERE user_id = %s AND fingerprint = %s AND result IS NOT NULL",
+        key
+    )
+    row = cur.fetchone()
+    if row is None:
+        return None
+    cache.set(key, row['result'])
+    return row['result']
+
+
+def sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+def generate_stream(habit_stats, skip_reasons, flight, result, timeout):
+    yield sse('stats', {"habit_stats": habit_stats, "skip_count": len(skip_reasons)})
+    if flight is not None:
+        try:
+            for text in flight.follow(timeout):
+                yield sse('token', {"text": text})
+        except Exception as e:
+            yield sse('error', {"error": str(e) or type(e).__name__})
+            return
+        result = flight.result
+    yield sse('done', dict(result, status='done'))
+
+
+@bp.route('/stream')
+@login_required
+def stream_insights():
+    """Generate insights and stream them as Server-Sent Events: "stats"
+    first, a "token" event per piece of text as the model writes it, then
+    "done" with the full result, or "error". The result is cached and
+    stored like a job's, so GET /insights/ returns it afterwards. A result
+    for the same data is sent as "done" straight away unless ?refresh=1.
+
+    The model call runs in this worker's insights pool. Concurrent streams
+    and jobs for the same data share it: streams in this worker get every
+    token, a call running in another worker only its final "done"."""
+    user_id = g.user['id']
+    force = request.args.get('refresh') in ('1', 'true')
+
+    db = get_db()
+    cur = db.cursor()
+    habit_stats, skip_reasons = collect_insight_data(cur, user_id)
+    state = data_state(cur, user_id)
+    key = (user_id, fingerprint(habit_stats, skip_reasons, state))
+    result = None if force else cached_result(cur, key)
+    history = load_history(cur, user_id) if result is None else None
+    db.commit()
+    cur.close()
+
+    # give the connection back for the length of the model call
+    close_db()
+
+    flight = None
+    if result is None:
+        flights = get_flights()
+        flight, leader = flights.join(key)
+        if leader:
+            config = current_app.config
+            runner = get_runner('insights', config['INSIGHTS_WORKERS'], config['INSIGHTS_QUEUE_SIZE'])
+            app = current_app._get_current_object()
+            if not runner.submit(lead_flight, app, key, flight, habit_stats, skip_reasons, history, force):
+                flight.finish(error=RuntimeError('busy'))
+                flights.leave(key, flight)
+                return jsonify({"error": "Insights are busy, try again shortly"}), 503
+
+    return Response(
+        stream_with_context(generate_stream(habit_stats, skip_reasons, flight, result, stale_after())),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
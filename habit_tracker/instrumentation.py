@@ -0,0 +1,140 @@
+import re
+import time
+
+from flask import current_app, g, has_app_context, request
+from psycopg2.extras import RealDictCursor
+
+from habit_tracker import slow_queries
+from habit_tracker.metrics import db_query_duration, sql_operation
+
+# individual statements kept per request for the slow request log
+SLOWEST_KEPT = 5
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_sql(query, conn=None):
+    """The statement template with whitespace collapsed. Queries are
+    recorded before parameters are bound, so no user values end up in logs."""
+    if isinstance(query, bytes):
+        query = query.decode('utf8', 'replace')
+    elif not isinstance(query, str):
+        query = query.as_string(conn)  # psycopg2.sql.Composable
+    return _WHITESPACE.sub(' ', query).strip()
+
+
+class QueryStats:
+    """Queries run during one app context (normally one request)."""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0  # seconds
+        self.slowest = []  # (seconds, sql), slowest first
+        self.statements = {}  # sql -> [count, seconds]
+
+    def record(self, sql, duration):
+        self.count += 1
+        self.total += duration
+
+        entry = self.statements.setdefault(sql, [0, 0.0])
+        entry[0] += 1
+        entry[1] += duration
+
+        if len(self.slowest) < SLOWEST_KEPT or duration > self.slowest[-1][0]:
+            self.slowest.append((duration, sql))
+            self.slowest.sort(key=lambda item: item[0], reverse=True)
+            del self.slowest[SLOWEST_KEPT:]
+
+    def server_timing(self):
+        header = f'db;dur={self.total * 1000:.2f};desc="{self.count} queries"'
+        if self.slowest:
+            header += f', db-slowest;dur={self.slowest[0][0] * 1000:.2f}'
+        return header
+
+    def report(self):
+        """Repeated statements (the N+1 suspects) and the slowest ones."""
+        lines = []
+        for sql, (count, seconds) in sorted(
+            self.statements.items(), key=lambda item: item[1][1], reverse=True
+        ):
+            lines.append(f'  {count}x {seconds * 1000:.1f}ms  {sql}')
+        lines.append('  slowest:')
+        for seconds, sql in self.slowest:
+            lines.append(f'    {seconds * 1000:.1f}ms  {sql}')
+        return '\n'.join(lines)
+
+
+def current_stats():
+    """QueryStats of the current app context, or None outside one."""
+    if not has_app_context():
+        return None
+    return g.get('query_stats')
+
+
+class InstrumentedCursor(RealDictCursor):
+    """RealDictCursor that times every statement into the current
+    app context's QueryStats and the db_query_duration_seconds metric, and
+    hands slow single statements to slow_queries.capture."""
+
+    def _timed(self, query, run, vars=None, explain=False):
+        start = time.perf_counter()
+        ok = False
+        try:
+            result = run()
+            ok = True
+            return result
+        finally:
+            duration = time.perf_counter() - start
+            sql = normalize_sql(query, self.connection)
+            db_query_duration.observe(duration, operation=sql_operation(sql))
+            stats = current_stats()
+            if stats is not None:
+                stats.record(sql, duration)
+            if ok and explain:
+                slow_queries.capture(self.connection, query, vars, sql, duration)
+
+    def execute(self, query, vars=None):
+        return self._timed(
+            query, lambda: super(InstrumentedCursor, self).execute(query, vars), vars, explain=True
+        )
+
+    def executemany(self, query, vars_list):
+        return self._timed(query, lambda: super(InstrumentedCursor, self).executemany(query, vars_list))
+
+    def copy_expert(self, sql, file, size=8192):
+        return self._timed(sql, lambda: super(InstrumentedCursor, self).copy_expert(sql, file, size))
+
+
+def instrument(conn):
+    """Make conn's cursors instrumented for the current app context and
+    start a fresh QueryStats. Called by get_db on checkout."""
+    if current_app.config['SQL_INSTRUMENTATION']:
+        conn.cursor_factory = InstrumentedCursor
+        g.query_stats = QueryStats()
+    else:
+        conn.cursor_factory = RealDictCursor
+
+
+def emit_query_stats(response):
+    """Add a Server-Timing header with the request's DB time and query
+    count, and log requests over SLOW_REQUEST_QUERIES / SLOW_REQUEST_DB_MS."""
+    stats = g.get('query_stats')
+    if stats is None:
+        return response
+
+    config = current_app.config
+    if config['SERVER_TIMING']:
+        response.headers.add('Server-Timing', stats.server_timing())
+
+    max_queries = config['SLOW_REQUEST_QUERIES']
+    max_ms = config['SLOW_REQUEST_DB_MS']
+    if (max_queries and stats.count > max_queries) or (max_ms and stats.total * 1000 > max_ms):
+        current_app.logger.warning(
+            'slow request %s %s: %d queries, %.1fms in db\n%s',
+            request.method, request.path, stats.count, stats.total * 1000, stats.report()
+        )
+    return response
+
+
+def init_app(app):
+    app.after_request(emit_query_stats)
@@ -0,0 +1,44 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from habit_tracker.workers import per_worker
+
+
+class JobRunner:
+    """Bounded background thread pool for one worker process.
+
+    At most max_workers jobs run at once and at most queue_size more wait;
+    submit() refuses work beyond that instead of queueing without limit."""
+
+    def __init__(self, max_workers=2, queue_size=8, name='jobs'):
+        self.pid = os.getpid()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._slots = threading.BoundedSemaphore(max_workers + queue_size)
+
+    def submit(self, fn, *args, **kwargs):
+        """Run fn in the background. Returns False when the pool is full."""
+        if not self._slots.acquire(blocking=False):
+            return False
+
+        def run():
+            try:
+                fn(*args, **kwargs)
+            finally:
+                self._slots.release()
+
+        try:
+            self._executor.submit(run)
+        except RuntimeError:
+            self._slots.release()
+            raise
+        return True
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+
+def get_runner(name, max_workers, queue_size):
+    """Return this process's JobRunner called name, creating it on first use.
+    A runner inherited across fork has no threads, so it is replaced."""
+    return per_worker(f'jobs_{name}', lambda: JobRunner(max_workers, queue_size, name))
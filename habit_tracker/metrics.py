@@ -0,0 +1,311 @@
+import atexit
+import bisect
+import glob
+import json
+import os
+import threading
+import time
+
+from flask import Blueprint, Response, current_app, g, request
+
+bp = Blueprint('metrics', __name__)
+
+# Prometheus' default latency buckets, in seconds
+DEFAULT_BUCKETS = (.005, .01, .025, .05, .075, .1, .25, .5, .75, 1.0, 2.5, 5.0, 7.5, 10.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class Metric:
+    """One metric family: a value per combination of label values. Every
+    update takes the metric's lock for a dict lookup and an add, nothing
+    more."""
+
+    type = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        self._values = {}  # label values -> value
+        REGISTRY[name] = self
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def samples(self):
+        with self._lock:
+            return [[list(key), self._copy(value)] for key, value in self._values.items()]
+
+    def _copy(self, value):
+        return value
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def set_total(self, value, **labels):
+        """Mirror a count kept elsewhere (e.g. the connection pool's)."""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Gauge(Metric):
+    """Point-in-time value for this worker. Across workers each one is
+    reported separately under a pid label."""
+
+    type = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        # per-bucket (not cumulative) counts, summed up when rendering
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = {'buckets': [0] * (len(self.buckets) + 1), 'sum': 0.0}
+            entry['buckets'][index] += 1
+            entry['sum'] += value
+
+    def _copy(self, value):
+        return {'buckets': list(value['buckets']), 'sum': value['sum']}
+
+
+REGISTRY = {}
+
+request_duration = Histogram(
+    'http_request_duration_seconds', 'Request latency by endpoint.', ('endpoint', 'method')
+)
+requests_total = Counter(
+    'http_requests_total', 'Responses by endpoint and status code.', ('endpoint', 'method', 'status')
+)
+request_exceptions = Counter(
+    'http_request_exceptions_total', 'Requests that ended in an unhandled exception.', ('endpoint',)
+)
+db_query_duration = Histogram(
+    'db_query_duration_seconds', 'SQL statement latency by operation.', ('operation',)
+)
+db_pool_connections = Gauge(
+    'db_pool_connections', 'Connections in this worker\'s pool.', ('state',)
+)
+db_pool_events = Counter(
+    'db_pool_events_total', 'Connection pool checkouts, waits, timeouts and churn.', ('event',)
+)
+llm_request_duration = Histogram(
+    'llm_request_duration_seconds', 'OpenAI call latency.', ('model', 'outcome'),
+    buckets=(.25, .5, 1.0, 2.0, 5.0, 10.0, 20.0, 30.0, 60.0)
+)
+llm_first_token = Histogram(
+    'llm_time_to_first_token_seconds', 'Time from a streamed OpenAI call to its first token.', ('model',),
+    buckets=(.1, .25, .5, 1.0, 2.0, 5.0, 10.0)
+)
+llm_tokens = Counter(
+    'llm_tokens_total', 'OpenAI tokens used.', ('model', 'kind')
+)
+
+
+def sql_operation(sql):
+    """First keyword of a normalized statement: SELECT, INSERT, WITH, ..."""
+    return sql.split(' ', 1)[0].upper() if sql else 'UNKNOWN'
+
+
+def update_pool_metrics():
+    from habit_tracker.db import pool_stats
+
+    stats = pool_stats()
+    if stats is None:
+        return
+    for state in ('size', 'idle', 'in_use'):
+        db_pool_connections.set(stats[state], state=state)
+    for event in ('checkouts', 'waits', 'timeouts', 'connections_created',
+                  'connections_discarded', 'health_check_failures'):
+        db_pool_events.set_total(stats[event], event=event)
+
+
+# Multiprocess mode: with METRICS_DIR set every worker writes its metrics to
+# METRICS_DIR/metrics_<pid>.json and /metrics merges all the files, so a
+# scrape sees the whole server whichever worker answers it. Files of exited
+# workers are kept so counters never go backwards; empty the directory when
+# the server (re)starts.
+
+_flush_lock = threading.Lock()
+_last_flush = [0.0]
+
+
+def snapshot():
+    return {
+        'pid': os.getpid(),
+        'metrics': {name: metric.samples() for name, metric in REGISTRY.items()},
+    }
+
+
+def write_snapshot(directory):
+    data = snapshot()
+    path = os.path.join(directory, f"metrics_{data['pid']}.json")
+    tmp = f'{path}.tmp'
+    with _flush_lock:
+        with open(tmp, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp, path)
+        _last_flush[0] = time.monotonic()
+
+
+def read_snapshots(directory):
+    snapshots = []
+    for path in glob.glob(os.path.join(directory, 'metrics_*.json')):
+        try:
+            with open(path) as f:
+                snapshots.append(json.load(f))
+        except (OSError, ValueError):
+            continue  # being replaced, or a worker died mid-write
+    return snapshots
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def merge(snapshots):
+    """{name: {label values: value}} over every worker. Counters and
+    histograms are summed; gauges of live workers get a pid label."""
+    merged = {name: {} for name in REGISTRY}
+    for data in snapshots:
+        alive = data['pid'] == os.getpid() or _alive(data['pid'])
+        for name, samples in data['metrics'].items():
+            metric = REGISTRY.get(name)
+            if metric is None:
+                continue
+            values = merged[name]
+            for key, value in samples:
+                if metric.type == 'gauge':
+                    if alive:
+                        values[tuple(key) + (str(data['pid']),)] = value
+                elif metric.type == 'counter':
+                    values[tuple(key)] = values.get(tuple(key), 0) + value
+                else:
+                    entry = values.setdefault(tuple(key), {'buckets': [0] * len(value['buckets']), 'sum': 0.0})
+                    entry['buckets'] = [a + b for a, b in zip(entry['buckets'], value['buckets'])]
+                    entry['sum'] += value['sum']
+    return merged
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render(values_by_name, pid_label=False):
+    """Text exposition format for {name: {label values: value}}."""
+    lines = []
+    for name, metric in REGISTRY.items():
+        lines.append(f'# HELP {name} {metric.help}')
+        lines.append(f'# TYPE {name} {metric.type}')
+        names = metric.labels
+        if metric.type == 'gauge' and pid_label:
+            names = names + ('pid',)
+        for key, value in sorted(values_by_name.get(name, {}).items()):
+            if metric.type != 'histogram':
+                lines.append(f'{name}{_labels(names, key)} {_number(value)}')
+                continue
+            cumulative = 0
+            for bound, count in zip(metric.buckets + (float('inf'),), value['buckets']):
+                cumulative += count
+                le = ('le', _number(bound))
+                lines.append(f'{name}_bucket{_labels(names, key, [le])} {cumulative}')
+            lines.append(f'{name}_sum{_labels(names, key)} {_number(value["sum"])}')
+            lines.append(f'{name}_count{_labels(names, key)} {cumulative}')
+    return '\n'.join(lines) + '\n'
+
+
+def collect():
+    update_pool_metrics()
+    directory = current_app.config['METRICS_DIR']
+    if not directory:
+        values = {name: {tuple(k): v for k, v in metric.samples()} for name, metric in REGISTRY.items()}
+        return render(values)
+    write_snapshot(directory)
+    return render(merge(read_snapshots(directory)), pid_label=True)
+
+
+@bp.route('/metrics')
+def metrics():
+    return Response(collect(), content_type=CONTENT_TYPE)
+
+
+def start_timer():
+    g.request_started = time.perf_counter()
+
+
+def record_request(response):
+    started = g.pop('request_started', None)
+    if started is None:
+        return response
+
+    endpoint = request.endpoint or 'unmatched'
+    request_duration.observe(time.perf_counter() - started, endpoint=endpoint, method=request.method)
+    requests_total.inc(endpoint=endpoint, method=request.method, status=response.status_code)
+
+    directory = current_app.config['METRICS_DIR']
+    if directory and time.monotonic() - _last_flush[0] >= current_app.config['METRICS_FLUSH_INTERVAL']:
+        update_pool_metrics()
+        write_snapshot(directory)
+    return response
+
+
+def record_exception(exc):
+    if exc is not None:
+        request_exceptions.inc(endpoint=request.endpoint or 'unmatched')
+
+
+def init_app(app):
+    app.before_request(start_timer)
+    app.after_request(record_request)
+    app.teardown_request(record_exception)
+    app.register_blueprint(bp)
+
+    directory = app.config['METRICS_DIR']
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+        atexit.register(write_snapshot, directory)
@@ -0,0 +1,179 @@
+import os
+import re
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from habit_tracker.db import _connect
+
+# migrations live in habit_tracker/migrations as NNNN_name.sql and run in
+# version order; each one is recorded in schema_migrations once applied
+MIGRATIONS_DIR = 'migrations'
+MIGRATION_FILE = re.compile(r'^(\d+)_(\w+)\.sql$')
+
+# first line of a migration that must run outside a transaction, e.g. one
+# using CREATE INDEX CONCURRENTLY; its statements run one at a time
+NO_TRANSACTION = '-- migrate: no-transaction'
+
+# pg_advisory_lock key, so two deploys can't migrate at the same time
+LOCK_KEY = 72630013
+
+CONCURRENT_INDEX = re.compile(
+    r'CREATE\s+(?:UNIQUE\s+)?INDEX\s+CONCURRENTLY\s+IF\s+NOT\s+EXISTS\s+(\w+)', re.I
+)
+
+
+def list_migrations():
+    """Return [(version, name, path)] for every migration file, in order."""
+    directory = os.path.join(current_app.root_path, MIGRATIONS_DIR)
+    migrations = []
+    for filename in os.listdir(directory):
+        match = MIGRATION_FILE.match(filename)
+        if match:
+            migrations.append((match.group(1), match.group(2), os.path.join(directory, filename)))
+    return sorted(migrations)
+
+
+def split_statements(sql):
+    """Split a migration into statements on semicolons, dropping comment
+    lines. Good enough for DDL; don't put function bodies in no-transaction
+    migrations."""
+    lines = [line for line in sql.splitlines() if not line.strip().startswith('--')]
+    return [s.strip() for s in '\n'.join(lines).split(';') if s.strip()]
+
+
+def ensure_migrations_table(cur):
+    cur.execute(
+        'CREATE TABLE IF NOT EXISTS schema_migrations ('
+        '   version VARCHAR(20) PRIMARY KEY,'
+        '   name TEXT NOT NULL,'
+        '   applied_at TIMESTAMPTZ NOT NULL DEFAULT NOW()'
+        ')'
+    )
+
+
+def applied_versions(cur):
+    cur.execute('SELECT version FROM schema_migrations')
+    return {row['version'] for row in cur.fetchall()}
+
+
+def record_migration(cur, version, name):
+    cur.execute(
+        'INSERT INTO schema_migrations (version, name) VALUES (%s, %s)'
+        ' ON CONFLICT (version) DO NOTHING',
+        (version, name)
+    )
+
+
+def stamp(cur):
+    """Mark every migration as applied, for a database just created from
+    schema.sql (which already matches the latest migration)."""
+    ensure_migrations_table(cur)
+    for version, name, _ in list_migrations():
+        record_migration(cur, version, name)
+
+
+def _drop_invalid_index(cur, statement):
+    # a failed CREATE INDEX CONCURRENTLY leaves an INVALID index behind, which
+    # IF NOT EXISTS would then silently keep
+    match = CONCURRENT_INDEX.search(statement)
+    if match is None:
+        return
+    cur.execute(
+        'SELECT NOT i.indisvalid AS invalid FROM pg_index i'
+        ' JOIN pg_class c ON c.oid = i.indexrelid'
+        ' WHERE c.relname = %s AND pg_catalog.pg_table_is_visible(c.oid)',
+        (match.group(1),)
+    )
+    row = cur.fetchone()
+    if row and row['invalid']:
+        cur.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {match.group(1)}')
+
+
+def _apply(conn, version, name, path):
+    with open(path, encoding='utf8') as f:
+        sql = f.read()
+
+    cur = conn.cursor()
+    if sql.startswith(NO_TRANSACTION):
+        conn.autocommit = True
+        for statement in split_statements(sql):
+            _drop_invalid_index(cur, statement)
+            cur.execute(statement)
+        record_migration(cur, version, name)
+    else:
+        conn.autocommit = False
+        try:
+            cur.execute(sql)
+            record_migration(cur, version, name)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.autocommit = True
+    cur.close()
+
+
+def upgrade(echo=None):
+    """Apply every pending migration in order on a dedicated connection.
+    Returns the versions applied."""
+    conn = _connect(current_app.config)
+    conn.autocommit = True
+    cur = conn.cursor()
+    cur.execute('SELECT pg_advisory_lock(%s)', (LOCK_KEY,))
+    try:
+        ensure_migrations_table(cur)
+        done = applied_versions(cur)
+        applied = []
+        for version, name, path in list_migrations():
+            if version in done:
+                continue
+            if echo:
+                echo(f'Applying {version}_{name}...')
+            _apply(conn, version, name, path)
+            applied.append(version)
+        return applied
+    finally:
+        cur.execute('SELECT pg_advisory_unlock(%s)', (LOCK_KEY,))
+        cur.close()
+        conn.close()
+
+
+def migration_status():
+    """Return [(version, name, applied)] for every migration."""
+    conn = _connect(current_app.config)
+    conn.autocommit = True
+    cur = conn.cursor()
+    try:
+        ensure_migrations_table(cur)
+        done = applied_versions(cur)
+    finally:
+        cur.close()
+        conn.close()
+    return [(version, name, version in done) for version, name, _ in list_migrations()]
+
+
+db_cli = AppGroup('db', help='Schema migrations.')
+
+
+@db_cli.command('upgrade')
+def upgrade_command():
+    """Apply pending migrations."""
+    applied = upgrade(echo=click.echo)
+    if applied:
+        click.echo(f'Applied {len(applied)} migration(s).')
+    else:
+        click.echo('Database is up to date.')
+
+
+@db_cli.command('status')
+def status_command():
+    """List migrations and whether each has been applied."""
+    for version, name, applied in migration_status():
+        click.echo(f"{'applied' if applied else 'pending'}  {version}_{name}")
+
+
+def init_app(app):
+    app.cli.add_command(db_cli)
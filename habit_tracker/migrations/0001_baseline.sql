@@ -0,0 +1,84 @@
+-- Baseline: every table as of the first migration. Databases created from
+-- schema.sql before migrations existed already have most of these; IF NOT
+-- EXISTS only fills in what's missing.
+
+CREATE SEQUENCE IF NOT EXISTS habit_family_seq;
+
+CREATE TABLE IF NOT EXISTS users (
+    id SERIAL PRIMARY KEY,
+    username VARCHAR(50) UNIQUE NOT NULL,
+    password VARCHAR(255) NOT NULL,
+    list_view BOOLEAN DEFAULT TRUE,
+    timezone VARCHAR(50) DEFAULT 'UTC',
+    tier_order INTEGER[] NOT NULL DEFAULT '{1,2,3}'
+);
+
+CREATE TABLE IF NOT EXISTS challenges (
+    id SERIAL PRIMARY KEY,
+    creator_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    title VARCHAR(100) NOT NULL,
+    body TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS habits (
+    id SERIAL PRIMARY KEY,
+    creator_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    challenge_id INTEGER REFERENCES challenges(id) ON DELETE CASCADE,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    name VARCHAR(100) NOT NULL,
+    notes TEXT,
+    display_order INTEGER,
+    stage INTEGER NOT NULL DEFAULT 1,
+    family_id INTEGER NOT NULL DEFAULT nextval('habit_family_seq'),
+    cascades_to INTEGER REFERENCES habits(id) ON DELETE SET NULL,
+    tier INTEGER NOT NULL DEFAULT 1 CHECK (tier IN (1, 2, 3)),
+    time_of_day INTEGER DEFAULT NULL CHECK (time_of_day BETWEEN 1 AND 4),
+    merged BOOLEAN DEFAULT FALSE
+);
+
+CREATE TABLE IF NOT EXISTS habit_logs (
+    log_date DATE NOT NULL,
+    habit_id INTEGER NOT NULL REFERENCES habits(id) ON DELETE CASCADE,
+    status VARCHAR(20) NOT NULL DEFAULT 'completed',
+    reason TEXT,
+    PRIMARY KEY (habit_id, log_date)
+);
+
+CREATE TABLE IF NOT EXISTS habit_streaks (
+    habit_id INTEGER PRIMARY KEY REFERENCES habits(id) ON DELETE CASCADE,
+    run_start DATE,
+    current_length INTEGER NOT NULL DEFAULT 0,
+    longest_length INTEGER NOT NULL DEFAULT 0,
+    last_completed DATE
+);
+
+-- completed/skipped counts per habit per day, week and month, kept in step
+-- with habit_logs by every write and backfilled by `flask rebuild-rollups`
+CREATE TABLE IF NOT EXISTS habit_rollups (
+    habit_id INTEGER NOT NULL REFERENCES habits(id) ON DELETE CASCADE,
+    grain VARCHAR(5) NOT NULL CHECK (grain IN ('day', 'week', 'month')),
+    period_start DATE NOT NULL,
+    completed INTEGER NOT NULL DEFAULT 0,
+    skipped INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (habit_id, grain, period_start)
+);
+
+-- ancestor closure of the cascades_to chains, rebuilt whenever a link changes
+CREATE TABLE IF NOT EXISTS habit_cascades (
+    habit_id INTEGER NOT NULL REFERENCES habits(id) ON DELETE CASCADE,
+    ancestor_id INTEGER NOT NULL REFERENCES habits(id) ON DELETE CASCADE,
+    depth INTEGER NOT NULL,
+    PRIMARY KEY (habit_id, ancestor_id)
+);
+
+-- latest insights job per user, shared by all workers
+CREATE TABLE IF NOT EXISTS insight_jobs (
+    user_id INTEGER PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+    status VARCHAR(20) NOT NULL DEFAULT 'pending',
+    fingerprint TEXT,
+    result JSONB,
+    error TEXT,
+    requested_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    finished_at TIMESTAMPTZ
+);
@@ -0,0 +1,31 @@
+-- migrate: no-transaction
+-- Secondary indexes for the hot per-user queries. Built CONCURRENTLY so
+-- writes to these tables keep going while the indexes are built.
+
+-- every "WHERE creator_id = %s" on habits, and get_families'
+-- DISTINCT ON (family_id) ... ORDER BY family_id, stage
+CREATE INDEX CONCURRENTLY IF NOT EXISTS habits_creator_family_stage_idx
+    ON habits (creator_id, family_id, stage);
+
+-- skip / undo_skip / merge: "WHERE family_id = %s AND stage >= %s"
+CREATE INDEX CONCURRENTLY IF NOT EXISTS habits_family_stage_idx
+    ON habits (family_id, stage);
+
+-- challenge stats: "WHERE challenge_id = %s"
+CREATE INDEX CONCURRENTLY IF NOT EXISTS habits_challenge_idx
+    ON habits (challenge_id) WHERE challenge_id IS NOT NULL;
+
+-- ON DELETE SET NULL of cascades_to, and looking up a habit's children
+CREATE INDEX CONCURRENTLY IF NOT EXISTS habits_cascades_to_idx
+    ON habits (cascades_to) WHERE cascades_to IS NOT NULL;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS challenges_creator_idx
+    ON challenges (creator_id);
+
+-- skip reasons for insights: skipped logs of a habit in a date range
+CREATE INDEX CONCURRENTLY IF NOT EXISTS habit_logs_skipped_idx
+    ON habit_logs (habit_id, log_date) WHERE status = 'skipped';
+
+-- ON DELETE CASCADE of habit_cascades.ancestor_id
+CREATE INDEX CONCURRENTLY IF NOT EXISTS habit_cascades_ancestor_idx
+    ON habit_cascades (ancestor_id);
@@ -0,0 +1,3 @@
+-- Per-user counter bumped after every write to the user's habits or
+-- challenges; read endpoints derive their ETag from it.
+ALTER TABLE users ADD COLUMN IF NOT EXISTS data_version BIGINT NOT NULL DEFAULT 0;
@@ -0,0 +1,23 @@
+-- habit_logs as intervals: one row per run of consecutive days with the
+-- same status, kept in step by every write (see runs.py)
+CREATE TABLE IF NOT EXISTS habit_runs (
+    habit_id INTEGER NOT NULL REFERENCES habits(id) ON DELETE CASCADE,
+    start_date DATE NOT NULL,
+    end_date DATE NOT NULL,
+    status VARCHAR(20) NOT NULL,
+    PRIMARY KEY (habit_id, start_date),
+    CHECK (end_date >= start_date)
+);
+
+-- backfill from the existing logs
+INSERT INTO habit_runs (habit_id, start_date, end_date, status)
+SELECT habit_id, MIN(log_date), MAX(log_date), status
+FROM (
+    SELECT habit_id, status, log_date,
+           log_date - (ROW_NUMBER() OVER (
+               PARTITION BY habit_id, status ORDER BY log_date
+           ))::int AS run_key
+    FROM habit_logs
+) days
+GROUP BY habit_id, status, run_key
+ON CONFLICT (habit_id, start_date) DO NOTHING;
@@ -0,0 +1,4 @@
+-- Fingerprint of the data an insights call is running for, so requests
+-- from other workers for the same data wait for its result instead of
+-- calling the model again.
+ALTER TABLE insight_jobs ADD COLUMN IF NOT EXISTS running_fingerprint TEXT;
@@ -0,0 +1,213 @@
+import numpy as np
+import pandas as pd
+
+# labels the frontend uses for habits.time_of_day (NULL is "any time")
+TIME_OF_DAY = {0: 'any time', 1: 'morning', 2: 'afternoon', 3: 'evening', 4: 'night'}
+WEEKDAYS = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
+
+# rolling windows, in days, and the weeks a trend is fitted over
+WINDOWS = (7, 30, 90)
+TREND_WEEKS = 12
+HABIT_TREND_WEEKS = 8
+
+# longest habit list put in the prompt, worst 30-day rate first
+MAX_HABITS = 25
+
+
+def load_history(cur, user_id):
+    """All of a user's habits and logs as DataFrames, plus the user's local
+    date. Two queries however long the history is."""
+    cur.execute(
+        'SELECT h.id, h.name, h.tier, h.stage, h.family_id,'
+        '   COALESCE(h.time_of_day, 0) AS time_of_day,'
+        '   (h.created_at AT TIME ZONE u.timezone)::date AS created,'
+        '   (NOW() AT TIME ZONE u.timezone)::date AS today'
+        ' FROM habits h'
+        ' JOIN users u ON u.id = h.creator_id'
+        ' WHERE h.creator_id = %s'
+        ' ORDER BY h.id',
+        (user_id,)
+    )
+    habits = pd.DataFrame(
+        cur.fetchall(),
+        columns=['id', 'name', 'tier', 'stage', 'family_id', 'time_of_day', 'created', 'today']
+    )
+
+    cur.execute(
+        'SELECT hl.habit_id, hl.log_date, hl.status'
+        ' FROM habit_logs hl'
+        ' JOIN habits h ON h.id = hl.habit_id'
+        ' WHERE h.creator_id = %s',
+        (user_id,)
+    )
+    logs = pd.DataFrame(cur.fetchall(), columns=['habit_id', 'log_date', 'status'])
+
+    today = habits['today'].iloc[0] if len(habits) else None
+    return habits.drop(columns='today'), logs, today
+
+
+def _rate(done, valid):
+    """Percentage done of valid days, or None when there were none."""
+    done, valid = int(done), int(valid)
+    return round(done * 100 / valid) if valid else None
+
+
+def _slope(done, valid):
+    """Least-squares slope, in percentage points per week, of weekly rates.
+    done and valid are (..., weeks); weeks without valid days are left out."""
+    rates = np.divide(done * 100.0, valid, out=np.full(valid.shape, np.nan), where=valid > 0)
+    weeks = np.arange(rates.shape[-1])
+    mask = ~np.isnan(rates)
+    if mask.sum() < 3:
+        return None
+    slope, _ = np.polyfit(weeks[mask], rates[mask], 1)
+    return round(float(slope), 1) + 0.0  # no -0.0
+
+
+def compute_features(habits, logs, today):
+    """Completion features over the user's whole history, computed on a
+    habits x days matrix. A day is valid for a habit from its creation (or
+    first log, for imported history) up to today; only completed days count
+    as done."""
+    if habits.empty or today is None:
+        return {'habits': []}
+
+    today = np.datetime64(today, 'D')
+    created = habits['created'].to_numpy(dtype='datetime64[D]')
+    if not logs.empty:
+        log_dates = logs['log_date'].to_numpy(dtype='datetime64[D]')
+        first_log = (
+            pd.Series(log_dates, index=logs['habit_id'].to_numpy())
+            .groupby(level=0).min()
+            .reindex(habits['id']).to_numpy(dtype='datetime64[D]')
+        )
+        start_dates = np.where(np.isnat(first_log), created, np.minimum(created, first_log))
+    else:
+        start_dates = created
+    start_dates = np.minimum(start_dates, today)
+
+    start = start_dates.min()
+    days = np.arange(start, today + np.timedelta64(1, 'D'), dtype='datetime64[D]')
+    valid = days[np.newaxis, :] >= start_dates[:, np.newaxis]
+
+    done = np.zeros(valid.shape, dtype=bool)
+    skipped = np.zeros(valid.shape, dtype=bool)
+    if not logs.empty:
+        in_range = (log_dates >= start) & (log_dates <= today)
+        rows = pd.Index(habits['id']).get_indexer(logs['habit_id'])[in_range]
+        cols = (log_dates[in_range] - start).astype(int)
+        status = logs['status'].to_numpy()[in_range]
+        done[rows[status == 'completed'], cols[status == 'completed']] = True
+        skipped[rows[status == 'skipped'], cols[status == 'skipped']] = True
+    done &= valid
+
+    features = {'days_tracked': len(days)}
+
+    # rolling windows, overall and per habit
+    habit_rates = {}
+    overall = {}
+    for window in WINDOWS:
+        w_done = done[:, -window:].sum(axis=1)
+        w_valid = valid[:, -window:].sum(axis=1)
+        overall[f'{window}d'] = _rate(w_done.sum(), w_valid.sum())
+        habit_rates[window] = (w_done, w_valid)
+    overall['all'] = _rate(done.sum(), valid.sum())
+    features['rates'] = overall
+    features['skipped_30d'] = int(skipped[:, -30:].sum())
+
+    # weekly totals, oldest week first, ending today
+    weeks = min(TREND_WEEKS, len(days) // 7)
+    if weeks:
+        tail = slice(len(days) - weeks * 7, None)
+        week_done = done[:, tail].reshape(len(habits), weeks, 7).sum(axis=2)
+        week_valid = valid[:, tail].reshape(len(habits), weeks, 7).sum(axis=2)
+        features['trend'] = _slope(week_done.sum(axis=0), week_valid.sum(axis=0))
+        habit_weeks = min(HABIT_TREND_WEEKS, weeks)
+        habit_slopes = [
+            _slope(week_done[row, -habit_weeks:], week_valid[row, -habit_weeks:])
+            for row in range(len(habits))
+        ]
+    else:
+        features['trend'] = None
+        habit_slopes = [None] * len(habits)
+
+    # weekday profile over the whole history
+    weekday = (days.view('int64') + 3) % 7  # 1970-01-01 was a Thursday
+    features['weekdays'] = {
+        WEEKDAYS[d]: _rate(done[:, weekday == d].sum(), valid[:, weekday == d].sum())
+        for d in range(7)
+    }
+
+    # the same per habit, then grouped by time of day, tier and stage
+    per_habit = habits[['id', 'name', 'tier', 'stage', 'time_of_day']].copy()
+    per_habit['done'] = done.sum(axis=1)
+    per_habit['valid'] = valid.sum(axis=1)
+    for key, column in (('time_of_day', 'time_of_day'), ('tier', 'tier'), ('stage', 'stage')):
+        grouped = per_habit.groupby(column)[['done', 'valid']].sum()
+        features[key] = {
+            (TIME_OF_DAY.get(value, str(value)) if key == 'time_of_day' else int(value)): {
+                'rate': _rate(row['done'], row['valid']),
+                'habits': int((per_habit[column] == value).sum()),
+            }
+            for value, row in grouped.iterrows()
+        }
+
+    # days since each habit was last done
+    last_done = np.where(done.any(axis=1), len(days) - 1 - np.argmax(done[:, ::-1], axis=1), -1)
+    gaps = np.where(last_done >= 0, len(days) - 1 - last_done, -1)
+
+    features['habits'] = [
+        {
+            'name': row['name'],
+            'rate_7d': _rate(habit_rates[7][0][i], habit_rates[7][1][i]),
+            'rate_30d': _rate(habit_rates[30][0][i], habit_rates[30][1][i]),
+            'done_30d': int(habit_rates[30][0][i]),
+            'valid_30d': int(habit_rates[30][1][i]),
+            'trend': habit_slopes[i],
+            'days_since_done': int(gaps[i]) if gaps[i] >= 0 else None,
+        }
+        for i, row in enumerate(habits.to_dict('records'))
+    ]
+    return features
+
+
+def _pct(rate):
+    return 'n/a' if rate is None else f'{rate}%'
+
+
+def _trend(slope):
+    return 'n/a' if slope is None else f'{slope:+.1f} pts/wk'
+
+
+def format_features(features):
+    """The features as a few dense prompt lines."""
+    if not features['habits']:
+        return "No habits yet.\n"
+
+    rates = features['rates']
+    lines = [
+        f"Overall completion: 7d {_pct(rates['7d'])}, 30d {_pct(rates['30d'])},"
+        f" 90d {_pct(rates['90d'])}, all {_pct(rates['all'])} over {features['days_tracked']} days;"
+        f" trend {_trend(features['trend'])}; {features['skipped_30d']} skips in 30d",
+        'By weekday: ' + ', '.join(f'{day} {_pct(rate)}' for day, rate in features['weekdays'].items()),
+    ]
+    for key, label in (('time_of_day', 'By time of day'), ('tier', 'By tier'), ('stage', 'By stage')):
+        lines.append(f'{label}: ' + ', '.join(
+            f"{value} {_pct(group['rate'])} ({group['habits']})"
+            for value, group in features[key].items()
+        ))
+
+    habits = sorted(
+        features['habits'],
+        key=lambda h: (h['rate_30d'] is None, h['rate_30d'] if h['rate_30d'] is not None else 0)
+    )
+    lines.append('Habits (30d done/days, 7d, trend, days since done):')
+    for habit in habits[:MAX_HABITS]:
+        since = 'never' if habit['days_since_done'] is None else habit['days_since_done']
+        lines.append(
+            f"- {habit['name']}: {habit['done_30d']}/{habit['valid_30d']} ({_pct(habit['rate_30d'])}),"
+            f" 7d {_pct(habit['rate_7d'])}, {_trend(habit['trend'])}, {since}"
+        )
+    if len(habits) > MAX_HABITS:
+        lines.append(f'- ...and {len(habits) - MAX_HABITS} more habits doing better')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,108 @@
+import click
+from flask.cli import with_appcontext
+
+from habit_tracker.db import get_db
+
+
+# Granularities kept in habit_rollups; each is a valid date_trunc field
+GRAINS = ('day', 'week', 'month')
+
+# Recount the habit_rollups rows covering every (habit_id, log_date) pair,
+# at every grain. Periods that no longer have any logs are deleted.
+REFRESH_ROLLUPS_SQL = '''
+    WITH touched AS (
+        SELECT DISTINCT t.habit_id, g.grain,
+               date_trunc(g.grain, t.log_date)::date AS period_start
+        FROM unnest(%(habit_ids)s::int[], %(log_dates)s::date[]) AS t(habit_id, log_date)
+        CROSS JOIN unnest(%(grains)s::text[]) AS g(grain)
+    ),
+    counts AS (
+        SELECT t.habit_id, t.grain, t.period_start,
+               COUNT(hl.habit_id) FILTER (WHERE hl.status = 'completed') AS completed,
+               COUNT(hl.habit_id) FILTER (WHERE hl.status = 'skipped') AS skipped
+        FROM touched t
+        LEFT JOIN habit_logs hl
+            ON hl.habit_id = t.habit_id
+           AND hl.log_date >= t.period_start
+           AND hl.log_date < t.period_start + ('1 ' || t.grain)::interval
+        GROUP BY t.habit_id, t.grain, t.period_start
+    ),
+    emptied AS (
+        DELETE FROM habit_rollups r
+        USING counts c
+        WHERE r.habit_id = c.habit_id
+          AND r.grain = c.grain
+          AND r.period_start = c.period_start
+          AND c.completed + c.skipped = 0
+    )
+    INSERT INTO habit_rollups (habit_id, grain, period_start, completed, skipped)
+    SELECT habit_id, grain, period_start, completed, skipped
+    FROM counts
+    WHERE completed + skipped > 0
+    ON CONFLICT (habit_id, grain, period_start) DO UPDATE SET
+        completed = EXCLUDED.completed,
+        skipped = EXCLUDED.skipped
+'''
+
+# Recount every period of the habits in habit_ids from scratch
+REBUILD_ROLLUPS_SQL = '''
+    WITH cleared AS (
+        DELETE FROM habit_rollups WHERE habit_id = ANY(%(habit_ids)s)
+    )
+    INSERT INTO habit_rollups (habit_id, grain, period_start, completed, skipped)
+    SELECT hl.habit_id, g.grain, date_trunc(g.grain, hl.log_date)::date,
+           COUNT(*) FILTER (WHERE hl.status = 'completed'),
+           COUNT(*) FILTER (WHERE hl.status = 'skipped')
+    FROM habit_logs hl
+    CROSS JOIN unnest(%(grains)s::text[]) AS g(grain)
+    WHERE hl.habit_id = ANY(%(habit_ids)s)
+    GROUP BY hl.habit_id, g.grain, date_trunc(g.grain, hl.log_date)
+    ON CONFLICT (habit_id, grain, period_start) DO UPDATE SET
+        completed = EXCLUDED.completed,
+        skipped = EXCLUDED.skipped
+'''
+
+
+def refresh_rollups(cur, pairs):
+    """Bring habit_rollups up to date after logs were written or deleted for
+    (habit_id, log_date) pairs. Only the day, week and month containing each
+    date are recounted."""
+    pairs = list(set(pairs))
+    if not pairs:
+        return
+    cur.execute(REFRESH_ROLLUPS_SQL, {
+        'habit_ids': [habit_id for habit_id, _ in pairs],
+        'log_dates': [log_date for _, log_date in pairs],
+        'grains': list(GRAINS),
+    })
+
+
+def rebuild_rollups(batch_size=500):
+    """Recompute habit_rollups for every habit. Returns the number of habits."""
+    db = get_db()
+    cur = db.cursor()
+
+    cur.execute('SELECT id FROM habits ORDER BY id')
+    habit_ids = [row['id'] for row in cur.fetchall()]
+
+    for i in range(0, len(habit_ids), batch_size):
+        cur.execute(REBUILD_ROLLUPS_SQL, {
+            'habit_ids': habit_ids[i:i + batch_size],
+            'grains': list(GRAINS),
+        })
+        db.commit()
+
+    cur.close()
+    return len(habit_ids)
+
+
+@click.command('rebuild-rollups')
+@with_appcontext
+def rebuild_rollups_command():
+    """Backfill the habit_rollups table from habit_logs."""
+    count = rebuild_rollups()
+    click.echo(f'Rebuilt rollups for {count} habits.')
+
+
+def init_app(app):
+    app.cli.add_command(rebuild_rollups_command)
@@ -0,0 +1,207 @@
+import click
+from flask.cli import with_appcontext
+
+from habit_tracker.db import get_db
+
+
+# habit_runs holds habit_logs as intervals: one row per maximal run of
+# consecutive days with the same status. A year of daily completions is one
+# row instead of 365.
+
+# Gaps-and-islands over habit_logs, per status, for the habits in habit_ids
+REBUILD_RUNS_SQL = '''
+    WITH cleared AS (
+        DELETE FROM habit_runs WHERE habit_id = ANY(%(habit_ids)s)
+    ),
+    days AS (
+        SELECT habit_id, status, log_date,
+               log_date - (ROW_NUMBER() OVER (
+                   PARTITION BY habit_id, status ORDER BY log_date
+               ))::int AS run_key
+        FROM habit_logs
+        WHERE habit_id = ANY(%(habit_ids)s)
+    )
+    INSERT INTO habit_runs (habit_id, start_date, end_date, status)
+    SELECT habit_id, MIN(log_date), MAX(log_date), status
+    FROM days
+    GROUP BY habit_id, status, run_key
+    ON CONFLICT (habit_id, start_date) DO UPDATE SET
+        end_date = EXCLUDED.end_date,
+        status = EXCLUDED.status
+'''
+
+# The changed (habit_id, log_date) pairs, passed as two parallel arrays
+CHANGED_DAYS_CTE = '''
+    days AS (
+        SELECT DISTINCT habit_id, log_date
+        FROM unnest(%(habit_ids)s::int[], %(days)s::date[]) AS d(habit_id, log_date)
+    )
+'''
+
+# Cut the changed days out of the runs covering them (a run may lose several
+# days and fall into several pieces), then put each changed day's current
+# log back as a one-day run
+SPLIT_DAYS_SQL = '''
+    WITH ''' + CHANGED_DAYS_CTE + ''',
+    removed AS (
+        DELETE FROM habit_runs r
+        USING days d
+        WHERE r.habit_id = d.habit_id
+          AND r.start_date <= d.log_date
+          AND r.end_date >= d.log_date
+        RETURNING r.habit_id, r.start_date, r.end_date, r.status
+    ),
+    cuts AS (
+        SELECT DISTINCT r.habit_id, r.start_date, r.end_date, r.status, d.log_date
+        FROM removed r
+        JOIN days d ON d.habit_id = r.habit_id
+            AND d.log_date BETWEEN r.start_date AND r.end_date
+    ),
+    pieces AS (
+        -- before each cut, from the previous cut (or the run's start)
+        SELECT habit_id, status,
+               COALESCE(LAG(log_date) OVER w + 1, start_date) AS piece_start,
+               log_date - 1 AS piece_end
+        FROM cuts
+        WINDOW w AS (PARTITION BY habit_id, start_date ORDER BY log_date)
+        UNION ALL
+        -- after the last cut
+        SELECT habit_id, status, MAX(log_date) + 1, end_date
+        FROM cuts
+        GROUP BY habit_id, start_date, end_date, status
+    )
+    INSERT INTO habit_runs (habit_id, start_date, end_date, status)
+    SELECT habit_id, piece_start, piece_end, status
+    FROM pieces
+    WHERE piece_start <= piece_end
+    UNION ALL
+    SELECT l.habit_id, l.log_date, l.log_date, l.status
+    FROM habit_logs l
+    JOIN days d ON d.habit_id = l.habit_id AND d.log_date = l.log_date
+'''
+
+# Merge runs of the same status that now touch: every run from the day
+# before each habit's first changed day to the day after its last is
+# regrouped, gaps-and-islands style, over runs instead of days
+MERGE_DAYS_SQL = '''
+    WITH ''' + CHANGED_DAYS_CTE + ''',
+    bounds AS (
+        SELECT habit_id, MIN(log_date) - 1 AS lo, MAX(log_date) + 1 AS hi
+        FROM days
+        GROUP BY habit_id
+    ),
+    nearby AS (
+        DELETE FROM habit_runs r
+        USING bounds b
+        WHERE r.habit_id = b.habit_id
+          AND r.end_date >= b.lo
+          AND r.start_date <= b.hi
+        RETURNING r.habit_id, r.start_date, r.end_date, r.status
+    ),
+    flagged AS (
+        SELECT habit_id, start_date, end_date, status,
+               CASE WHEN LAG(end_date) OVER w = start_date - 1
+                     AND LAG(status) OVER w = status
+                    THEN 0 ELSE 1 END AS starts_run
+        FROM nearby
+        WINDOW w AS (PARTITION BY habit_id ORDER BY start_date)
+    ),
+    grouped AS (
+        SELECT habit_id, start_date, end_date, status,
+               SUM(starts_run) OVER (PARTITION BY habit_id ORDER BY start_date) AS run
+        FROM flagged
+    )
+    INSERT INTO habit_runs (habit_id, start_date, end_date, status)
+    SELECT habit_id, MIN(start_date), MAX(end_date), status
+    FROM grouped
+    GROUP BY habit_id, run, status
+'''
+
+# above this many changed days the merge window can span most of a habit's
+# history, so rebuilding the habits from habit_logs is no more work
+MAX_INCREMENTAL_DAYS = 32
+
+# completed/skipped days per habit between start and end, clipped from runs
+RANGE_COUNTS_SQL = '''
+    SELECT habit_id,
+           COALESCE(SUM(days) FILTER (WHERE status = 'completed'), 0)::int AS completed,
+           COALESCE(SUM(days) FILTER (WHERE status = 'skipped'), 0)::int AS skipped
+    FROM (
+        SELECT habit_id, status,
+               LEAST(end_date, %(end)s::date) - GREATEST(start_date, %(start)s::date) + 1 AS days
+        FROM habit_runs
+        WHERE habit_id = ANY(%(habit_ids)s)
+          AND start_date <= %(end)s
+          AND end_date >= %(start)s
+    ) clipped
+    GROUP BY habit_id
+'''
+
+
+def rebuild_habit_runs(cur, habit_ids):
+    """Recompute every run of habit_ids from habit_logs."""
+    habit_ids = list(set(habit_ids))
+    if habit_ids:
+        cur.execute(REBUILD_RUNS_SQL, {'habit_ids': habit_ids})
+
+
+def refresh_runs(cur, pairs):
+    """Bring habit_runs in line with habit_logs after logs were written or
+    deleted for (habit_id, log_date) pairs. The changed days are cut out of
+    their old runs and put back under their new status, then merged with
+    their neighbours: two statements however many pairs, and only the runs
+    near the changed days change. Large batches rebuild their habits instead.
+
+    Call before refresh_streaks / record_completions, which read the runs."""
+    pairs = sorted(set(pairs))
+    if not pairs:
+        return
+    if len(pairs) > MAX_INCREMENTAL_DAYS:
+        rebuild_habit_runs(cur, [habit_id for habit_id, _ in pairs])
+        return
+    params = {
+        'habit_ids': [habit_id for habit_id, _ in pairs],
+        'days': [log_date for _, log_date in pairs],
+    }
+    cur.execute(SPLIT_DAYS_SQL, params)
+    cur.execute(MERGE_DAYS_SQL, params)
+
+
+def get_range_counts(cur, habit_ids, start, end):
+    """Return {habit_id: {'completed', 'skipped'}} for days between start and
+    end inclusive, for every id in habit_ids."""
+    counts = {habit_id: {'completed': 0, 'skipped': 0} for habit_id in habit_ids}
+    if not counts:
+        return counts
+    cur.execute(RANGE_COUNTS_SQL, {'habit_ids': list(counts), 'start': start, 'end': end})
+    for row in cur.fetchall():
+        counts[row['habit_id']] = {'completed': row['completed'], 'skipped': row['skipped']}
+    return counts
+
+
+def rebuild_runs(batch_size=500):
+    """Recompute habit_runs for every habit. Returns the number of habits."""
+    db = get_db()
+    cur = db.cursor()
+
+    cur.execute('SELECT id FROM habits ORDER BY id')
+    habit_ids = [row['id'] for row in cur.fetchall()]
+
+    for i in range(0, len(habit_ids), batch_size):
+        rebuild_habit_runs(cur, habit_ids[i:i + batch_size])
+        db.commit()
+
+    cur.close()
+    return len(habit_ids)
+
+
+@click.command('rebuild-runs')
+@with_appcontext
+def rebuild_runs_command():
+    """Backfill the habit_runs table from habit_logs."""
+    count = rebuild_runs()
+    click.echo(f'Rebuilt runs for {count} habits.')
+
+
+def init_app(app):
+    app.cli.add_command(rebuild_runs_command)
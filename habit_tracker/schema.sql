@@ -1,3 +1,9 @@
+DROP TABLE IF EXISTS schema_migrations;
+DROP TABLE IF EXISTS insight_jobs;
+DROP TABLE IF EXISTS habit_runs;
+DROP TABLE IF EXISTS habit_rollups;
+DROP TABLE IF EXISTS habit_cascades;
+DROP TABLE IF EXISTS habit_streaks;
 DROP TABLE IF EXISTS habit_logs;
 DROP TABLE IF EXISTS habits;
 DROP TABLE IF EXISTS challenges;
@@ -12,7 +18,8 @@ CREATE TABLE users (
     password VARCHAR(255) NOT NULL,
     list_view BOOLEAN DEFAULT TRUE,
     timezone VARCHAR(50) DEFAULT 'UTC',
-    tier_order INTEGER[] NOT NULL DEFAULT '{1,2,3}'
+    tier_order INTEGER[] NOT NULL DEFAULT '{1,2,3}',
+    data_version BIGINT NOT NULL DEFAULT 0  -- bumped by writes, see versioning.py
 );
 
 CREATE TABLE challenges (
@@ -46,4 +53,63 @@ CREATE TABLE habit_logs (
     status VARCHAR(20) NOT NULL DEFAULT 'completed',
     reason TEXT,                                                                                                
     PRIMARY KEY (habit_id, log_date)                                                                                                                                      
-);     
\ No newline at end of file
+);
+
+CREATE TABLE habit_streaks (
+    habit_id INTEGER PRIMARY KEY REFERENCES habits(id) ON DELETE CASCADE,
+    run_start DATE,
+    current_length INTEGER NOT NULL DEFAULT 0,
+    longest_length INTEGER NOT NULL DEFAULT 0,
+    last_completed DATE
+);
+
+-- completed/skipped counts per habit per day, week and month, kept in step
+-- with habit_logs by every write and backfilled by `flask rebuild-rollups`
+CREATE TABLE habit_rollups (
+    habit_id INTEGER NOT NULL REFERENCES habits(id) ON DELETE CASCADE,
+    grain VARCHAR(5) NOT NULL CHECK (grain IN ('day', 'week', 'month')),
+    period_start DATE NOT NULL,
+    completed INTEGER NOT NULL DEFAULT 0,
+    skipped INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (habit_id, grain, period_start)
+);
+
+-- ancestor closure of the cascades_to chains, rebuilt whenever a link changes
+CREATE TABLE habit_cascades (
+    habit_id INTEGER NOT NULL REFERENCES habits(id) ON DELETE CASCADE,
+    ancestor_id INTEGER NOT NULL REFERENCES habits(id) ON DELETE CASCADE,
+    depth INTEGER NOT NULL,
+    PRIMARY KEY (habit_id, ancestor_id)
+);
+
+-- habit_logs as runs of consecutive days with the same status, kept in
+-- step by every write (see runs.py)
+CREATE TABLE habit_runs (
+    habit_id INTEGER NOT NULL REFERENCES habits(id) ON DELETE CASCADE,
+    start_date DATE NOT NULL,
+    end_date DATE NOT NULL,
+    status VARCHAR(20) NOT NULL,
+    PRIMARY KEY (habit_id, start_date),
+    CHECK (end_date >= start_date)
+);
+
+-- latest insights job per user, shared by all workers
+CREATE TABLE insight_jobs (
+    user_id INTEGER PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+    status VARCHAR(20) NOT NULL DEFAULT 'pending',
+    fingerprint TEXT,
+    running_fingerprint TEXT,
+    result JSONB,
+    error TEXT,
+    requested_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    finished_at TIMESTAMPTZ
+);
+
+-- keep in step with migrations/0002_indexes.sql
+CREATE INDEX habits_creator_family_stage_idx ON habits (creator_id, family_id, stage);
+CREATE INDEX habits_family_stage_idx ON habits (family_id, stage);
+CREATE INDEX habits_challenge_idx ON habits (challenge_id) WHERE challenge_id IS NOT NULL;
+CREATE INDEX habits_cascades_to_idx ON habits (cascades_to) WHERE cascades_to IS NOT NULL;
+CREATE INDEX challenges_creator_idx ON challenges (creator_id);
+CREATE INDEX habit_logs_skipped_idx ON habit_logs (habit_id, log_date) WHERE status = 'skipped';
+CREATE INDEX habit_cascades_ancestor_idx ON habit_cascades (ancestor_id);
@@ -0,0 +1,97 @@
+import os
+import threading
+import time
+
+from habit_tracker.workers import per_worker
+
+
+class Flight:
+    """One in-flight computation. Its leader publishes pieces of output as
+    they are produced and then finishes with a result or an error; any
+    number of followers replay the pieces and get the same outcome."""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self.pieces = []
+        self.finished = False
+        self.result = None
+        self.error = None
+
+    def publish(self, piece):
+        with self._cond:
+            self.pieces.append(piece)
+            self._cond.notify_all()
+
+    def finish(self, result=None, error=None):
+        with self._cond:
+            self.result = result
+            self.error = error
+            self.finished = True
+            self._cond.notify_all()
+
+    def follow(self, timeout):
+        """Yield every piece, those already published first, until the
+        flight finishes. Raises the leader's error, or TimeoutError when it
+        hasn't finished within timeout seconds."""
+        deadline = time.monotonic() + timeout
+        seen = 0
+        while True:
+            with self._cond:
+                ready = self._cond.wait_for(
+                    lambda: len(self.pieces) > seen or self.finished,
+                    deadline - time.monotonic()
+                )
+                if not ready:
+                    raise TimeoutError(f'no result after {timeout:g}s')
+                pieces = self.pieces[seen:]
+                finished = self.finished
+            yield from pieces
+            seen += len(pieces)
+            if finished:
+                break
+        if self.error is not None:
+            raise self.error
+
+    def wait(self, timeout):
+        """The flight's result once it finishes; see follow()."""
+        for _ in self.follow(timeout):
+            pass
+        return self.result
+
+
+class SingleFlight:
+    """Coalesces concurrent work on the same key within one worker process.
+
+    The first caller of join() for a key leads: it does the work, finishes
+    the Flight and calls leave(). Callers arriving meanwhile get the same
+    Flight to follow instead of starting their own."""
+
+    def __init__(self):
+        self.pid = os.getpid()
+        self._lock = threading.Lock()
+        self._flights = {}
+
+    def join(self, key):
+        """Return (flight, leader)."""
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                return flight, False
+            flight = self._flights[key] = Flight()
+            return flight, True
+
+    def leave(self, key, flight):
+        """Forget a finished flight, so the next join() starts a new one."""
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+
+    def __len__(self):
+        with self._lock:
+            return len(self._flights)
+
+
+def get_single_flight(name):
+    """Return this process's SingleFlight called name, creating it on first
+    use. One inherited across fork is replaced: its leaders aren't here."""
+    return per_worker(f'single_flight_{name}', SingleFlight)
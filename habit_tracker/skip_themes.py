@@ -0,0 +1,167 @@
+import math
+import re
+from collections import Counter
+
+import numpy as np
+
+# words that don't tell one reason from another ("was tired", "too tired")
+STOPWORDS = frozenset('''
+    a am an and are at be been but bit felt feel feeling i im i'm it its kind
+    little me my of really so some the to too very was were just quite pretty
+'''.split())
+
+# cosine similarity of character trigram TF-IDF vectors above which a reason
+# joins a theme
+SIMILARITY = 0.5
+
+# distinct reasons clustered; rarer ones are only counted
+MAX_DISTINCT = 1000
+
+# longest reason quoted in the prompt, in characters
+MAX_REASON_CHARS = 60
+
+# room kept for the "...N more skips in M themes" line
+SUMMARY_TOKENS = 10
+
+_NON_WORD = re.compile(r"[^\w\s']+")
+
+
+def normalize(reason):
+    return ' '.join(_NON_WORD.sub(' ', reason.lower()).split())
+
+
+def _grams(text):
+    """Character trigrams of each word, padded with spaces so word starts
+    and ends count. Stopwords are dropped unless that leaves nothing."""
+    words = [w for w in text.split() if w not in STOPWORDS] or text.split()
+    grams = []
+    for word in words:
+        padded = f' {word} '
+        grams.extend(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def tfidf(texts):
+    """L2-normalized TF-IDF matrix of texts over their character trigrams,
+    one row per text."""
+    vocab = {}
+    rows, cols = [], []
+    for row, text in enumerate(texts):
+        for gram in _grams(text):
+            rows.append(row)
+            cols.append(vocab.setdefault(gram, len(vocab)))
+
+    matrix = np.zeros((len(texts), len(vocab)), dtype=np.float32)
+    np.add.at(matrix, (np.array(rows, dtype=np.intp), np.array(cols, dtype=np.intp)), 1)
+    df = (matrix > 0).sum(axis=0)
+    matrix *= np.log((1 + len(texts)) / (1 + df)).astype(np.float32) + 1
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return np.divide(matrix, norms, out=np.zeros_like(matrix), where=norms > 0)
+
+
+def cluster_reasons(skip_reasons, threshold=SIMILARITY):
+    """Group skip_reasons (rows with name, reason and log_date) into themes,
+    most frequent first: {label, count, variants, habits, first, last}.
+
+    Distinct normalized reasons are taken most frequent first; each joins
+    the theme whose centroid it is most similar to, or starts a new one."""
+    rows = [(normalize(skip['reason'] or ''), skip) for skip in skip_reasons]
+    rows = [(text, skip) for text, skip in rows if text]
+    counts = Counter(text for text, _ in rows)
+    distinct = [text for text, _ in counts.most_common(MAX_DISTINCT)]
+    vectors = tfidf(distinct)
+
+    theme_of = {}
+    sums = np.zeros(vectors.shape, dtype=np.float32)
+    centroids = np.zeros(vectors.shape, dtype=np.float32)
+    themes = 0
+    for i, text in enumerate(distinct):
+        vector = vectors[i] * counts[text]
+        best = -1
+        if themes and vectors[i].any():
+            similarity = centroids[:themes] @ vectors[i]
+            best = int(np.argmax(similarity))
+            if similarity[best] < threshold:
+                best = -1
+        if best < 0:
+            best = themes
+            themes += 1
+        theme_of[text] = best
+        sums[best] += vector
+        norm = np.linalg.norm(sums[best])
+        centroids[best] = sums[best] / norm if norm else sums[best]
+
+    # each normalized reason is shown as it was first written
+    shown = {}
+    grouped = {}
+    for text, skip in rows:
+        shown.setdefault(text, skip['reason'].strip())
+        theme = grouped.setdefault(theme_of.get(text, -1), {
+            'variants': Counter(), 'habits': Counter(), 'dates': [],
+        })
+        theme['variants'][text] += 1
+        theme['habits'][skip['name']] += 1
+        theme['dates'].append(skip['log_date'])
+
+    result = []
+    for index, theme in grouped.items():
+        variants = [shown[text] for text, _ in theme['variants'].most_common()]
+        result.append({
+            'label': variants[0] if index >= 0 else 'other one-off reasons',
+            'count': len(theme['dates']),
+            'variants': variants[1:] if index >= 0 else [],
+            'habits': theme['habits'].most_common(),
+            'first': min(theme['dates']),
+            'last': max(theme['dates']),
+        })
+    result.sort(key=lambda theme: (-theme['count'], theme['label']))
+    return result
+
+
+def estimate_tokens(text):
+    """Rough token count for English text: about four characters a token."""
+    return math.ceil(len(text) / 4)
+
+
+def _quote(reason):
+    if len(reason) > MAX_REASON_CHARS:
+        reason = reason[:MAX_REASON_CHARS - 3].rstrip() + '...'
+    return '"' + reason.replace('"', "'") + '"'
+
+
+def _date(day):
+    return f'{day:%b} {day.day}'
+
+
+def format_theme(theme):
+    habits = ', '.join(f'{name} {count}' for name, count in theme['habits'][:3])
+    if len(theme['habits']) > 3:
+        habits += ', ...'
+    span = _date(theme['first'])
+    if theme['last'] != theme['first']:
+        span += f"-{_date(theme['last'])}"
+    line = f"- {_quote(theme['label'])} x{theme['count']} ({habits}), {span}"
+    if theme['variants']:
+        line += '; also ' + ', '.join(_quote(v) for v in theme['variants'][:2])
+    return line
+
+
+def format_themes(themes, max_tokens):
+    """Themes as prompt lines, most frequent first, within max_tokens. What
+    doesn't fit is summed up in a last line."""
+    if not themes:
+        return "None.\n"
+
+    lines = []
+    used = 0
+    for i, theme in enumerate(themes):
+        line = format_theme(theme)
+        cost = estimate_tokens(line + '\n')
+        reserve = SUMMARY_TOKENS if i + 1 < len(themes) else 0
+        if used + cost + reserve > max_tokens:
+            left = themes[i:]
+            lines.append(f"- ...{sum(t['count'] for t in left)} more skips in {len(left)} themes")
+            break
+        lines.append(line)
+        used += cost
+    return '\n'.join(lines) + '\n'
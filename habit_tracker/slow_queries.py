@@ -0,0 +1,216 @@
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+from datetime import datetime, timezone
+
+import click
+import psycopg2
+from flask import current_app, has_app_context, has_request_context, request
+from flask.cli import with_appcontext
+from psycopg2.extras import RealDictCursor
+
+# literals that vary between runs of the same hand-written statement
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PLACEHOLDER_LIST = re.compile(r'\(\s*(?:%s|\?)(?:\s*,\s*(?:%s|\?))+\s*\)')
+_NAMED_PLACEHOLDER = re.compile(r'%\(\w+\)s')
+
+# statements EXPLAIN ANALYZE may run again: it executes them for real
+_READ_ONLY = re.compile(r'^\s*(SELECT|WITH)\b', re.I)
+_WRITES = re.compile(r'\b(INSERT|UPDATE|DELETE|MERGE)\b', re.I)
+
+SAVEPOINT = 'slow_query_explain'
+
+
+def fingerprint(sql):
+    """Hash of a normalized statement with its literals and placeholder
+    lists folded, so every run of the same query shares one fingerprint."""
+    text = _STRING.sub('?', sql)
+    text = _NUMBER.sub('?', text)
+    text = _NAMED_PLACEHOLDER.sub('?', text)
+    text = _PLACEHOLDER_LIST.sub('(...)', text.replace('%s', '?'))
+    return hashlib.md5(text.encode()).hexdigest()[:16]
+
+
+def _shape(value):
+    if isinstance(value, (list, tuple)):
+        return f'{type(value).__name__}[{len(value)}]'
+    return type(value).__name__
+
+
+def params_shape(vars):
+    """Types of the bound parameters, never their values."""
+    if vars is None:
+        return None
+    if isinstance(vars, dict):
+        return {key: _shape(value) for key, value in vars.items()}
+    return [_shape(value) for value in vars]
+
+
+class RateLimit:
+    """At most `per_minute` captures per worker, refilled continuously."""
+
+    def __init__(self, per_minute):
+        self.per_minute = per_minute
+        self._lock = threading.Lock()
+        self._tokens = float(per_minute)
+        self._updated = time.monotonic()
+
+    def allow(self):
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.per_minute, self._tokens + (now - self._updated) * self.per_minute / 60)
+            self._updated = now
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+def get_rate_limit():
+    limit = current_app.extensions.get('slow_query_rate_limit')
+    if limit is None:
+        limit = RateLimit(current_app.config['SLOW_QUERY_MAX_PER_MINUTE'])
+        current_app.extensions['slow_query_rate_limit'] = limit
+    return limit
+
+
+def explain(conn, query, vars, analyze=False):
+    """Plan of query as text lines. With analyze, read-only statements get
+    EXPLAIN (ANALYZE, BUFFERS), which runs them again; writes always get a
+    plain EXPLAIN. Runs in a savepoint so a failure can't abort the caller's
+    transaction."""
+    analyze = analyze and _READ_ONLY.match(query) and not _WRITES.search(query)
+    options = '(ANALYZE, BUFFERS)' if analyze else ''
+    in_transaction = not conn.autocommit
+
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    try:
+        if in_transaction:
+            cur.execute(f'SAVEPOINT {SAVEPOINT}')
+        try:
+            cur.execute(f'EXPLAIN {options} {query}', vars)
+            plan = [row['QUERY PLAN'] for row in cur.fetchall()]
+        finally:
+            if in_transaction:
+                cur.execute(f'ROLLBACK TO SAVEPOINT {SAVEPOINT}')
+                cur.execute(f'RELEASE SAVEPOINT {SAVEPOINT}')
+    finally:
+        cur.close()
+    return plan
+
+
+_log_lock = threading.Lock()
+
+
+def log_path():
+    return current_app.config['SLOW_QUERY_LOG'] or os.path.join(current_app.instance_path, 'slow_queries.jsonl')
+
+
+def capture(conn, query, vars, sql, duration):
+    """Record a statement that took longer than SLOW_QUERY_MS, sampled by
+    SLOW_QUERY_SAMPLE_RATE and limited to SLOW_QUERY_MAX_PER_MINUTE."""
+    if not has_app_context():
+        return
+    config = current_app.config
+    threshold = config['SLOW_QUERY_MS']
+    if not threshold or duration * 1000 < threshold:
+        return
+    if random.random() >= config['SLOW_QUERY_SAMPLE_RATE'] or not get_rate_limit().allow():
+        return
+
+    if isinstance(query, bytes):
+        query = query.decode('utf8', 'replace')
+    elif not isinstance(query, str):
+        query = query.as_string(conn)  # psycopg2.sql.Composable
+    try:
+        plan = explain(conn, query, vars, analyze=config['SLOW_QUERY_ANALYZE'])
+    except psycopg2.Error as e:
+        plan = [f'EXPLAIN failed: {e}'.strip()]
+
+    entry = {
+        'at': datetime.now(timezone.utc).isoformat(),
+        'fingerprint': fingerprint(sql),
+        'sql': sql,
+        'params': params_shape(vars),
+        'ms': round(duration * 1000, 2),
+        'endpoint': request.endpoint if has_request_context() else None,
+        'plan': plan,
+    }
+    with _log_lock:
+        with open(log_path(), 'a', encoding='utf8') as f:
+            f.write(json.dumps(entry) + '\n')
+
+
+def read_log(path):
+    with open(path, encoding='utf8') as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue  # a line cut short by a crash
+
+
+def aggregate(entries):
+    """Per fingerprint: count, total/max ms, endpoints and the plan of its
+    slowest capture. Sorted by total time, worst first."""
+    groups = {}
+    for entry in entries:
+        group = groups.get(entry['fingerprint'])
+        if group is None:
+            group = groups[entry['fingerprint']] = {
+                'fingerprint': entry['fingerprint'],
+                'sql': entry['sql'],
+                'count': 0,
+                'total_ms': 0.0,
+                'max_ms': 0.0,
+                'endpoints': set(),
+                'params': entry['params'],
+                'plan': entry['plan'],
+                'last_seen': entry['at'],
+            }
+        group['count'] += 1
+        group['total_ms'] += entry['ms']
+        group['last_seen'] = max(group['last_seen'], entry['at'])
+        if entry['endpoint']:
+            group['endpoints'].add(entry['endpoint'])
+        if entry['ms'] >= group['max_ms']:
+            group['max_ms'] = entry['ms']
+            group['plan'] = entry['plan']
+            group['params'] = entry['params']
+    return sorted(groups.values(), key=lambda group: group['total_ms'], reverse=True)
+
+
+@click.command('slow-queries')
+@click.option('--limit', default=10, show_default=True, help='Fingerprints to show.')
+@click.option('--plans/--no-plans', default=True, help='Print the slowest plan of each.')
+@with_appcontext
+def slow_queries_command(limit, plans):
+    """Summarize captured slow queries by fingerprint, worst first."""
+    path = log_path()
+    if not os.path.exists(path):
+        click.echo(f'No slow queries captured yet ({path}).')
+        return
+
+    for group in aggregate(read_log(path))[:limit]:
+        mean = group['total_ms'] / group['count']
+        click.echo(
+            f"{group['fingerprint']}  {group['count']}x  total {group['total_ms']:.1f}ms"
+            f"  mean {mean:.1f}ms  max {group['max_ms']:.1f}ms"
+            f"  last {group['last_seen']}"
+        )
+        click.echo(f"  endpoints: {', '.join(sorted(group['endpoints'])) or '-'}")
+        click.echo(f"  params: {json.dumps(group['params'])}")
+        click.echo(f"  {group['sql']}")
+        if plans:
+            for line in group['plan']:
+                click.echo(f'    {line}')
+        click.echo()
+
+
+def init_app(app):
+    app.cli.add_command(slow_queries_command)
@@ -0,0 +1,211 @@
+from datetime import timedelta
+
+import click
+from flask.cli import with_appcontext
+
+from habit_tracker.db import get_db
+
+
+# Completed runs of the habits in %(habit_ids)s, read from habit_runs (see
+# runs.py), which every write keeps as maximal intervals of consecutive days.
+RUNS_CTE = '''
+    runs AS (
+        SELECT habit_id, start_date, end_date,
+               end_date - start_date + 1 AS length
+        FROM habit_runs
+        WHERE habit_id = ANY(%(habit_ids)s)
+          AND status = 'completed'
+    )
+'''
+
+STREAK_RUNS_SQL = 'WITH' + RUNS_CTE + '''
+    SELECT habit_id,
+           MAX(length) AS longest_streak,
+           MAX(LEAST(end_date, %(as_of)s) - start_date + 1) FILTER (
+               WHERE start_date <= %(as_of)s
+                 AND end_date >= %(as_of)s - %(grace_days)s
+           ) AS current_streak
+    FROM runs
+    GROUP BY habit_id
+'''
+
+# Rebuild the habit_streaks row of every habit in habit_ids from its runs
+REFRESH_STREAKS_SQL = 'WITH' + RUNS_CTE + ''',
+    latest AS (
+        SELECT DISTINCT ON (habit_id) habit_id, start_date, end_date, length
+        FROM runs
+        ORDER BY habit_id, end_date DESC
+    ),
+    longest AS (
+        SELECT habit_id, MAX(length) AS length
+        FROM runs
+        GROUP BY habit_id
+    )
+    INSERT INTO habit_streaks
+        (habit_id, run_start, current_length, longest_length, last_completed)
+    SELECT h.id, l.start_date, COALESCE(l.length, 0), COALESCE(m.length, 0), l.end_date
+    FROM habits h
+    LEFT JOIN latest l ON l.habit_id = h.id
+    LEFT JOIN longest m ON m.habit_id = h.id
+    WHERE h.id = ANY(%(habit_ids)s)
+    ON CONFLICT (habit_id) DO UPDATE SET
+        run_start = EXCLUDED.run_start,
+        current_length = EXCLUDED.current_length,
+        longest_length = EXCLUDED.longest_length,
+        last_completed = EXCLUDED.last_completed
+'''
+
+
+def refresh_streaks(cur, habit_ids):
+    """Recompute the habit_streaks rows for habit_ids from habit_runs."""
+    habit_ids = list(set(habit_ids))
+    if habit_ids:
+        cur.execute(REFRESH_STREAKS_SQL, {'habit_ids': habit_ids})
+
+
+def record_completions(cur, habit_ids, log_date):
+    """Update habit_streaks after completion logs for log_date were inserted
+    for habit_ids.
+
+    Completing the day after the latest run extends it and a later day starts
+    a new run, both without reading any runs. Backfilled days can join
+    older runs, so those habits are recomputed instead."""
+    habit_ids = list(set(habit_ids))
+    if not habit_ids:
+        return
+
+    cur.execute(
+        'UPDATE habit_streaks SET'
+        '   run_start = CASE WHEN last_completed = %(day_before)s'
+        '       THEN run_start ELSE %(log_date)s END,'
+        '   current_length = CASE WHEN last_completed = %(day_before)s'
+        '       THEN current_length + 1 ELSE 1 END,'
+        '   longest_length = GREATEST(longest_length, CASE WHEN last_completed = %(day_before)s'
+        '       THEN current_length + 1 ELSE 1 END),'
+        '   last_completed = %(log_date)s'
+        ' WHERE habit_id = ANY(%(habit_ids)s)'
+        ' AND (last_completed IS NULL OR last_completed < %(log_date)s)'
+        ' RETURNING habit_id',
+        {
+            'habit_ids': habit_ids,
+            'log_date': log_date,
+            'day_before': log_date - timedelta(days=1),
+        }
+    )
+    updated = {row['habit_id'] for row in cur.fetchall()}
+
+    refresh_streaks(cur, [habit_id for habit_id in habit_ids if habit_id not in updated])
+
+
+def record_completed_days(cur, pairs):
+    """record_completions for (habit_id, log_date) pairs that may span several
+    dates. One date takes the incremental path; several dates are rebuilt
+    for the affected habits in one statement."""
+    dates = {log_date for _, log_date in pairs}
+    if len(dates) == 1:
+        record_completions(cur, [habit_id for habit_id, _ in pairs], dates.pop())
+    elif dates:
+        refresh_streaks(cur, [habit_id for habit_id, _ in pairs])
+
+
+def _current_from_projection(row, as_of, grace):
+    """Current streak as of as_of from a habit_streaks row, or None when the
+    answer lies in an older run than the one stored."""
+    start, end = row['run_start'], row['last_completed']
+    if end is None:
+        return 0
+    if start <= as_of <= end:
+        return (as_of - start).days + 1
+    if as_of > end:
+        if grace and end == as_of - timedelta(days=1):
+            return row['current_length']
+        return 0
+    # the latest run starts after as_of; the day after a gap is never completed
+    if not grace and start == as_of + timedelta(days=1):
+        return 0
+    return None
+
+
+def get_streaks(cur, habit_ids, as_of, grace=False):
+    """Return {habit_id: {'current_streak', 'longest_streak'}} for every id in
+    habit_ids.
+
+    The current streak counts back from as_of. With grace=True a run that
+    ended the day before as_of still counts, so a habit that just hasn't been
+    done yet today keeps yesterday's streak.
+
+    Streaks are read from habit_streaks. Habits without a row, or asked about
+    a date before their latest run, are computed from habit_runs in a single
+    extra query."""
+    streaks = {
+        habit_id: {'current_streak': 0, 'longest_streak': 0}
+        for habit_id in habit_ids
+    }
+    if not streaks:
+        return streaks
+
+    cur.execute(
+        'SELECT habit_id, run_start, current_length, longest_length, last_completed'
+        ' FROM habit_streaks'
+        ' WHERE habit_id = ANY(%s)',
+        (list(streaks),)
+    )
+    missing = set(streaks)
+    for row in cur.fetchall():
+        current = _current_from_projection(row, as_of, grace)
+        if current is None:
+            continue
+        streaks[row['habit_id']] = {
+            'current_streak': current,
+            'longest_streak': row['longest_length'],
+        }
+        missing.discard(row['habit_id'])
+
+    if missing:
+        cur.execute(STREAK_RUNS_SQL, {
+            'habit_ids': list(missing),
+            'as_of': as_of,
+            'grace_days': 1 if grace else 0,
+        })
+        for row in cur.fetchall():
+            streaks[row['habit_id']] = {
+                'current_streak': row['current_streak'] or 0,
+                'longest_streak': row['longest_streak'] or 0,
+            }
+
+    return streaks
+
+
+def attach_current_streaks(cur, habits, as_of, grace=False):
+    """Set habit['curr_streak'] on each habit dict."""
+    streaks = get_streaks(cur, [h['id'] for h in habits], as_of, grace)
+    for habit in habits:
+        habit['curr_streak'] = streaks[habit['id']]['current_streak']
+
+
+def rebuild_streaks(batch_size=500):
+    """Recompute habit_streaks for every habit. Returns the number of habits."""
+    db = get_db()
+    cur = db.cursor()
+
+    cur.execute('SELECT id FROM habits ORDER BY id')
+    habit_ids = [row['id'] for row in cur.fetchall()]
+
+    for i in range(0, len(habit_ids), batch_size):
+        refresh_streaks(cur, habit_ids[i:i + batch_size])
+        db.commit()
+
+    cur.close()
+    return len(habit_ids)
+
+
+@click.command('rebuild-streaks')
+@with_appcontext
+def rebuild_streaks_command():
+    """Backfill the habit_streaks table from habit_runs."""
+    count = rebuild_streaks()
+    click.echo(f'Rebuilt streaks for {count} habits.')
+
+
+def init_app(app):
+    app.cli.add_command(rebuild_streaks_command)
@@ -0,0 +1,84 @@
+import functools
+import hashlib
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+from flask import current_app, g, make_response, request
+
+from habit_tracker.db import get_db
+
+# blueprints whose non-GET requests change what the read endpoints return
+VERSIONED_BLUEPRINTS = {'habits', 'challenges', 'importer'}
+
+SAFE_METHODS = {'GET', 'HEAD', 'OPTIONS'}
+
+
+def get_data_version(user_id):
+    db = get_db()
+    cur = db.cursor()
+    cur.execute('SELECT data_version FROM users WHERE id = %s', (user_id,))
+    row = cur.fetchone()
+    cur.close()
+    return row['data_version'] if row else 0
+
+
+def bump_data_version(user_id):
+    """Invalidate every ETag handed out for user_id."""
+    db = get_db()
+    cur = db.cursor()
+    cur.execute('UPDATE users SET data_version = data_version + 1 WHERE id = %s', (user_id,))
+    db.commit()
+    cur.close()
+
+
+def bump_after_writes(response):
+    """Bump the user's data version after any write to a versioned
+    blueprint, failed or not, once the view has committed. Readers take the
+    version before their queries, so they can serve new data under an old
+    version (one extra full response) but never old data under a new one."""
+    if (
+        request.method not in SAFE_METHODS
+        and request.blueprint in VERSIONED_BLUEPRINTS
+        and g.get('user') is not None
+    ):
+        # views commit their own work; anything still open belongs to a
+        # failed request and may have aborted the transaction
+        get_db().rollback()
+        bump_data_version(g.user['id'])
+    return response
+
+
+def make_etag(user, version):
+    """Strong ETag over the user, their data version, the request's path and
+    query string, and the user's local date (which moves "today" and the
+    default date of most views)."""
+    today = datetime.now(ZoneInfo(user['timezone'])).date()
+    parts = [user['id'], version, today, request.path, sorted(request.args.items(multi=True))]
+    return hashlib.sha1(repr(parts).encode()).hexdigest()
+
+
+def conditional(view):
+    """For GET endpoints of the logged in user: answer If-None-Match with
+    304 from the data version alone, before the view runs any queries."""
+    @functools.wraps(view)
+    def wrapped_view(**kwargs):
+        if request.method != 'GET' or g.user is None or not current_app.config['ETAGS']:
+            return view(**kwargs)
+
+        etag = make_etag(g.user, get_data_version(g.user['id']))
+        if request.if_none_match.contains(etag):
+            response = make_response('', 304)
+        else:
+            response = make_response(view(**kwargs))
+            if response.status_code != 200:
+                return response
+        response.set_etag(etag)
+        # let browsers keep the body but always revalidate it
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+
+    return wrapped_view
+
+
+def init_app(app):
+    app.after_request(bump_after_writes)
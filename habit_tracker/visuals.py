@@ -1,75 +1,137 @@
-import functools
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
 
-from flask import (
-    Blueprint, flash, g, redirect, render_template, request, session, url_for
-)
-
-from werkzeug.exceptions import abort
-
-from datetime import date, timedelta
+from flask import Blueprint, g, jsonify, request
 
 from habit_tracker.auth import login_required
 from habit_tracker.db import get_db
+from habit_tracker.versioning import conditional
 
 bp = Blueprint('visuals', __name__, url_prefix='/visuals')
 
-@bp.route('/track', methods=('POST', 'GET'))
-@login_required
-def track():
+# longest range one heatmap request may cover
+MAX_DAYS = 5 * 366
+
+# range shown when ?start= is left out
+DEFAULT_SPAN = timedelta(days=364)
+
+# one character per day in a habit's "days" string
+DAY_CODES = {
+    'none': '0',
+    'completed': '1',
+    'skipped': '2',
+    'before_created': '-',
+}
+
+# One row per habit: its days between start and end as a string of
+# DAY_CODES, built in SQL so no per-cell rows or dicts reach Python.
+HEATMAP_SQL = '''
+    WITH days AS (
+        SELECT d::date AS day
+        FROM generate_series(%(start)s::date, %(end)s::date, '1 day') AS d
+    ),
+    user_habits AS (
+        SELECT id, name, family_id, stage, tier,
+               (created_at AT TIME ZONE %(tz)s)::date AS created
+        FROM habits
+        WHERE creator_id = %(user_id)s
+    ),
+    logs AS (
+        SELECT hl.habit_id, hl.log_date, hl.status
+        FROM habit_logs hl
+        JOIN user_habits h ON h.id = hl.habit_id
+        WHERE hl.log_date BETWEEN %(start)s AND %(end)s
+    )
+    SELECT h.id, h.name, h.family_id, h.stage, h.tier, h.created,
+           string_agg(
+               CASE
+                   WHEN l.status = 'completed' THEN '1'
+                   WHEN l.status = 'skipped' THEN '2'
+                   WHEN d.day < h.created THEN '-'
+                   ELSE '0'
+               END,
+               '' ORDER BY d.day
+           ) AS days,
+           COUNT(*) FILTER (WHERE l.status = 'completed')::int AS completed,
+           COUNT(*) FILTER (WHERE l.status = 'skipped')::int AS skipped
+    FROM user_habits h
+    CROSS JOIN days d
+    LEFT JOIN logs l ON l.habit_id = h.id AND l.log_date = d.day
+    GROUP BY h.id, h.name, h.family_id, h.stage, h.tier, h.created
+    ORDER BY h.family_id, h.stage
+'''
+
+
+def _parse_date(value):
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+
+def get_heatmap(cur, start, end):
+    """Every habit of the logged in user with its days from start to end
+    encoded as one DAY_CODES character per day."""
+    cur.execute(HEATMAP_SQL, {
+        'user_id': g.user['id'],
+        'tz': g.user['timezone'],
+        'start': start,
+        'end': end,
+    })
+    return [
+        {
+            "id": row['id'],
+            "name": row['name'],
+            "family_id": row['family_id'],
+            "stage": row['stage'],
+            "tier": row['tier'],
+            "created": row['created'].isoformat(),
+            "days": row['days'],
+            "completed": row['completed'],
+            "skipped": row['skipped'],
+        }
+        for row in cur.fetchall()
+    ]
+
+
+def heatmap_response(start, end):
     db = get_db()
     cur = db.cursor()
+    habits = get_heatmap(cur, start, end)
+    cur.close()
 
-    # Define date range
-    end_date = date.today()
-    start_date = end_date - timedelta(days=6)
-
-    # Get user habits
-    cur.execute(                                                                                          
-          'SELECT id, title FROM habits WHERE creator_id = %s',                                                       
-          (g.user['id'],)                                                                                           
-      )
-    habits = cur.fetchall()                                                                                                      
-    
-    # Generate all logs in the date range
-    cur.execute(
-        'SELECT * ' \
-        'FROM habit_logs hl ' \
-        'JOIN habits h'
-        ' ON hl.habit_id = h.id ' \
-        'WHERE creator_id = %s AND ' \
-        'log_date BETWEEN %s AND %s',
-        (g.user['id'], start_date.isoformat(), end_date.isoformat())
-    )
-    logs = cur.fetchall()
-
-    cur.close() 
-    
-    # Generate all dates                                                                                       
-    all_dates = []                                                                                                
-    current = start_date     
-                                                                                 
-    while current <= end_date:                                                                               
-        all_dates.append(current)                                                                                 
-        current += timedelta(days=1) 
-
-    # Set of habit id and date
-    completed_set = set()
-    for log in logs:
-        completed_set.add((log['habit_id'], log['log_date']))
-
-    # Build the full grid (habit × date)                                                                       
-    habit_data = []                                                                                               
-    for habit in habits:                                                                                          
-        days = []                                                                                                 
-        for d in all_dates:       
-            # check if theres a log for this habit on this date   
-            if (habit['id'], d) in completed_set: 
-                completed = True
-            else: completed = False
-
-            days.append({'date': d, 'completed': completed})
-            print(days)     
-            print()                                                           
-        habit_data.append({'habit': habit, 'days': days})   
-    
-    return render_template('dashboard/track.jinja', habit_data=habit_data, dates=all_dates)
+    return jsonify({
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "codes": DAY_CODES,
+        "habits": habits,
+    }), 200
+
+
+@bp.route('/heatmap')
+@login_required
+@conditional
+def heatmap():
+    """Completion heatmap of all the user's habits. ?start= and ?end= as
+    YYYY-MM-DD, at most MAX_DAYS apart (default: the year ending today).
+    Each habit's "days" has one character per day, see "codes"."""
+    try:
+        end = _parse_date(request.args['end']) if 'end' in request.args \
+            else datetime.now(ZoneInfo(g.user['timezone'])).date()
+        start = _parse_date(request.args['start']) if 'start' in request.args \
+            else end - DEFAULT_SPAN
+    except ValueError:
+        return jsonify({"error": "dates must be YYYY-MM-DD"}), 400
+
+    if start > end:
+        return jsonify({"error": "start must not be after end"}), 400
+    if (end - start).days >= MAX_DAYS:
+        return jsonify({"error": f"at most {MAX_DAYS} days per request"}), 400
+
+    return heatmap_response(start, end)
+
+
+@bp.route('/track', methods=('POST', 'GET'))
+@login_required
+@conditional
+def track():
+    """The last 7 days as a heatmap; kept for older clients."""
+    end = datetime.now(ZoneInfo(g.user['timezone'])).date()
+    return heatmap_response(end - timedelta(days=6), end)
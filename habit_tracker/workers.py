@@ -0,0 +1,36 @@
+import os
+import threading
+
+from flask import current_app
+
+# reentrant, so a factory may itself look up another per-worker value
+_lock = threading.RLock()
+
+
+def _mine(value):
+    return value is not None and value.pid == os.getpid()
+
+
+def per_worker(key, factory):
+    """Return this process's current_app.extensions[key], creating it with
+    factory() on first use.
+
+    Values record the process that made them in .pid. One inherited from a
+    parent (gunicorn --preload) is replaced, not shared: its threads,
+    connections and waiters stayed behind in the parent."""
+    value = current_app.extensions.get(key)
+    if _mine(value):
+        return value
+
+    with _lock:
+        value = current_app.extensions.get(key)
+        if not _mine(value):
+            value = factory()
+            current_app.extensions[key] = value
+    return value
+
+
+def existing(key):
+    """This process's value for key, or None before per_worker() made one."""
+    value = current_app.extensions.get(key)
+    return value if _mine(value) else None
@@ -1,6 +1,22 @@
+import json
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
 import pytest
 from habit_tracker import create_app
-from habit_tracker.db import get_db
+from habit_tracker.db import close_pool, get_db
+
+
+def today():
+    # new users default to UTC
+    return datetime.now(timezone.utc).date()
+
+
+def days_ago(n):
+    return (today() - timedelta(days=n)).isoformat()
+
 
 @pytest.fixture
 def app():
@@ -9,7 +25,9 @@ def app():
         'DB_NAME': 'habit_tracker_test',
         
     })
-    return app
+    yield app
+
+    close_pool(app)
 
 @pytest.fixture                                                                                                                                                            
 def client(app):              # ← asks for app fixture                                                                                                                     
@@ -31,3 +49,87 @@ def client(app):              # ← asks for app fixture
 def auth_token(client):
     res = client.post("/auth/register", json={"username": "test", "password": "pw123"})                                                                        
     return res.get_json()['token']
+
+
+# stands in for the OpenAI API: answers chat completions with canned text
+# after model_server.latency seconds and records every request body. With
+# "stream": true the reply comes as server-sent chunks, one word each,
+# model_server.chunk_delay seconds apart.
+@pytest.fixture
+def model_server():
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            server.requests.append(body)
+            time.sleep(server.latency)
+            try:
+                if body.get('stream'):
+                    self.stream_reply()
+                else:
+                    self.send_reply()
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+        def send_reply(self):
+            payload = json.dumps({
+                "id": "chatcmpl-test",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": "test-model",
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": server.reply},
+                    "finish_reason": "stop",
+                }],
+                "usage": {"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15},
+            }).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def stream_reply(self):
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.end_headers()
+
+            def chunk(choices, usage=None):
+                data = json.dumps({
+                    "id": "chatcmpl-test",
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": "test-model",
+                    "choices": choices,
+                    "usage": usage,
+                })
+                self.wfile.write(f'data: {data}\n\n'.encode())
+                self.wfile.flush()
+
+            words = server.reply.split(' ')
+            for i, word in enumerate(words):
+                text = word if i == 0 else ' ' + word
+                chunk([{"index": 0, "delta": {"content": text}, "finish_reason": None}])
+                time.sleep(server.chunk_delay)
+            chunk([{"index": 0, "delta": {}, "finish_reason": "stop"}])
+            chunk([], {"prompt_tokens": 10, "completion_tokens": len(words), "total_tokens": 10 + len(words)})
+            self.wfile.write(b'data: [DONE]\n\n')
+            self.wfile.flush()
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    server.requests = []
+    server.latency = 0
+    server.chunk_delay = 0
+    server.reply = "Keep it up."
+    server.url = f'http://127.0.0.1:{server.server_address[1]}/v1'
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+
+    server.shutdown()
+    server.server_close()
+
@@ -0,0 +1,98 @@
+from datetime import date, timedelta
+
+from habit_tracker.db import get_db
+from habit_tracker.rollups import rebuild_rollups
+
+
+def rollups_for(app, habit_id):
+    with app.app_context():
+        db = get_db()
+        cur = db.cursor()
+        cur.execute(
+            'SELECT grain, period_start, completed, skipped FROM habit_rollups'
+            ' WHERE habit_id = %s ORDER BY grain, period_start',
+            (habit_id,)
+        )
+        rows = [dict(row) for row in cur.fetchall()]
+        cur.close()
+    return rows
+
+
+def test_rollups_follow_writes(app, client, auth_token):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    habit_id = client.post('/habits', json={"name": "Read", "tier": 1}, headers=headers).get_json()['id']
+    day = date(2025, 3, 5)  # a Wednesday
+
+    client.post(f'/{habit_id}/complete', data={"date": day.isoformat()}, headers=headers)
+    client.post(f'/{habit_id}/complete', data={"date": (day + timedelta(days=1)).isoformat()}, headers=headers)
+    client.post(f'/habits/{habit_id}/skip', data={"date": (day + timedelta(days=2)).isoformat(), "reason": "tired"}, headers=headers)
+
+    rows = rollups_for(app, habit_id)
+    week = [r for r in rows if r['grain'] == 'week']
+    month = [r for r in rows if r['grain'] == 'month']
+    assert week == [{'grain': 'week', 'period_start': date(2025, 3, 3), 'completed': 2, 'skipped': 1}]
+    assert month == [{'grain': 'month', 'period_start': date(2025, 3, 1), 'completed': 2, 'skipped': 1}]
+    assert len([r for r in rows if r['grain'] == 'day']) == 3
+
+    client.post(f'/{habit_id}/undo_complete', data={"date": day.isoformat()}, headers=headers)
+    client.post(f'/{habit_id}/undo_skip', data={"date": (day + timedelta(days=2)).isoformat()}, headers=headers)
+
+    rows = rollups_for(app, habit_id)
+    assert [(r['grain'], r['completed'], r['skipped']) for r in rows] == [
+        ('day', 1, 0), ('month', 1, 0), ('week', 1, 0)
+    ]
+
+    # a full rebuild agrees with the incremental rows
+    with app.app_context():
+        rebuild_rollups()
+    assert rollups_for(app, habit_id) == rows
+
+
+def test_analytics_series(client, auth_token):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    habit_id = client.post('/habits', json={"name": "Read", "tier": 1}, headers=headers).get_json()['id']
+    client.post('/habits/complete-multiple', json={"items": [
+        {"habit_id": habit_id, "date": "2025-01-30"},
+        {"habit_id": habit_id, "date": "2025-02-02"},
+        {"habit_id": habit_id, "date": "2025-02-03"},
+    ]}, headers=headers)
+
+    res = client.get(f'/analytics/habits/{habit_id}?grain=month&start=2025-01-15&end=2025-03-10', headers=headers)
+    data = res.get_json()
+    assert res.status_code == 200
+    assert data['series'] == [
+        {"period_start": "2025-01-01", "completed": 1, "skipped": 0},
+        {"period_start": "2025-02-01", "completed": 2, "skipped": 0},
+        {"period_start": "2025-03-01", "completed": 0, "skipped": 0},
+    ]
+
+    res = client.get(f'/analytics/habits/{habit_id}?grain=week&start=2025-01-27&end=2025-02-09', headers=headers)
+    assert [p['completed'] for p in res.get_json()['series']] == [2, 1]
+
+    res = client.get(f'/analytics/habits/{habit_id}', headers=headers)
+    assert len(res.get_json()['series']) == 30
+
+
+def test_analytics_family_scope(app, client, auth_token):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    habit_id = client.post('/habits', json={"name": "Read", "tier": 1}, headers=headers).get_json()['id']
+    with app.app_context():
+        cur = get_db().cursor()
+        cur.execute('SELECT family_id FROM habits WHERE id = %s', (habit_id,))
+        family_id = cur.fetchone()['family_id']
+        cur.close()
+    client.post(f'/{habit_id}/complete', data={"date": "2025-02-02"}, headers=headers)
+
+    res = client.get(f'/analytics/families/{family_id}?grain=day&start=2025-02-01&end=2025-02-02', headers=headers)
+    assert [p['completed'] for p in res.get_json()['series']] == [0, 1]
+
+
+def test_analytics_errors(client, auth_token):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    habit_id = client.post('/habits', json={"name": "Read", "tier": 1}, headers=headers).get_json()['id']
+
+    assert client.get('/analytics/habits/999999', headers=headers).status_code == 404
+    assert client.get('/analytics/teams/1', headers=headers).status_code == 404
+    assert client.get(f'/analytics/habits/{habit_id}?grain=year', headers=headers).status_code == 400
+    assert client.get(f'/analytics/habits/{habit_id}?start=2025-02-10&end=2025-02-01', headers=headers).status_code == 400
+    assert client.get(f'/analytics/habits/{habit_id}?start=2000-01-01&end=2025-01-01', headers=headers).status_code == 400
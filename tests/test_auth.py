@@ -0,0 +1,34 @@
+import jwt
+
+from habit_tracker.auth import get_user_cache, user_cache_stats
+
+
+def test_logged_in_user_is_cached(app, client, auth_token):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    client.get('/habits', headers=headers)
+    client.get('/habits', headers=headers)
+
+    with app.app_context():
+        stats = user_cache_stats()
+    assert stats['misses'] == 1
+    assert stats['hits'] == 1
+
+
+def test_cached_user_has_no_password(app, client, auth_token):
+    client.get('/habits', headers={"Authorization": f"Bearer {auth_token}"})
+
+    user_id = jwt.decode(auth_token, app.config['SECRET_KEY'], algorithms=["HS256"])['user_id']
+    with app.app_context():
+        user = get_user_cache().get(user_id)
+    assert 'password' not in user
+
+
+def test_tier_order_update_invalidates_cached_user(client, auth_token):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    client.get('/habits/tiers', headers=headers)
+
+    res = client.put('/habits/tier-order', json={"tier_order": [3, 1, 2]}, headers=headers)
+    assert res.status_code == 200
+
+    res = client.get('/habits/tiers', headers=headers)
+    assert res.get_json()['tier_order'] == [3, 1, 2]
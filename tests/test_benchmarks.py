@@ -0,0 +1,29 @@
+from benchmarks.run import compare, format_report, percentile, run_benchmark
+
+
+def test_percentile():
+    samples = [5, 1, 4, 2, 3]
+    assert percentile(samples, 50) == 3
+    assert percentile(samples, 95) == 5
+    assert percentile([7], 95) == 7
+
+
+def test_run_benchmark_small_account(app):
+    report = run_benchmark(app, iterations=2, warmup=1, families=2, stages=2, days=10)
+
+    routes = report['routes']
+    assert report['meta']['sizes']['habits'] == 4
+    assert set(routes) >= {'habits.tiers', 'index', 'view', 'complete', 'undo_complete', 'skip', 'undo_skip'}
+    for name in ('habits.tiers', 'index', 'view', 'complete', 'undo_complete', 'skip', 'undo_skip'):
+        assert routes[name]['status'] == ['200'], name
+        assert routes[name]['queries'] > 0
+        assert routes[name]['p50_ms'] <= routes[name]['p95_ms']
+    assert 'habits.tiers' in format_report(report)
+
+
+def test_compare_flags_regressions():
+    baseline = {'routes': {'index': {'p95_ms': 10.0, 'queries': 3}}}
+    assert compare({'routes': {'index': {'p95_ms': 11.0, 'queries': 3}}}, baseline) == []
+
+    regressions = compare({'routes': {'index': {'p95_ms': 20.0, 'queries': 5}}}, baseline)
+    assert len(regressions) == 2
@@ -0,0 +1,59 @@
+from datetime import date, timedelta
+
+import numpy as np
+
+from habit_tracker.calendar_matrix import COMPLETED, NONE, SKIPPED, Calendar
+
+
+MONDAY = date(2025, 3, 3)
+
+
+def make_calendar(rows, created=None, today=None, start=MONDAY):
+    status = np.array(rows, dtype=np.int8)
+    end = start + timedelta(days=status.shape[1] - 1)
+    habit_ids = list(range(1, len(rows) + 1))
+    return Calendar(habit_ids, start, end, status, created, today)
+
+
+def test_day_grid_flags():
+    C, S, _ = COMPLETED, SKIPPED, NONE
+    calendar = make_calendar(
+        [[_, C, S, _, _, _, _]],
+        created={1: MONDAY + timedelta(days=1)},
+        today=MONDAY + timedelta(days=4),
+    )
+    days = calendar.day_grid()[1]
+
+    assert [d['date'] for d in days] == [MONDAY + timedelta(days=i) for i in range(7)]
+    assert [d['completed'] for d in days] == [False, True, True, False, False, False, False]
+    assert [d['before_habit'] for d in days] == [True] + [False] * 6
+    assert [d['in_future'] for d in days] == [False] * 5 + [True, True]
+
+
+def test_weekly_progress_counts_valid_days_only():
+    C, _ = COMPLETED, NONE
+    calendar = make_calendar(
+        [[C, C, _, _, _, _, _, C, C, C, C, _, _, _]],
+        created={1: MONDAY + timedelta(days=1)},
+        today=MONDAY + timedelta(days=10),
+    )
+    first, second = calendar.weekly_progress()[1]
+
+    assert (first['completed'], first['valid_days']) == (1, 6)
+    assert (second['completed'], second['valid_days']) == (4, 4)
+    assert second['percentage'] == 100.0
+    assert second['start'] == MONDAY + timedelta(days=7)
+
+
+def test_weekly_progress_of_a_week_before_creation():
+    calendar = make_calendar([[NONE] * 7], created={1: MONDAY + timedelta(days=30)})
+    [week] = calendar.weekly_progress()[1]
+    assert week['valid_days'] == 0
+    assert week['percentage'] == 0
+
+
+def test_window_shares_rows():
+    calendar = make_calendar([[COMPLETED] * 14])
+    week = calendar.window(MONDAY + timedelta(days=7), MONDAY + timedelta(days=13))
+    assert week.dates[0] == np.datetime64(MONDAY + timedelta(days=7))
+    assert week.logged.all()
@@ -0,0 +1,74 @@
+import pytest
+
+from conftest import days_ago
+from habit_tracker import create_app
+from habit_tracker.db import close_pool
+
+
+# run every test with both the recursive walk and the closure table
+@pytest.fixture(params=[False, True], ids=['walk', 'closure'])
+def app(request):
+    app = create_app({
+        'TESTING': True,
+        'DB_NAME': 'habit_tracker_test',
+        'CASCADE_CLOSURE': request.param,
+    })
+    yield app
+
+    close_pool(app)
+
+
+def build_chain(client, headers):
+    """tier 3 -> tier 2 -> tier 1"""
+    res = client.post('/habits', json={"name": "Walk 5 min", "tier": 1}, headers=headers)
+    easy = res.get_json()['id']
+    res = client.post(f'/habits/{easy}/grow-horizontal', json={"name": "Walk 15 min", "tier": 2}, headers=headers)
+    medium = res.get_json()['id']
+    res = client.post(f'/habits/{medium}/grow-horizontal', json={"name": "Run", "tier": 3}, headers=headers)
+    hard = res.get_json()['id']
+    return easy, medium, hard
+
+
+def done_ids(client, headers):
+    res = client.get('/habits/tiers', headers=headers)
+    return {h['id']: h['status'] for h in res.get_json()['habits_done']}
+
+
+def test_complete_cascades_to_every_ancestor(client, auth_token):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    easy, medium, hard = build_chain(client, headers)
+
+    client.post(f'/{hard}/complete', data={"date": days_ago(0)}, headers=headers)
+
+    assert done_ids(client, headers) == {easy: 'completed', medium: 'completed', hard: 'completed'}
+
+
+def test_complete_keeps_skipped_ancestor(client, auth_token):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    easy, medium, hard = build_chain(client, headers)
+
+    client.post(f'/habits/{easy}/skip', data={"date": days_ago(0), "reason": "tired"}, headers=headers)
+    client.post(f'/{hard}/complete', data={"date": days_ago(0)}, headers=headers)
+    client.post(f'/{hard}/undo_complete', data={"date": days_ago(0)}, headers=headers)
+
+    assert done_ids(client, headers) == {easy: 'skipped'}
+
+
+def test_undo_complete_clears_ancestors(client, auth_token):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    easy, medium, hard = build_chain(client, headers)
+
+    client.post(f'/{hard}/complete', data={"date": days_ago(0)}, headers=headers)
+    client.post(f'/{hard}/undo_complete', data={"date": days_ago(0)}, headers=headers)
+
+    assert done_ids(client, headers) == {}
+
+
+def test_unlink_stops_cascade(client, auth_token):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    easy, medium, hard = build_chain(client, headers)
+
+    client.put(f'/habits/{medium}/unlink', headers=headers)
+    client.post(f'/{hard}/complete', data={"date": days_ago(0)}, headers=headers)
+
+    assert done_ids(client, headers) == {medium: 'completed', hard: 'completed'}
@@ -0,0 +1,51 @@
+from datetime import datetime, timezone
+
+from habit_tracker.db import get_db
+
+
+def create_challenge_with_habits(app, client, headers, habit_count=2):
+    client.post('/challenges/create', json={"name": "30 days", "desc": "daily"}, headers=headers)
+    challenge_id = client.get('/challenges/', headers=headers).get_json()['challenges'][0]['id']
+
+    habit_ids = []
+    for i in range(habit_count):
+        res = client.post('/habits', json={"name": f"Habit {i}", "tier": 1}, headers=headers)
+        habit_ids.append(res.get_json()['id'])
+
+    # there's no endpoint for assigning habits to a challenge yet
+    with app.app_context():
+        db = get_db()
+        cur = db.cursor()
+        cur.execute(
+            'UPDATE habits SET challenge_id = %s WHERE id = ANY(%s)',
+            (challenge_id, habit_ids)
+        )
+        db.commit()
+        cur.close()
+
+    return challenge_id, habit_ids
+
+
+def test_challenge_stats_json(app, client, auth_token):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    challenge_id, habit_ids = create_challenge_with_habits(app, client, headers)
+    today = datetime.now(timezone.utc).date()
+    client.post(f'/{habit_ids[0]}/complete', data={"date": today.isoformat()}, headers=headers)
+
+    res = client.get(f'/challenges/{challenge_id}/stats', headers=headers)
+    data = res.get_json()
+
+    assert res.status_code == 200
+    assert data['habit_count'] == 2
+    assert len(data['weeks']) == 1
+    week = data['weeks'][0]
+    assert week['start'] <= today.isoformat() <= week['end']
+    assert week['completions'] == 1
+    # the challenge was created today, so only today is a valid day
+    assert week['possible'] == 2
+    assert week['percentage'] == 50
+
+
+def test_challenge_stats_json_not_found(client, auth_token):
+    res = client.get('/challenges/999999/stats', headers={"Authorization": f"Bearer {auth_token}"})
+    assert res.status_code == 404
@@ -0,0 +1,82 @@
+from conftest import days_ago
+
+
+def create_habit(client, headers, name="Exercise", tier=1):
+    res = client.post('/habits', json={"name": name, "tier": tier}, headers=headers)
+    return res.get_json()['id']
+
+
+def test_complete_multiple_with_habit_ids(client, auth_token):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    first = create_habit(client, headers, "Read")
+    second = create_habit(client, headers, "Walk")
+
+    res = client.post(
+        '/habits/complete-multiple',
+        json={"habit_ids": [first, second], "date": days_ago(0)},
+        headers=headers
+    )
+
+    assert res.status_code == 200
+    assert [r['status'] for r in res.get_json()['results']] == ['inserted', 'inserted']
+
+
+def test_complete_multiple_reports_outcomes(client, auth_token):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    habit_id = create_habit(client, headers)
+    client.post(f'/{habit_id}/complete', data={"date": days_ago(1)}, headers=headers)
+
+    res = client.post(
+        '/habits/complete-multiple',
+        json={"items": [
+            {"habit_id": habit_id, "date": days_ago(0)},
+            {"habit_id": habit_id, "date": days_ago(1)},
+            {"habit_id": habit_id + 1000, "date": days_ago(0)},
+        ]},
+        headers=headers
+    )
+
+    statuses = [r['status'] for r in res.get_json()['results']]
+    assert statuses == ['inserted', 'already-logged', 'not-owned']
+
+
+def test_complete_multiple_backfills_days(client, auth_token):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    habit_id = create_habit(client, headers)
+
+    client.post(
+        '/habits/complete-multiple',
+        json={"items": [{"habit_id": habit_id, "date": days_ago(n)} for n in (1, 2, 3)]},
+        headers=headers
+    )
+
+    res = client.get(f'/{habit_id}', headers=headers)
+    assert res.get_json()['current_streak'] == 3
+
+
+def test_complete_multiple_cascades(client, auth_token):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    easy = create_habit(client, headers, "Walk", tier=1)
+    res = client.post(f'/habits/{easy}/grow-horizontal', json={"name": "Run", "tier": 2}, headers=headers)
+    hard = res.get_json()['id']
+
+    client.post(
+        '/habits/complete-multiple',
+        json={"items": [{"habit_id": hard, "date": days_ago(n)} for n in (0, 1)]},
+        headers=headers
+    )
+
+    res = client.get(f'/{easy}', headers=headers)
+    assert res.get_json()['current_streak'] == 2
+
+
+def test_complete_multiple_rejects_bad_dates(client, auth_token):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    habit_id = create_habit(client, headers)
+
+    res = client.post(
+        '/habits/complete-multiple',
+        json={"items": [{"habit_id": habit_id, "date": "yesterday"}]},
+        headers=headers
+    )
+    assert res.status_code == 400
@@ -0,0 +1,50 @@
+import pytest
+
+from habit_tracker import create_app
+from habit_tracker.db import PoolTimeout, close_pool, get_pool, pool_stats
+
+
+def test_connection_is_reused_between_requests(app):
+    with app.app_context():
+        pool = get_pool()
+        conn = pool.getconn()
+        pool.putconn(conn)
+        assert pool.getconn() is conn
+
+
+def test_session_state_is_reset_on_return(app):
+    with app.app_context():
+        pool = get_pool()
+        conn = pool.getconn()
+        cur = conn.cursor()
+        cur.execute("SET application_name = 'leaky'")
+        cur.close()
+        pool.putconn(conn)
+
+        conn = pool.getconn()
+        cur = conn.cursor()
+        cur.execute('SHOW application_name')
+        assert cur.fetchone()['application_name'] != 'leaky'
+        cur.close()
+        pool.putconn(conn)
+
+
+def test_checkout_times_out_when_pool_is_exhausted():
+    app = create_app({
+        'TESTING': True,
+        'DB_NAME': 'habit_tracker_test',
+        'DB_POOL_MAX_SIZE': 1,
+        'DB_POOL_TIMEOUT': 0.1,
+    })
+    with app.app_context():
+        pool = get_pool()
+        conn = pool.getconn()
+        with pytest.raises(PoolTimeout):
+            pool.getconn()
+        pool.putconn(conn)
+
+        stats = pool_stats()
+        assert stats['timeouts'] == 1
+        assert stats['in_use'] == 0
+        assert stats['size'] == 1
+    close_pool(app)
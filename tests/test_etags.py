@@ -0,0 +1,54 @@
+from habit_tracker.instrumentation import current_stats
+
+
+def test_unchanged_data_is_not_modified(client, auth_token):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    client.post('/habits', json={"name": "Read", "tier": 1}, headers=headers)
+
+    res = client.get('/habits/tiers', headers=headers)
+    assert res.status_code == 200
+    etag = res.headers['ETag']
+
+    res = client.get('/habits/tiers', headers={**headers, "If-None-Match": etag})
+    assert res.status_code == 304
+    assert res.headers['ETag'] == etag
+    assert res.get_data() == b''
+
+
+def test_writes_change_the_etag(client, auth_token):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    habit_id = client.post('/habits', json={"name": "Read", "tier": 1}, headers=headers).get_json()['id']
+    etag = client.get('/habits/tiers', headers=headers).headers['ETag']
+
+    client.post(f'/{habit_id}/complete', headers=headers)
+
+    res = client.get('/habits/tiers', headers={**headers, "If-None-Match": etag})
+    assert res.status_code == 200
+    assert res.headers['ETag'] != etag
+
+
+def test_date_param_is_part_of_the_etag(client, auth_token):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    today = client.get('/habits/tiers', headers=headers).headers['ETag']
+    other_day = client.get('/habits/tiers?date=2025-01-01', headers=headers).headers['ETag']
+    assert today != other_day
+
+
+def test_not_modified_skips_the_view_queries(app, client):
+    counts = []
+
+    # hooks have to be in place before the app's first request
+    @app.after_request
+    def record(response):
+        stats = current_stats()
+        counts.append(stats.count if stats else 0)
+        return response
+
+    token = client.post("/auth/register", json={"username": "test", "password": "pw123"}).get_json()['token']
+    headers = {"Authorization": f"Bearer {token}"}
+    etag = client.get('/habits/tiers', headers=headers).headers['ETag']
+    client.get('/habits/tiers', headers={**headers, "If-None-Match": etag})
+
+    # the user lookup is cached; only the data version is read
+    assert counts[-1] == 1
+    assert counts[-2] > 1
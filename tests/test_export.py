@@ -0,0 +1,52 @@
+import csv
+import io
+import json
+from datetime import datetime, timezone
+
+
+def test_export_requires_login(client):
+    res = client.get('/export/')
+    assert res.status_code == 401
+
+
+def test_export_ndjson_streams_every_section(client, auth_token):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    res = client.post('/habits', json={"name": "Read", "tier": 1}, headers=headers)
+    habit_id = res.get_json()['id']
+    today = datetime.now(timezone.utc).date().isoformat()
+    client.post(f'/habits/{habit_id}/skip', data={"date": today, "reason": "tired"}, headers=headers)
+    client.post('/challenges/create', json={"name": "30 days", "desc": "read daily"}, headers=headers)
+
+    res = client.get('/export/', headers=headers)
+    records = [json.loads(line) for line in res.get_data(as_text=True).splitlines()]
+
+    assert res.mimetype == 'application/x-ndjson'
+    assert [r['type'] for r in records] == ['habit', 'family', 'challenge', 'log']
+    assert records[3] == {
+        "type": "log", "habit_id": habit_id, "name": "Read",
+        "log_date": today, "status": "skipped", "reason": "tired",
+    }
+
+
+def test_export_csv_section(client, auth_token):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    client.post('/habits', json={"name": "Read", "tier": 1}, headers=headers)
+    client.post('/habits', json={"name": "Walk", "tier": 2}, headers=headers)
+
+    res = client.get('/export/?format=csv&section=habits', headers=headers)
+    rows = list(csv.DictReader(io.StringIO(res.get_data(as_text=True))))
+
+    assert res.mimetype == 'text/csv'
+    assert [row['name'] for row in rows] == ['Read', 'Walk']
+
+
+def test_export_empty_csv_section_has_header(client, auth_token):
+    res = client.get('/export/?format=csv&section=logs', headers={"Authorization": f"Bearer {auth_token}"})
+
+    assert res.status_code == 200
+    assert res.get_data(as_text=True).splitlines() == ['habit_id,name,log_date,status,reason']
+
+
+def test_export_rejects_unknown_format(client, auth_token):
+    res = client.get('/export/?format=xml', headers={"Authorization": f"Bearer {auth_token}"})
+    assert res.status_code == 400
@@ -0,0 +1,94 @@
+from conftest import days_ago
+
+
+def create_habit(client, headers, name="Read", tier=1):
+    res = client.post('/habits', json={"name": name, "tier": tier}, headers=headers)
+    return res.get_json()['id']
+
+
+def test_import_csv(client, auth_token):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    habit_id = create_habit(client, headers)
+    client.post(f'/{habit_id}/complete', data={"date": days_ago(1)}, headers=headers)
+
+    body = "habit_id,log_date,status,reason\n"
+    body += f"{habit_id},{days_ago(1)},completed,\n"        # already logged
+    body += f"{habit_id},{days_ago(2)},completed,\n"
+    body += f"{habit_id},{days_ago(3)},skipped,sick\n"
+    body += f"{habit_id + 1000},{days_ago(2)},completed,\n"  # not ours
+    body += f"{habit_id},{days_ago(-5)},completed,\n"       # future
+    body += f"{habit_id},not-a-date,completed,\n"
+
+    res = client.post('/import/?format=csv', data=body, headers=headers)
+
+    assert res.status_code == 200
+    assert res.get_json() == {
+        "inserted": 2, "already_logged": 1, "not_owned": 1, "invalid": 2, "cascaded": 0,
+    }
+
+    res = client.get(f'/{habit_id}', headers=headers)
+    assert res.get_json()['longest_streak'] == 2
+
+
+def test_import_ndjson_runs_cascades(client, auth_token):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    easy = create_habit(client, headers, "Walk", tier=1)
+    res = client.post(f'/habits/{easy}/grow-horizontal', json={"name": "Run", "tier": 2}, headers=headers)
+    hard = res.get_json()['id']
+
+    body = "".join(
+        f'{{"type": "log", "habit_id": {hard}, "log_date": "{days_ago(n)}", "status": "completed"}}\n'
+        for n in (1, 2, 3)
+    )
+    body += f'{{"type": "habit", "id": {hard}}}\n'
+
+    res = client.post('/import/?format=ndjson', data=body, headers=headers)
+
+    assert res.get_json()['inserted'] == 3
+    assert res.get_json()['cascaded'] == 3
+
+    res = client.get(f'/{easy}', headers=headers)
+    assert res.get_json()['current_streak'] == 3
+
+
+def test_import_logs_command(app, client, auth_token, tmp_path):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    habit_id = create_habit(client, headers)
+    path = tmp_path / 'logs.csv'
+    path.write_text(f"habit_id,log_date\n{habit_id},{days_ago(1)}\n{habit_id},{days_ago(2)}\n")
+
+    result = app.test_cli_runner().invoke(args=['import-logs', str(path), '--user', 'test'])
+
+    assert 'inserted: 2' in result.output
+
+
+def test_import_out_of_range_habit_id_is_invalid(client, auth_token):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    habit_id = create_habit(client, headers)
+
+    body = "habit_id,log_date\n"
+    body += f"{habit_id},{days_ago(1)}\n"
+    body += f"{2**31},{days_ago(1)}\n"
+
+    res = client.post('/import/?format=csv', data=body, headers=headers)
+
+    assert res.status_code == 200
+    assert res.get_json()['inserted'] == 1
+    assert res.get_json()['invalid'] == 1
+
+
+def test_import_malformed_upload(client, auth_token):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    habit_id = create_habit(client, headers)
+
+    body = f"habit_id,log_date\n{habit_id},{days_ago(1)}\n".encode() + b"\xff\xfe\n"
+    res = client.post('/import/?format=csv', data=body, headers=headers)
+    assert res.status_code == 400
+
+    body = f"habit_id,log_date\n{habit_id},{days_ago(1)},{'x' * 200000}\n"
+    res = client.post('/import/?format=csv', data=body, headers=headers)
+    assert res.status_code == 400
+
+    # nothing from either upload was kept
+    res = client.get(f'/{habit_id}', headers=headers)
+    assert res.get_json()['current_streak'] == 0
@@ -0,0 +1,370 @@
+import json
+import threading
+import time
+from datetime import date, timedelta
+
+import pytest
+
+from habit_tracker import create_app
+from habit_tracker.db import close_pool, get_db
+from habit_tracker.insights import finish_job, insights_cache_stats, stream_model
+from habit_tracker.jobs import get_runner
+
+
+@pytest.fixture
+def app(model_server):
+    app = create_app({
+        'TESTING': True,
+        'DB_NAME': 'habit_tracker_test',
+        'OPENAI_API_KEY': 'test',
+        'OPENAI_BASE_URL': model_server.url,
+        'INSIGHTS_TIMEOUT': 1,
+    })
+    yield app
+
+    # let running jobs finish before the client fixture wipes the tables
+    runner = app.extensions.get('jobs_insights')
+    if runner is not None:
+        runner.shutdown()
+    close_pool(app)
+
+
+def poll(client, headers, timeout=5):
+    deadline = time.monotonic() + timeout
+    while True:
+        res = client.get('/insights/', headers=headers)
+        if res.status_code != 202 or time.monotonic() > deadline:
+            return res
+        time.sleep(0.05)
+
+
+def test_insights_job(client, auth_token, model_server):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    client.post('/habits', json={"name": "Read", "tier": 1}, headers=headers)
+
+    res = client.post('/insights/', headers=headers)
+    assert res.status_code == 202
+    assert res.get_json()['status'] == 'pending'
+
+    res = poll(client, headers)
+    data = res.get_json()
+    assert res.status_code == 200
+    assert data['status'] == 'done'
+    assert data['insights'] == "Keep it up."
+    assert data['habit_stats'] == [{"name": "Read", "completed": 0, "skipped": 0}]
+    assert data['skip_count'] == 0
+    assert len(model_server.requests) == 1
+    prompt = model_server.requests[0]['messages'][1]['content']
+    assert "## Patterns" in prompt
+    assert "- Read: 0/1 (0%)" in prompt
+
+
+def test_insights_get_starts_first_job(client, auth_token, model_server):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+
+    res = client.get('/insights/', headers=headers)
+    assert res.status_code == 202
+
+    assert poll(client, headers).get_json()['status'] == 'done'
+
+
+def test_insights_dedup(client, auth_token, model_server):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    model_server.latency = 0.3
+
+    assert client.post('/insights/', headers=headers).status_code == 202
+    assert client.post('/insights/', headers=headers).status_code == 202
+    assert client.get('/insights/', headers=headers).status_code == 202
+
+    assert poll(client, headers).get_json()['status'] == 'done'
+    assert len(model_server.requests) == 1
+
+    # a finished job can be refreshed
+    assert client.post('/insights/?refresh=1', headers=headers).status_code == 202
+    assert poll(client, headers).get_json()['status'] == 'done'
+    assert len(model_server.requests) == 2
+
+
+def test_insights_timeout(client, auth_token, model_server):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    model_server.latency = 2
+
+    client.post('/insights/', headers=headers)
+    data = poll(client, headers).get_json()
+
+    assert data['status'] == 'failed'
+    assert data['error']
+
+
+def test_insights_retried_after_data_changes(client, auth_token, model_server):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    model_server.latency = 2
+
+    client.post('/insights/', headers=headers)
+    assert poll(client, headers).get_json()['status'] == 'failed'
+    # same data: the failure stands until the user asks again
+    assert client.get('/insights/', headers=headers).get_json()['status'] == 'failed'
+
+    model_server.latency = 0
+    client.post('/habits', json={"name": "Read", "tier": 1}, headers=headers)
+    assert client.get('/insights/', headers=headers).status_code == 202
+    assert poll(client, headers).get_json()['status'] == 'done'
+
+
+def test_stale_job_is_restarted(app, client, auth_token, model_server):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    with app.app_context():
+        db = get_db()
+        cur = db.cursor()
+        # a job whose worker died long ago
+        cur.execute(
+            "INSERT INTO insight_jobs (user_id, status, requested_at)"
+            " SELECT id, 'running', NOW() - INTERVAL '1 hour' FROM users"
+        )
+        db.commit()
+        cur.close()
+
+    assert client.get('/insights/', headers=headers).status_code == 202
+    assert poll(client, headers).get_json()['status'] == 'done'
+    assert len(model_server.requests) == 1
+
+
+def test_insights_pool_full(app, client, auth_token):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    with app.app_context():
+        runner = get_runner('insights', 1, 0)
+        runner._slots.acquire()
+    try:
+        res = client.post('/insights/', headers=headers)
+    finally:
+        runner._slots.release()
+
+    assert res.status_code == 503
+    assert client.post('/insights/', headers=headers).status_code == 202
+    poll(client, headers)
+
+
+def test_insights_cached_for_unchanged_data(app, client, auth_token, model_server):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    res = client.post('/habits', json={"name": "Read", "tier": 1}, headers=headers)
+    habit_id = res.get_json()['id']
+
+    first = poll(client, headers).get_json()
+    assert len(model_server.requests) == 1
+
+    # same data: served from the cache, no new job
+    res = client.get('/insights/', headers=headers)
+    assert res.status_code == 200
+    assert res.get_json()['generated_at'] == first['generated_at']
+
+    # a plain POST reuses the cached result too
+    client.post('/insights/', headers=headers)
+    assert poll(client, headers).get_json()['generated_at'] == first['generated_at']
+    assert len(model_server.requests) == 1
+
+    with app.app_context():
+        stats = insights_cache_stats()
+    assert stats['hits'] >= 2
+    assert stats['size'] == 1
+
+    # new data changes the fingerprint
+    client.post(f'/{habit_id}/complete', headers=headers)
+    assert client.get('/insights/', headers=headers).status_code == 202
+    data = poll(client, headers).get_json()
+    assert data['habit_stats'] == [{"name": "Read", "completed": 1, "skipped": 0}]
+    assert len(model_server.requests) == 2
+
+
+def test_insights_force_refresh(client, auth_token, model_server):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    first = poll(client, headers).get_json()
+
+    model_server.reply = "Try mornings."
+    client.post('/insights/?refresh=1', headers=headers)
+    data = poll(client, headers).get_json()
+
+    assert data['insights'] == "Try mornings."
+    assert data['generated_at'] > first['generated_at']
+    assert len(model_server.requests) == 2
+
+
+
+def read_events(res):
+    events = []
+    for block in res.get_data(as_text=True).strip().split('\n\n'):
+        lines = dict(line.split(': ', 1) for line in block.split('\n'))
+        events.append((lines['event'], json.loads(lines['data'])))
+    return events
+
+
+def test_stream_model(app, model_server):
+    model_server.reply = "Try reading after dinner."
+    with app.test_request_context():
+        pieces = list(stream_model("prompt"))
+
+    assert pieces == ["Try", " reading", " after", " dinner."]
+    assert model_server.requests[0]['stream'] is True
+
+
+def test_stream_model_closed_early(app, model_server):
+    model_server.chunk_delay = 0.05
+    with app.test_request_context():
+        stream = stream_model("prompt")
+        assert next(stream) == "Keep"
+        stream.close()
+
+
+def test_insights_stream(client, auth_token, model_server):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    client.post('/habits', json={"name": "Read", "tier": 1}, headers=headers)
+
+    res = client.get('/insights/stream', headers=headers)
+    assert res.status_code == 200
+    assert res.mimetype == 'text/event-stream'
+    events = read_events(res)
+
+    assert events[0] == ('stats', {"habit_stats": [{"name": "Read", "completed": 0, "skipped": 0}], "skip_count": 0})
+    assert ''.join(data['text'] for event, data in events if event == 'token') == "Keep it up."
+    event, data = events[-1]
+    assert event == 'done'
+    assert data['insights'] == "Keep it up."
+    assert len(model_server.requests) == 1
+
+    # the finished text is kept: no new model call for the same data
+    res = client.get('/insights/', headers=headers)
+    assert res.status_code == 200
+    assert res.get_json()['generated_at'] == data['generated_at']
+    events = read_events(client.get('/insights/stream', headers=headers))
+    assert [event for event, _ in events] == ['stats', 'done']
+    assert len(model_server.requests) == 1
+
+    # ?refresh=1 streams a new reply
+    model_server.reply = "Try mornings."
+    events = read_events(client.get('/insights/stream?refresh=1', headers=headers))
+    assert events[-1][1]['insights'] == "Try mornings."
+    assert len(model_server.requests) == 2
+
+
+def test_insights_stream_error(client, auth_token, model_server):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    model_server.latency = 2  # past INSIGHTS_TIMEOUT
+
+    events = read_events(client.get('/insights/stream', headers=headers))
+    assert [event for event, _ in events] == ['stats', 'error']
+    res = client.get('/insights/', headers=headers)
+    assert res.status_code == 200
+    assert res.get_json()['status'] == 'failed'
+
+
+def stream_in_thread(client, headers, events):
+    thread = threading.Thread(
+        target=lambda: events.extend(read_events(client.get('/insights/stream', headers=headers)))
+    )
+    thread.start()
+    return thread
+
+
+def wait_for_model_call(model_server, count=1, timeout=5):
+    deadline = time.monotonic() + timeout
+    while len(model_server.requests) < count and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def test_concurrent_streams_share_one_call(client, auth_token, model_server):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    model_server.reply = "Read before bed this week."
+    model_server.chunk_delay = 0.05
+
+    first, second = [], []
+    threads = [stream_in_thread(client, headers, first)]
+    wait_for_model_call(model_server)
+    threads.append(stream_in_thread(client, headers, second))
+    for thread in threads:
+        thread.join()
+
+    assert len(model_server.requests) == 1
+    for events in (first, second):
+        # the late stream replays the tokens it missed
+        assert ''.join(data['text'] for event, data in events if event == 'token') == model_server.reply
+        assert events[-1][0] == 'done'
+    assert first[-1][1]['generated_at'] == second[-1][1]['generated_at']
+
+
+def test_job_joins_stream_in_flight(client, auth_token, model_server):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    model_server.chunk_delay = 0.1
+
+    events = []
+    thread = stream_in_thread(client, headers, events)
+    wait_for_model_call(model_server)
+    # already running: nothing new is queued
+    assert client.post('/insights/', headers=headers).status_code == 202
+    thread.join()
+
+    data = poll(client, headers).get_json()
+    assert data['generated_at'] == events[-1][1]['generated_at']
+    assert len(model_server.requests) == 1
+
+
+def test_streams_on_two_workers_share_one_call(app, client, auth_token, model_server):
+    # a second app has its own cache, flights and pool, like another worker
+    other = create_app(dict(app.config, TESTING=True))
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    model_server.chunk_delay = 0.1
+
+    try:
+        first, second = [], []
+        threads = [stream_in_thread(client, headers, first)]
+        wait_for_model_call(model_server)
+        threads.append(stream_in_thread(other.test_client(), headers, second))
+        for thread in threads:
+            thread.join()
+    finally:
+        runner = other.extensions.get('jobs_insights')
+        if runner is not None:
+            runner.shutdown()
+        close_pool(other)
+
+    assert len(model_server.requests) == 1
+    # the other worker only sees the stored result
+    assert [event for event, _ in second] == ['stats', 'done']
+    assert second[-1][1]['insights'] == first[-1][1]['insights'] == "Keep it up."
+
+
+def test_insights_prompt_groups_skip_reasons(client, auth_token, model_server):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    res = client.post('/habits', json={"name": "Run", "tier": 1}, headers=headers)
+    habit_id = res.get_json()['id']
+    today = date.today()
+    for days_ago, reason in ((1, "tired"), (2, "too tired"), (3, "Tired!")):
+        day = (today - timedelta(days=days_ago)).isoformat()
+        client.post(f'/habits/{habit_id}/skip', data={"date": day, "reason": reason}, headers=headers)
+
+    client.post('/insights/', headers=headers)
+    assert poll(client, headers).get_json()['skip_count'] == 3
+
+    prompt = model_server.requests[0]['messages'][1]['content']
+    assert '"tired" x3 (Run 3)' in prompt
+    assert 'also "too tired"' in prompt
+
+
+def test_late_leader_does_not_overwrite_newer_flight(app, client, auth_token):
+    with app.app_context():
+        db = get_db()
+        cur = db.cursor()
+        cur.execute(
+            "INSERT INTO insight_jobs (user_id, status, running_fingerprint)"
+            " SELECT id, 'running', 'new' FROM users RETURNING user_id"
+        )
+        user_id = cur.fetchone()['user_id']
+        db.commit()
+
+        finish_job(user_id, 'done', result={"insights": "old"}, fingerprint='old', owner='old')
+        finish_job(user_id, 'failed', error='boom')
+        cur.execute('SELECT status, result FROM insight_jobs WHERE user_id = %s', (user_id,))
+        assert cur.fetchone() == {'status': 'running', 'result': None}
+
+        finish_job(user_id, 'done', result={"insights": "new"}, fingerprint='new', owner='new')
+        cur.execute('SELECT status, result FROM insight_jobs WHERE user_id = %s', (user_id,))
+        assert cur.fetchone() == {'status': 'done', 'result': {"insights": "new"}}
+        cur.close()
@@ -0,0 +1,60 @@
+import logging
+
+import pytest
+
+from habit_tracker import create_app
+from habit_tracker.db import close_pool
+from habit_tracker.instrumentation import QueryStats, normalize_sql
+
+
+def test_normalize_sql_collapses_whitespace():
+    assert normalize_sql("SELECT *\n  FROM habits\n WHERE id = %s ") == 'SELECT * FROM habits WHERE id = %s'
+
+
+def test_query_stats_keeps_the_slowest():
+    stats = QueryStats()
+    for i in range(10):
+        stats.record('SELECT 1', i / 1000)
+
+    assert stats.count == 10
+    assert stats.statements['SELECT 1'][0] == 10
+    assert [round(s * 1000) for s, _ in stats.slowest] == [9, 8, 7, 6, 5]
+
+
+def test_server_timing_header(client, auth_token):
+    res = client.get('/habits/tiers', headers={"Authorization": f"Bearer {auth_token}"})
+
+    assert res.status_code == 200
+    timing = res.headers['Server-Timing']
+    assert timing.startswith('db;dur=')
+    assert 'queries"' in timing
+
+
+@pytest.fixture
+def strict_app():
+    app = create_app({
+        'TESTING': True,
+        'DB_NAME': 'habit_tracker_test',
+        'SLOW_REQUEST_QUERIES': 1,
+    })
+    yield app
+
+    close_pool(app)
+
+
+def test_slow_request_is_logged(strict_app, caplog):
+    client = strict_app.test_client()
+    res = client.post('/auth/register', json={"username": "slowpoke", "password": "pw123"})
+    token = res.get_json()['token']
+
+    with caplog.at_level(logging.WARNING):
+        client.get('/habits/tiers', headers={"Authorization": f"Bearer {token}"})
+
+    assert any('slow request GET /habits/tiers' in r.getMessage() for r in caplog.records)
+
+    with strict_app.app_context():
+        from habit_tracker.db import get_db
+        cur = get_db().cursor()
+        cur.execute("DELETE FROM users WHERE username = 'slowpoke'")
+        get_db().commit()
+        cur.close()
@@ -0,0 +1,59 @@
+import json
+
+from habit_tracker import create_app
+from habit_tracker.db import close_pool
+from habit_tracker.metrics import Histogram, REGISTRY, render
+
+
+def test_histogram_renders_cumulative_buckets():
+    hist = Histogram('test_latency_seconds', 'Test.', ('route',), buckets=(0.1, 1.0))
+    try:
+        hist.observe(0.05, route='a')
+        hist.observe(0.5, route='a')
+        hist.observe(5, route='a')
+
+        text = render({'test_latency_seconds': {tuple(k): v for k, v in hist.samples()}})
+        assert 'test_latency_seconds_bucket{route="a",le="0.1"} 1' in text
+        assert 'test_latency_seconds_bucket{route="a",le="1.0"} 2' in text
+        assert 'test_latency_seconds_bucket{route="a",le="+Inf"} 3' in text
+        assert 'test_latency_seconds_count{route="a"} 3' in text
+    finally:
+        del REGISTRY['test_latency_seconds']
+
+
+def test_metrics_endpoint(client, auth_token):
+    client.get('/habits/tiers', headers={"Authorization": f"Bearer {auth_token}"})
+
+    res = client.get('/metrics')
+    text = res.get_data(as_text=True)
+    assert res.status_code == 200
+    assert res.content_type.startswith('text/plain')
+    assert 'http_request_duration_seconds_bucket{endpoint="habits.get_families",method="GET",le="+Inf"}' in text
+    assert 'http_requests_total{endpoint="habits.get_families",method="GET",status="200"}' in text
+    assert 'db_query_duration_seconds_count{operation="SELECT"}' in text
+    assert 'db_pool_connections{state="in_use"}' in text
+
+
+def test_metrics_are_merged_across_workers(tmp_path):
+    # a worker that has since exited
+    dead = {
+        'pid': 999999999,
+        'metrics': {
+            'http_requests_total': [[['index', 'GET', '200'], 7]],
+            'db_pool_connections': [[['size'], 3]],
+        },
+    }
+    (tmp_path / 'metrics_999999999.json').write_text(json.dumps(dead))
+
+    app = create_app({
+        'TESTING': True,
+        'DB_NAME': 'habit_tracker_test',
+        'METRICS_DIR': str(tmp_path),
+    })
+    text = app.test_client().get('/metrics').get_data(as_text=True)
+    close_pool(app)
+
+    line = next(l for l in text.splitlines() if l.startswith('http_requests_total{endpoint="index",method="GET",status="200"}'))
+    assert int(line.split()[-1]) >= 7
+    assert 'pid="999999999"' not in text
+    assert len(list(tmp_path.glob('metrics_*.json'))) == 2
@@ -0,0 +1,103 @@
+import psycopg2
+import pytest
+
+from habit_tracker import create_app
+from habit_tracker.db import close_pool, get_db
+from habit_tracker.migrate import list_migrations, migration_status, upgrade
+
+MIGRATE_DB = 'habit_tracker_migrate_test'
+
+
+def _admin_connection(app):
+    config = app.config
+    conn = psycopg2.connect(
+        database='postgres', user=config['DB_USER'], host=config['DB_HOST'],
+        port=config['DB_PORT'], password=config['DB_PASSWORD'],
+    )
+    conn.autocommit = True
+    return conn
+
+
+# a brand new, empty database for each test
+@pytest.fixture
+def empty_app():
+    app = create_app({'TESTING': True, 'DB_NAME': MIGRATE_DB})
+    admin = _admin_connection(app)
+    cur = admin.cursor()
+    cur.execute(f'DROP DATABASE IF EXISTS {MIGRATE_DB}')
+    cur.execute(f'CREATE DATABASE {MIGRATE_DB}')
+    yield app
+
+    close_pool(app)
+    cur.execute(f'DROP DATABASE IF EXISTS {MIGRATE_DB}')
+    cur.close()
+    admin.close()
+
+
+def _index_names(app):
+    with app.app_context():
+        cur = get_db().cursor()
+        cur.execute("SELECT indexname FROM pg_indexes WHERE schemaname = 'public'")
+        names = {row['indexname'] for row in cur.fetchall()}
+        cur.close()
+    return names
+
+
+def test_upgrade_from_empty(empty_app):
+    with empty_app.app_context():
+        versions = [version for version, _, _ in list_migrations()]
+        assert upgrade() == versions
+        assert all(applied for _, _, applied in migration_status())
+
+        # second run has nothing to do
+        assert upgrade() == []
+
+    indexes = _index_names(empty_app)
+    assert 'habits_creator_family_stage_idx' in indexes
+    assert 'habit_logs_skipped_idx' in indexes
+
+
+def test_upgrade_replaces_invalid_index(empty_app):
+    with empty_app.app_context():
+        upgrade()
+        cur = get_db().cursor()
+        # simulate a CREATE INDEX CONCURRENTLY that died half way
+        cur.execute(
+            "UPDATE pg_index SET indisvalid = false"
+            " WHERE indexrelid = 'challenges_creator_idx'::regclass"
+        )
+        cur.execute("DELETE FROM schema_migrations WHERE version = '0002'")
+        get_db().commit()
+        cur.close()
+
+        assert upgrade() == ['0002']
+
+        cur = get_db().cursor()
+        cur.execute("SELECT indisvalid FROM pg_index WHERE indexrelid = 'challenges_creator_idx'::regclass")
+        assert cur.fetchone()['indisvalid']
+        cur.close()
+
+
+def test_init_db_matches_migrations(empty_app):
+    runner = empty_app.test_cli_runner()
+    result = runner.invoke(args=['init-db'])
+    assert 'Initialized' in result.output
+
+    with empty_app.app_context():
+        assert upgrade() == []
+
+    # schema.sql creates the same indexes as the migrations
+    migrated = _index_names(empty_app)
+    assert {'habits_creator_family_stage_idx', 'habit_cascades_ancestor_idx'} <= migrated
+
+
+def test_db_cli(empty_app):
+    runner = empty_app.test_cli_runner()
+    result = runner.invoke(args=['db', 'status'])
+    assert 'pending  0001_baseline' in result.output
+
+    result = runner.invoke(args=['db', 'upgrade'])
+    assert 'Applying 0002_indexes' in result.output
+
+    result = runner.invoke(args=['db', 'upgrade'])
+    assert 'up to date' in result.output
@@ -0,0 +1,94 @@
+from datetime import date, timedelta
+
+import pandas as pd
+
+from habit_tracker.patterns import MAX_HABITS, compute_features, format_features
+
+TODAY = date(2024, 3, 31)  # a Sunday
+
+
+def frames(habits, logs):
+    habits = pd.DataFrame(
+        habits, columns=['id', 'name', 'tier', 'stage', 'family_id', 'time_of_day', 'created']
+    )
+    logs = pd.DataFrame(logs, columns=['habit_id', 'log_date', 'status'])
+    return habits, logs
+
+
+def test_no_habits():
+    features = compute_features(*frames([], []), None)
+    assert features == {'habits': []}
+    assert format_features(features) == "No habits yet.\n"
+
+
+def test_rates_weekdays_and_groups():
+    start = TODAY - timedelta(days=27)  # four whole weeks, Monday first
+    habits, logs = frames(
+        [
+            (1, 'Run', 1, 1, 10, 1, start),
+            (2, 'Read', 2, 2, 11, 3, start),
+        ],
+        # Run every weekday, Read never done but skipped once
+        [(1, start + timedelta(days=d), 'completed') for d in range(28) if d % 7 < 5]
+        + [(2, TODAY, 'skipped')],
+    )
+    features = compute_features(habits, logs, TODAY)
+
+    assert features['days_tracked'] == 28
+    assert features['rates']['all'] == round(20 * 100 / 56)
+    assert features['skipped_30d'] == 1
+    assert features['weekdays']['Mon'] == 50
+    assert features['weekdays']['Sun'] == 0
+    assert features['time_of_day'] == {
+        'morning': {'rate': round(20 * 100 / 28), 'habits': 1},
+        'evening': {'rate': 0, 'habits': 1},
+    }
+    assert features['tier'][2] == {'rate': 0, 'habits': 1}
+
+    run, read = features['habits']
+    assert run['done_30d'] == 20 and run['valid_30d'] == 28
+    assert run['rate_7d'] == round(5 * 100 / 7)
+    assert run['trend'] == 0.0
+    assert run['days_since_done'] == 2
+    assert read['rate_30d'] == 0
+    assert read['days_since_done'] is None
+
+
+def test_imported_history_counts_from_first_log():
+    habits, logs = frames(
+        [(1, 'Run', 1, 1, 10, 0, TODAY)],
+        [(1, TODAY - timedelta(days=9), 'completed')],
+    )
+    features = compute_features(habits, logs, TODAY)
+
+    assert features['days_tracked'] == 10
+    assert features['habits'][0]['valid_30d'] == 10
+    assert features['time_of_day'] == {'any time': {'rate': 10, 'habits': 1}}
+
+
+def test_trend_slope():
+    start = TODAY - timedelta(days=12 * 7 - 1)
+    # one more completed day each week
+    done = [(1, start + timedelta(days=w * 7 + d), 'completed') for w in range(7) for d in range(w + 1)]
+    habits, logs = frames([(1, 'Run', 1, 1, 10, 1, start)], done)
+    features = compute_features(habits, logs, TODAY)
+
+    # rises for seven weeks then drops to nothing
+    assert features['trend'] is not None
+    assert features['habits'][0]['trend'] < 0
+
+
+def test_format_features_is_compact():
+    habits, logs = frames(
+        [(i, f'Habit {i}', 1, 1, 10, 1, TODAY - timedelta(days=60)) for i in range(MAX_HABITS + 5)],
+        [(i, TODAY - timedelta(days=d), 'completed') for i in range(MAX_HABITS + 5) for d in range(i)],
+    )
+    text = format_features(compute_features(habits, logs, TODAY))
+
+    lines = text.splitlines()
+    assert lines[0].startswith('Overall completion: 7d ')
+    assert 'By weekday: Mon ' in text
+    # worst habits first, the rest folded into one line
+    assert lines[6].startswith('- Habit 0: 0/30 (0%)')
+    assert lines[-1] == '- ...and 5 more habits doing better'
+    assert len(lines) == 6 + MAX_HABITS + 1
@@ -0,0 +1,119 @@
+from datetime import date, timedelta
+
+from habit_tracker.db import get_db
+from habit_tracker.instrumentation import current_stats
+from habit_tracker.runs import get_range_counts, rebuild_habit_runs, refresh_runs
+
+
+def runs_for(app, habit_id):
+    with app.app_context():
+        cur = get_db().cursor()
+        cur.execute(
+            'SELECT start_date, end_date, status FROM habit_runs'
+            ' WHERE habit_id = %s ORDER BY start_date',
+            (habit_id,)
+        )
+        rows = [(r['start_date'], r['end_date'], r['status']) for r in cur.fetchall()]
+        cur.close()
+    return rows
+
+
+def rebuilt_runs_for(app, habit_id):
+    with app.app_context():
+        db = get_db()
+        rebuild_habit_runs(db.cursor(), [habit_id])
+        db.commit()
+    return runs_for(app, habit_id)
+
+
+def test_runs_merge_and_split(app, client, auth_token):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    habit_id = client.post('/habits', json={"name": "Read", "tier": 1}, headers=headers).get_json()['id']
+    day = date(2025, 3, 5)
+
+    def d(offset):
+        return (day + timedelta(days=offset)).isoformat()
+
+    # fill the middle day last so two runs merge into one
+    for offset in (0, 1, 3, 4, 2):
+        client.post(f'/{habit_id}/complete', data={"date": d(offset)}, headers=headers)
+    assert runs_for(app, habit_id) == [(day, day + timedelta(days=4), 'completed')]
+
+    # undoing the middle splits it again
+    client.post(f'/{habit_id}/undo_complete', data={"date": d(2)}, headers=headers)
+    assert runs_for(app, habit_id) == [
+        (day, day + timedelta(days=1), 'completed'),
+        (day + timedelta(days=3), day + timedelta(days=4), 'completed'),
+    ]
+
+    client.post(f'/habits/{habit_id}/skip', data={"date": d(2), "reason": "tired"}, headers=headers)
+    client.post(f'/habits/{habit_id}/skip', data={"date": d(5), "reason": "tired"}, headers=headers)
+    assert runs_for(app, habit_id) == [
+        (day, day + timedelta(days=1), 'completed'),
+        (day + timedelta(days=2), day + timedelta(days=2), 'skipped'),
+        (day + timedelta(days=3), day + timedelta(days=4), 'completed'),
+        (day + timedelta(days=5), day + timedelta(days=5), 'skipped'),
+    ]
+    assert runs_for(app, habit_id) == rebuilt_runs_for(app, habit_id)
+
+    client.post(f'/{habit_id}/undo_skip', data={"date": d(2)}, headers=headers)
+    client.post(f'/{habit_id}/undo_complete', data={"date": d(0)}, headers=headers)
+    assert runs_for(app, habit_id) == [
+        (day + timedelta(days=1), day + timedelta(days=1), 'completed'),
+        (day + timedelta(days=3), day + timedelta(days=4), 'completed'),
+        (day + timedelta(days=5), day + timedelta(days=5), 'skipped'),
+    ]
+
+    with app.app_context():
+        counts = get_range_counts(get_db().cursor(), [habit_id], day + timedelta(days=4), day + timedelta(days=30))
+    assert counts == {habit_id: {'completed': 1, 'skipped': 1}}
+
+
+def test_bulk_completions_rebuild_runs(app, client, auth_token):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    habit_id = client.post('/habits', json={"name": "Read", "tier": 1}, headers=headers).get_json()['id']
+    start = date(2024, 1, 1)
+    items = [{"habit_id": habit_id, "date": (start + timedelta(days=i)).isoformat()} for i in range(60) if i != 30]
+
+    client.post('/habits/complete-multiple', json={"items": items}, headers=headers)
+
+    assert runs_for(app, habit_id) == [
+        (start, start + timedelta(days=29), 'completed'),
+        (start + timedelta(days=31), start + timedelta(days=59), 'completed'),
+    ]
+
+
+def test_refresh_runs_handles_several_days_per_run(app, client, auth_token):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    habit_id = client.post('/habits', json={"name": "Read", "tier": 1}, headers=headers).get_json()['id']
+    start = date(2024, 1, 1)
+    items = [{"habit_id": habit_id, "date": (start + timedelta(days=i)).isoformat()} for i in range(10)]
+    client.post('/habits/complete-multiple', json={"items": items}, headers=headers)
+    assert runs_for(app, habit_id) == [(start, start + timedelta(days=9), 'completed')]
+
+    # two days cut out of one run and a third skipped, in one batch
+    with app.app_context():
+        db = get_db()
+        cur = db.cursor()
+        changed = [start + timedelta(days=i) for i in (2, 5, 6)]
+        cur.execute(
+            'DELETE FROM habit_logs WHERE habit_id = %s AND log_date = ANY(%s)',
+            (habit_id, changed[:2])
+        )
+        cur.execute(
+            "UPDATE habit_logs SET status = 'skipped' WHERE habit_id = %s AND log_date = %s",
+            (habit_id, changed[2])
+        )
+        statements = current_stats().count
+        refresh_runs(cur, [(habit_id, day) for day in changed])
+        assert current_stats().count - statements == 2
+        db.commit()
+        cur.close()
+
+    assert runs_for(app, habit_id) == [
+        (start, start + timedelta(days=1), 'completed'),
+        (start + timedelta(days=3), start + timedelta(days=4), 'completed'),
+        (start + timedelta(days=6), start + timedelta(days=6), 'skipped'),
+        (start + timedelta(days=7), start + timedelta(days=9), 'completed'),
+    ]
+    assert runs_for(app, habit_id) == rebuilt_runs_for(app, habit_id)
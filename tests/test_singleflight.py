@@ -0,0 +1,57 @@
+import threading
+
+import pytest
+
+from habit_tracker.singleflight import Flight, SingleFlight
+
+
+def test_join_leads_once_per_key():
+    flights = SingleFlight()
+    flight, leader = flights.join('a')
+    assert leader
+    assert flights.join('a') == (flight, False)
+    assert flights.join('b')[1]
+
+    flight.finish('done')
+    flights.leave('a', flight)
+    assert flights.join('a')[1]
+
+
+def test_followers_replay_pieces_and_share_result():
+    flight = Flight()
+    flight.publish('Keep')
+    received = {}
+    started = threading.Barrier(3)
+
+    def follow(name):
+        started.wait()
+        received[name] = list(flight.follow(timeout=5))
+
+    threads = [threading.Thread(target=follow, args=(name,)) for name in ('a', 'b')]
+    for thread in threads:
+        thread.start()
+    started.wait()
+    flight.publish(' it up.')
+    flight.finish({'insights': 'Keep it up.'})
+    for thread in threads:
+        thread.join()
+
+    assert received == {'a': ['Keep', ' it up.'], 'b': ['Keep', ' it up.']}
+    assert flight.wait(timeout=0) == {'insights': 'Keep it up.'}
+
+
+def test_follow_raises_leader_error():
+    flight = Flight()
+    flight.publish('Keep')
+    flight.finish(error=RuntimeError('model down'))
+
+    pieces = []
+    with pytest.raises(RuntimeError, match='model down'):
+        for piece in flight.follow(timeout=1):
+            pieces.append(piece)
+    assert pieces == ['Keep']
+
+
+def test_follow_times_out():
+    with pytest.raises(TimeoutError):
+        Flight().wait(timeout=0.05)
@@ -0,0 +1,60 @@
+import random
+import string
+from datetime import date
+
+from habit_tracker.skip_themes import cluster_reasons, estimate_tokens, format_themes
+
+
+def skips(*reasons, name='Run'):
+    return [
+        {'name': name, 'reason': reason, 'log_date': date(2024, 3, day)}
+        for day, reason in enumerate(reasons, start=1)
+    ]
+
+
+def test_similar_reasons_share_a_theme():
+    themes = cluster_reasons(
+        skips('tired', 'too tired', 'was tired', 'Tired!', 'so tired')
+        + skips('raining', 'it was raining', name='Read')
+        + skips('busy at work')
+    )
+
+    assert [(theme['label'], theme['count']) for theme in themes] == [
+        ('tired', 5), ('raining', 2), ('busy at work', 1),
+    ]
+    tired = themes[0]
+    # "Tired!" normalizes to "tired", so it isn't a separate variant
+    assert tired['variants'] == ['too tired', 'was tired', 'so tired']
+    assert tired['habits'] == [('Run', 5)]
+    assert tired['first'] == date(2024, 3, 1)
+    assert tired['last'] == date(2024, 3, 5)
+
+
+def test_blank_and_punctuation_only_reasons_are_left_out():
+    themes = cluster_reasons(skips('', None, '!!!', 'sick'))
+    assert [(theme['label'], theme['count']) for theme in themes] == [('sick', 1)]
+
+
+def test_format_themes():
+    themes = cluster_reasons(
+        skips('tired', 'too tired') + skips('tired', name='Read') + skips('raining')
+    )
+    text = format_themes(themes, max_tokens=400)
+    assert text == (
+        '- "tired" x3 (Run 2, Read 1), Mar 1-Mar 2; also "too tired"\n'
+        '- "raining" x1 (Run 1), Mar 1\n'
+    )
+    assert format_themes([], max_tokens=400) == "None.\n"
+
+
+def test_format_themes_keeps_to_budget():
+    letters = random.Random(0)
+    reasons = [''.join(letters.choices(string.ascii_lowercase, k=12)) for _ in range(56)]
+    themes = cluster_reasons(skips(*reasons[:28]) + skips(*reasons[28:56], name='Read'))
+    text = format_themes(themes, max_tokens=100)
+
+    assert estimate_tokens(text) <= 100
+    lines = text.splitlines()
+    assert lines[-1].startswith('- ...')
+    shown = len(lines) - 1
+    assert lines[-1] == f"- ...{56 - shown} more skips in {len(themes) - shown} themes"
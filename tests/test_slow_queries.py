@@ -0,0 +1,74 @@
+import pytest
+
+from habit_tracker import create_app
+from habit_tracker.db import close_pool
+from habit_tracker.slow_queries import aggregate, fingerprint, params_shape, read_log
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app({
+        'TESTING': True,
+        'DB_NAME': 'habit_tracker_test',
+        'SLOW_QUERY_MS': 0.001,
+        'SLOW_QUERY_MAX_PER_MINUTE': 1000,
+        'SLOW_QUERY_LOG': str(tmp_path / 'slow.jsonl'),
+    })
+    yield app
+
+    close_pool(app)
+
+
+def test_fingerprint_folds_literals_and_placeholder_lists():
+    assert fingerprint("SELECT * FROM habits WHERE id IN (%s, %s) AND tier = 2") == \
+        fingerprint("SELECT * FROM habits WHERE id IN (%s, %s, %s) AND tier = 3")
+    assert fingerprint("SELECT 1 FROM habits") != fingerprint("SELECT 1 FROM users")
+
+
+def test_params_shape_hides_values():
+    assert params_shape((1, 'secret', [1, 2])) == ['int', 'str', 'list[2]']
+    assert params_shape({'user_id': 4}) == {'user_id': 'int'}
+
+
+def test_aggregate_keeps_slowest_plan():
+    entries = [
+        {'fingerprint': 'a', 'sql': 'SELECT 1', 'params': None, 'ms': 5.0, 'endpoint': 'index', 'plan': ['fast'], 'at': '1'},
+        {'fingerprint': 'a', 'sql': 'SELECT 1', 'params': None, 'ms': 9.0, 'endpoint': 'view', 'plan': ['slow'], 'at': '2'},
+        {'fingerprint': 'b', 'sql': 'SELECT 2', 'params': None, 'ms': 1.0, 'endpoint': None, 'plan': [], 'at': '3'},
+    ]
+    groups = aggregate(entries)
+    assert [g['fingerprint'] for g in groups] == ['a', 'b']
+    assert groups[0]['count'] == 2
+    assert groups[0]['plan'] == ['slow']
+    assert groups[0]['endpoints'] == {'index', 'view'}
+
+
+def test_slow_queries_are_explained(app, client, auth_token):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    client.post('/habits', json={"name": "Read", "tier": 1}, headers=headers)
+    res = client.get('/habits/tiers', headers=headers)
+    assert res.status_code == 200
+
+    entries = list(read_log(app.config['SLOW_QUERY_LOG']))
+    selects = [e for e in entries if e['endpoint'] == 'habits.get_families']
+    assert selects and all(e['plan'] for e in selects)
+    # plain EXPLAIN unless SLOW_QUERY_ANALYZE is on
+    assert not any('actual time' in line for e in selects for line in e['plan'])
+
+    result = app.test_cli_runner().invoke(args=['slow-queries', '--limit', '3'])
+    assert result.exit_code == 0
+    assert 'mean' in result.output
+
+
+def test_slow_reads_are_analyzed_when_enabled(app, client, auth_token):
+    app.config['SLOW_QUERY_ANALYZE'] = True
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    client.post('/habits', json={"name": "Read", "tier": 1}, headers=headers)
+    client.get('/habits/tiers', headers=headers)
+
+    entries = list(read_log(app.config['SLOW_QUERY_LOG']))
+    selects = [e for e in entries if e['endpoint'] == 'habits.get_families']
+    assert any('Buffers' in line or 'actual time' in line for e in selects for line in e['plan'])
+    # writes are planned, not run a second time
+    inserts = [e for e in entries if e['sql'].startswith('INSERT INTO habits')]
+    assert inserts and not any('actual time' in line for e in inserts for line in e['plan'])
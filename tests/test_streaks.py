@@ -0,0 +1,127 @@
+from datetime import timedelta
+
+from conftest import today
+
+
+def create_habit(client, auth_token, name="Exercise"):
+    res = client.post(
+        '/habits',
+        json={"name": name, "tier": 1},
+        headers={"Authorization": f"Bearer {auth_token}"}
+    )
+    return res.get_json()['id']
+
+
+def complete_on(client, auth_token, habit_id, days_ago):
+    date = today() - timedelta(days=days_ago)
+    return client.post(
+        f'/{habit_id}/complete',
+        data={"date": date.isoformat()},
+        headers={"Authorization": f"Bearer {auth_token}"}
+    )
+
+
+def test_open_habit_streak_counts_from_yesterday(client, auth_token):
+    habit_id = create_habit(client, auth_token)
+    for days_ago in (1, 2, 3):
+        complete_on(client, auth_token, habit_id, days_ago)
+
+    res = client.get('/habits/tiers', headers={"Authorization": f"Bearer {auth_token}"})
+    habits = res.get_json()['habits']
+
+    assert len(habits) == 1
+    assert habits[0]['curr_streak'] == 3
+
+
+def test_done_habit_streak_counts_from_today(client, auth_token):
+    habit_id = create_habit(client, auth_token)
+    for days_ago in (0, 1, 3):
+        complete_on(client, auth_token, habit_id, days_ago)
+
+    res = client.get('/habits/tiers', headers={"Authorization": f"Bearer {auth_token}"})
+    habits_done = res.get_json()['habits_done']
+
+    assert len(habits_done) == 1
+    assert habits_done[0]['curr_streak'] == 2
+
+
+def test_streaks_are_per_habit(client, auth_token):
+    first = create_habit(client, auth_token, "Read")
+    second = create_habit(client, auth_token, "Walk")
+    complete_on(client, auth_token, first, 1)
+    for days_ago in (1, 2):
+        complete_on(client, auth_token, second, days_ago)
+
+    res = client.get('/habits/tiers', headers={"Authorization": f"Bearer {auth_token}"})
+    streaks = {h['id']: h['curr_streak'] for h in res.get_json()['habits']}
+
+    assert streaks == {first: 1, second: 2}
+
+
+def test_view_current_and_longest_streak(client, auth_token):
+    habit_id = create_habit(client, auth_token)
+    # a 4 day run, a gap, then a 2 day run ending yesterday
+    for days_ago in (1, 2, 6, 7, 8, 9):
+        complete_on(client, auth_token, habit_id, days_ago)
+
+    res = client.get(f'/{habit_id}', headers={"Authorization": f"Bearer {auth_token}"})
+    data = res.get_json()
+
+    assert data['current_streak'] == 2
+    assert data['longest_streak'] == 4
+
+
+def test_view_streak_with_no_logs(client, auth_token):
+    habit_id = create_habit(client, auth_token)
+
+    res = client.get(f'/{habit_id}', headers={"Authorization": f"Bearer {auth_token}"})
+    data = res.get_json()
+
+    assert data['current_streak'] == 0
+    assert data['longest_streak'] == 0
+
+
+def test_undo_complete_splits_streak(client, auth_token):
+    habit_id = create_habit(client, auth_token)
+    for days_ago in (1, 2, 3, 4):
+        complete_on(client, auth_token, habit_id, days_ago)
+
+    client.post(
+        f'/{habit_id}/undo_complete',
+        data={"date": (today() - timedelta(days=3)).isoformat()},
+        headers={"Authorization": f"Bearer {auth_token}"}
+    )
+
+    res = client.get(f'/{habit_id}', headers={"Authorization": f"Bearer {auth_token}"})
+    data = res.get_json()
+
+    assert data['current_streak'] == 2
+    assert data['longest_streak'] == 2
+
+
+def test_backfilled_day_joins_runs(client, auth_token):
+    habit_id = create_habit(client, auth_token)
+    for days_ago in (1, 2, 4, 5):
+        complete_on(client, auth_token, habit_id, days_ago)
+    complete_on(client, auth_token, habit_id, 3)
+
+    res = client.get(f'/{habit_id}', headers={"Authorization": f"Bearer {auth_token}"})
+    data = res.get_json()
+
+    assert data['current_streak'] == 5
+    assert data['longest_streak'] == 5
+
+
+def test_rebuild_streaks_command(app, client, auth_token):
+    habit_id = create_habit(client, auth_token)
+    for days_ago in (0, 1):
+        complete_on(client, auth_token, habit_id, days_ago)
+
+    result = app.test_cli_runner().invoke(args=['rebuild-streaks'])
+    assert 'Rebuilt streaks' in result.output
+
+    res = client.get(f'/{habit_id}', headers={"Authorization": f"Bearer {auth_token}"})
+    data = res.get_json()
+
+    assert data['current_streak'] == 2
+    assert data['longest_streak'] == 2
@@ -0,0 +1,43 @@
+from datetime import date, timedelta
+
+
+def test_heatmap_encodes_days(client, auth_token):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    habit_id = client.post('/habits', json={"name": "Read", "tier": 1}, headers=headers).get_json()['id']
+    day = date(2025, 3, 5)
+    client.post(f'/{habit_id}/complete', data={"date": day.isoformat()}, headers=headers)
+    client.post(f'/habits/{habit_id}/skip', data={"date": (day + timedelta(days=2)).isoformat(), "reason": "tired"}, headers=headers)
+
+    res = client.get(f'/visuals/heatmap?start={day - timedelta(days=1)}&end={day + timedelta(days=3)}', headers=headers)
+    data = res.get_json()
+    assert res.status_code == 200
+    [habit] = data['habits']
+    # created today, so days without logs before that are "-"
+    assert habit['days'] == '-1-2-'
+    assert habit['completed'] == 1
+    assert habit['skipped'] == 1
+
+
+def test_heatmap_covers_a_year_by_default(client, auth_token):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    client.post('/habits', json={"name": "Read", "tier": 1}, headers=headers)
+
+    data = client.get('/visuals/heatmap', headers=headers).get_json()
+    assert len(data['habits'][0]['days']) == 365
+    assert data['habits'][0]['days'].endswith('0')
+
+
+def test_heatmap_rejects_bad_ranges(client, auth_token):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    assert client.get('/visuals/heatmap?start=2025-02-01&end=2025-01-01', headers=headers).status_code == 400
+    assert client.get('/visuals/heatmap?start=2010-01-01&end=2025-01-01', headers=headers).status_code == 400
+    assert client.get('/visuals/heatmap?start=yesterday', headers=headers).status_code == 400
+
+
+def test_track_is_the_last_week(client, auth_token):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    client.post('/habits', json={"name": "Read", "tier": 1}, headers=headers)
+
+    res = client.get('/visuals/track', headers=headers)
+    assert res.status_code == 200
+    assert len(res.get_json()['habits'][0]['days']) == 7
@@ -0,0 +1,20 @@
+from flask import Flask
+
+from habit_tracker.singleflight import SingleFlight
+from habit_tracker.workers import existing, per_worker
+
+
+def test_per_worker_creates_once_and_replaces_after_fork():
+    app = Flask(__name__)
+    with app.app_context():
+        assert existing('flights') is None
+        flights = per_worker('flights', SingleFlight)
+        assert per_worker('flights', SingleFlight) is flights
+        assert existing('flights') is flights
+
+        # as if inherited from the parent across fork
+        flights.pid = -1
+        assert existing('flights') is None
+        replacement = per_worker('flights', SingleFlight)
+        assert replacement is not flights
+        assert app.extensions['flights'] is replacement